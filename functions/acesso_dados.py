@@ -0,0 +1,167 @@
+import math
+from contextlib import contextmanager
+
+import psycopg as psy
+from psycopg.pq import TransactionStatus
+
+from conectar import prepare_configurado
+from rastreamento import rastreado
+
+# Camada de acesso para os caminhos de escrita frequentes da interface:
+# comandos dependentes enviados juntos em pipeline (uma ida e volta na rede)
+# e preparados no servidor desde a primeira execucao.
+
+COLUNAS_CRITERIO = (
+   "pressao_operacao",
+   "perda_carga_maxima",
+   "perda_carga_minima",
+   "vel_maxima",
+   "vel_minima",
+   "vel_max_recomendada",
+   "vel_min_recomendada",
+   "densidade_relativa",
+   "temperatura_projeto",
+   "observacao",
+)
+
+CRITERIOS_PADRAO = {
+   "pressao_operacao": 150.0,
+   "perda_carga_maxima": 45.0,
+   "perda_carga_minima": 0.0,
+   "vel_maxima": 20.0,
+   "vel_minima": 0.0,
+   "vel_max_recomendada": 15.0,
+   "vel_min_recomendada": 5.0,
+   "densidade_relativa": 1.8,
+   "temperatura_projeto": 15.0,
+   "observacao": "",
+}
+
+SQL_INSERIR_PROJETO = "INSERT INTO projeto (nome, descricao) VALUES (%(nome)s, %(descricao)s)"
+
+SQL_UPDATED_AT = "SELECT updated_at FROM projeto WHERE id = %(projeto_id)s"
+
+SQL_ATUALIZAR_PROJETO = "UPDATE projeto SET nome = %(nome)s, descricao = %(descricao)s WHERE id = %(projeto_id)s"
+
+def _sql_upsert_criterios(projeto_id):
+   return f"""
+      INSERT INTO criterio_projeto (projeto_id, {", ".join(COLUNAS_CRITERIO)})
+      VALUES ({projeto_id}, {", ".join(f"%({c})s" for c in COLUNAS_CRITERIO)})
+      ON CONFLICT (projeto_id) DO UPDATE SET
+         {", ".join(f"{c} = EXCLUDED.{c}" for c in COLUNAS_CRITERIO)}"""
+
+SQL_UPSERT_CRITERIOS = _sql_upsert_criterios("%(projeto_id)s")
+
+# Na criacao o id ainda nao voltou para o cliente: o segundo comando usa o
+# valor corrente da sequencia, na mesma sessao, para nao esperar o RETURNING
+SQL_INSERIR_CRITERIOS_NOVO = _sql_upsert_criterios("currval(pg_get_serial_sequence('projeto', 'id'))") + """
+      RETURNING projeto_id"""
+
+def conectar(conn_info, **kwargs):
+   # autocommit: BEGIN/COMMIT vao dentro do pipeline, sem a ida e volta extra
+   # que o psycopg faz para abrir a transacao implicita.
+   # prepare_threshold=0 (padrao de DB_PREPARE_THRESHOLD): todo comando e preparado
+   # no servidor na primeira execucao.
+   kwargs.setdefault("prepare_threshold", prepare_configurado())
+   return psy.connect(conn_info, autocommit=True, **kwargs)
+
+@contextmanager
+def transacao_pipeline(conn):
+   # BEGIN ... COMMIT em um unico pipeline; conn deve estar em autocommit (conectar)
+   try:
+      with conn.pipeline():
+         conn.execute("BEGIN")
+         yield
+         conn.execute("COMMIT")
+   except Exception:
+      if conn.info.transaction_status != TransactionStatus.IDLE:
+         conn.execute("ROLLBACK")
+      raise
+
+def _parametros_criterios(criterios):
+   return {c: criterios.get(c, CRITERIOS_PADRAO[c]) for c in COLUNAS_CRITERIO}
+
+@rastreado("banco")
+def criar_projeto(conn, nome, descricao, criterios):
+   # INSERT projeto + INSERT criterio_projeto + COMMIT em uma ida e volta
+   with conn.cursor() as cur:
+      with transacao_pipeline(conn):
+         cur.execute(SQL_INSERIR_PROJETO, {"nome": nome, "descricao": descricao}, prepare=True)
+         cur.execute(SQL_INSERIR_CRITERIOS_NOVO, _parametros_criterios(criterios), prepare=True)
+      return cur.fetchone()[0]
+
+@rastreado("banco")
+def salvar_projeto(conn, projeto_id, nome, descricao, criterios):
+   # UPDATE projeto + upsert de criterio_projeto + COMMIT em uma ida e volta
+   parametros = _parametros_criterios(criterios)
+   parametros["projeto_id"] = projeto_id
+   with conn.cursor() as cur:
+      with transacao_pipeline(conn):
+         cur.execute(
+            SQL_ATUALIZAR_PROJETO,
+            {"nome": nome, "descricao": descricao, "projeto_id": projeto_id},
+            prepare=True,
+         )
+         cur.execute(SQL_UPSERT_CRITERIOS, parametros, prepare=True)
+
+# Salvamento parcial: apenas as colunas alteradas desde a ultima leitura
+
+COLUNAS_PROJETO = ("nome", "descricao")
+
+def campos_alterados(original, atual):
+   # REAL no banco tem ~7 digitos: compara numeros com tolerancia relativa
+   alterados = {}
+   for chave, valor in atual.items():
+      antigo = original.get(chave)
+      if isinstance(valor, (int, float)) and isinstance(antigo, (int, float)):
+         if math.isclose(valor, antigo, rel_tol=1e-6, abs_tol=1e-9):
+            continue
+      elif valor == antigo:
+         continue
+      alterados[chave] = valor
+   return alterados
+
+def _sql_update(tabela, colunas, chave):
+   return f"""
+      UPDATE {tabela} SET {", ".join(f"{c} = %({c})s" for c in colunas)}
+      WHERE {chave} = %(projeto_id)s"""
+
+def _validar_colunas(projeto, criterios):
+   invalidas = (set(projeto) - set(COLUNAS_PROJETO)) | (set(criterios) - set(COLUNAS_CRITERIO))
+   if invalidas:
+      raise ValueError(f"Colunas desconhecidas: {', '.join(sorted(invalidas))}")
+
+def executar_alteracoes(cur, projeto_id, projeto, criterios, criterios_existem=True):
+   # Comandos de salvar_alteracoes sem abrir transacao: para quem ja esta em uma
+   # (fila do espelho local, que confere o updated_at antes de gravar)
+   _validar_colunas(projeto, criterios)
+   if projeto:
+      colunas = sorted(projeto)
+      cur.execute(_sql_update("projeto", colunas, "id"), {**projeto, "projeto_id": projeto_id}, prepare=True)
+   if not criterios_existem:
+      parametros = _parametros_criterios(criterios)
+      parametros["projeto_id"] = projeto_id
+      cur.execute(SQL_UPSERT_CRITERIOS, parametros, prepare=True)
+   elif criterios:
+      colunas = sorted(criterios)
+      cur.execute(
+         _sql_update("criterio_projeto", colunas, "projeto_id"),
+         {**criterios, "projeto_id": projeto_id},
+         prepare=True,
+      )
+
+@rastreado("banco")
+def salvar_alteracoes(conn, projeto_id, projeto, criterios, criterios_existem=True):
+   # projeto/criterios: apenas as colunas alteradas. Sem linha em criterio_projeto,
+   # os criterios (completados pelo padrao) vao no upsert completo.
+   # Retorna o updated_at do projeto apos a gravacao; False sem alteracoes.
+   _validar_colunas(projeto, criterios)
+   if not projeto and not criterios and criterios_existem:
+      return False
+   with conn.cursor() as cur:
+      with transacao_pipeline(conn):
+         executar_alteracoes(cur, projeto_id, projeto, criterios, criterios_existem)
+         # updated_at gravado, no mesmo pipeline: o espelho local o usa como base da proxima edicao
+         cur.execute(SQL_UPDATED_AT, {"projeto_id": projeto_id}, prepare=True)
+      row = cur.fetchone()
+   return row[0] if row else None
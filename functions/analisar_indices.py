@@ -0,0 +1,378 @@
+import difflib
+import re
+
+# Leitura estatica dos scripts SQL
+
+def carregar_esquema(caminho_sql):
+   # tabela -> {"colunas": [...], "unicos": [(nome, colunas)], "fks": [(nome, colunas)]}
+   try:
+      with open(caminho_sql, "r", encoding="utf-8") as f:
+         sql = f.read()
+   except Exception as e:
+      print(f"Erro ao ler o arquivo SQL: {e}")
+      return {}
+
+   esquema = {}
+   padrao_tabela = re.compile(
+      r'CREATE\s+TABLE\s+IF\s+NOT\s+EXISTS\s+"?(\w+)"?\s*\((.*?)\n\)\s*(?:PARTITION\s+BY[^;]*)?;',
+      re.IGNORECASE | re.DOTALL
+   )
+   for tabela, corpo in padrao_tabela.findall(sql):
+      corpo = re.sub(r'--[^\n]*', '', corpo)
+      colunas, unicos, fks = [], [], []
+      for linha in re.split(r',\s*\n', corpo):
+         linha = " ".join(linha.split())
+         if not linha:
+            continue
+         unico = re.search(r'(?:CONSTRAINT\s+(\w+)\s+)?(?:UNIQUE|PRIMARY\s+KEY)\s*\(([^)]*)\)', linha, re.IGNORECASE)
+         fk = re.search(r'CONSTRAINT\s+(\w+)\s+FOREIGN\s+KEY\s*\(([^)]*)\)', linha, re.IGNORECASE)
+         if fk:
+            fks.append((fk.group(1), tuple(c.strip() for c in fk.group(2).split(','))))
+         elif unico and linha.upper().startswith(("CONSTRAINT", "UNIQUE", "PRIMARY")):
+            nome = unico.group(1) or f"{tabela}_pkey"
+            unicos.append((nome, tuple(c.strip() for c in unico.group(2).split(','))))
+         else:
+            coluna = linha.split()[0].strip('"')
+            colunas.append(coluna)
+            if re.search(r'\bPRIMARY\s+KEY\b', linha, re.IGNORECASE):
+               unicos.append((f"{tabela}_pkey", (coluna,)))
+      esquema[tabela] = {"colunas": colunas, "unicos": unicos, "fks": fks}
+   return esquema
+
+def carregar_indices(caminho_sql):
+   try:
+      with open(caminho_sql, "r", encoding="utf-8") as f:
+         sql = f.read()
+   except Exception as e:
+      print(f"Erro ao ler o arquivo SQL: {e}")
+      return []
+
+   padrao = re.compile(
+      r'CREATE\s+(UNIQUE\s+)?INDEX\s+IF\s+NOT\s+EXISTS\s+"?(\w+)"?\s+ON\s+"?(\w+)"?\s*'
+      r'\(([^)]*)\)(?:\s*INCLUDE\s*\(([^)]*)\))?(?:\s*WHERE\s+([^;]*))?;',
+      re.IGNORECASE
+   )
+   indices = []
+   for unico, nome, tabela, colunas, incluidas, predicado in padrao.findall(sql):
+      indices.append({
+         "nome": nome,
+         "tabela": tabela,
+         "colunas": tuple(c.split()[0] for c in colunas.split(',')),
+         "incluidas": tuple(c.strip() for c in incluidas.split(',')) if incluidas else (),
+         "unico": bool(unico),
+         "primario": False,
+         "predicado": predicado.strip() or None,
+         "restricao": False,
+         "scans": None,
+         "tamanho": None,
+      })
+   return indices
+
+def indices_de_restricoes(esquema):
+   indices = []
+   for tabela, info in esquema.items():
+      for nome, colunas in info["unicos"]:
+         indices.append({
+            "nome": nome,
+            "tabela": tabela,
+            "colunas": colunas,
+            "incluidas": (),
+            "unico": True,
+            "primario": nome.endswith("_pkey"),
+            "predicado": None,
+            "restricao": True,
+            "scans": None,
+            "tamanho": None,
+         })
+   return indices
+
+def fks_do_esquema(esquema):
+   return [(tabela, nome, colunas) for tabela, info in esquema.items() for nome, colunas in info["fks"]]
+
+# Leitura do catalogo e das estatisticas do PostgreSQL
+
+def carregar_indices_banco(conn, schema="public"):
+   with conn.cursor() as cur:
+      cur.execute("""
+         SELECT
+            s.relname,
+            s.indexrelname,
+            ARRAY(
+               SELECT a.attname::text
+               FROM unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+               JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+               WHERE k.ord <= i.indnkeyatts
+               ORDER BY k.ord
+            ),
+            ARRAY(
+               SELECT a.attname::text
+               FROM unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+               JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+               WHERE k.ord > i.indnkeyatts
+               ORDER BY k.ord
+            ),
+            i.indisunique,
+            i.indisprimary,
+            pg_get_expr(i.indpred, i.indrelid),
+            i.indexprs IS NOT NULL,
+            EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid),
+            s.idx_scan,
+            pg_relation_size(s.indexrelid)
+         FROM pg_stat_user_indexes s
+         JOIN pg_index i ON i.indexrelid = s.indexrelid
+         WHERE s.schemaname = %s;""", (schema,))
+      indices = []
+      for (tabela, nome, colunas, incluidas, unico, primario, predicado,
+           expressao, restricao, scans, tamanho) in cur.fetchall():
+         if expressao:
+            # Indices de expressao nao sao comparaveis por colunas
+            continue
+         indices.append({
+            "nome": nome,
+            "tabela": tabela,
+            "colunas": tuple(colunas),
+            "incluidas": tuple(incluidas),
+            "unico": unico,
+            "primario": primario,
+            "predicado": predicado,
+            "restricao": restricao,
+            "scans": scans,
+            "tamanho": tamanho,
+         })
+      return indices
+
+def carregar_fks_banco(conn, schema="public"):
+   with conn.cursor() as cur:
+      cur.execute("""
+         SELECT
+            t.relname,
+            c.conname,
+            ARRAY(
+               SELECT a.attname::text
+               FROM unnest(c.conkey) WITH ORDINALITY AS k(attnum, ord)
+               JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+               ORDER BY k.ord
+            )
+         FROM pg_constraint c
+         JOIN pg_class t ON t.oid = c.conrelid
+         JOIN pg_namespace n ON n.oid = t.relnamespace
+         WHERE c.contype = 'f' AND n.nspname = %s;""", (schema,))
+      return [(tabela, nome, tuple(colunas)) for tabela, nome, colunas in cur.fetchall()]
+
+def carregar_escritas_banco(conn, tabelas):
+   # Chamadas de INSERT/UPDATE/DELETE por tabela segundo pg_stat_statements.
+   # A view fica no schema da extensao, fora do search_path do escritorio.
+   from psycopg import sql
+
+   escritas = {tabela: 0 for tabela in tabelas}
+   with conn.cursor() as cur:
+      cur.execute("""
+         SELECT n.nspname
+         FROM pg_extension e
+         JOIN pg_namespace n ON n.oid = e.extnamespace
+         WHERE e.extname = 'pg_stat_statements';""")
+      row = cur.fetchone()
+      if row is None:
+         return None
+      try:
+         cur.execute(sql.SQL("""
+            SELECT query, calls
+            FROM {}.pg_stat_statements
+            WHERE query ~* '^\\s*(INSERT|UPDATE|DELETE)';""").format(sql.Identifier(row[0])))
+         linhas = cur.fetchall()
+      except Exception as e:
+         print(f"Erro ao ler pg_stat_statements: {e}")
+         conn.rollback()
+         return None
+   padrao = re.compile(r'^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+(?:\w+\.)?"?(\w+)"?', re.IGNORECASE)
+   for query, calls in linhas:
+      alvo = padrao.match(query)
+      if alvo and alvo.group(1) in escritas:
+         escritas[alvo.group(1)] += calls
+   return escritas
+
+# Classificacao
+
+def _cobre(indice, colunas):
+   return indice["predicado"] is None and indice["colunas"][:len(colunas)] == tuple(colunas)
+
+def classificar_indices(indices, fks, esquema=None, escritas=None):
+   achados = []
+   remover = set()
+
+   def registrar(indice, motivo, detalhe):
+      # Indices de restricao sao apontados, mas nao entram na proposta de DROP
+      if not indice["restricao"]:
+         remover.add(indice["nome"])
+      achados.append({
+         "tipo": motivo,
+         "indice": indice["nome"],
+         "tabela": indice["tabela"],
+         "detalhe": detalhe,
+         "escritas": (escritas or {}).get(indice["tabela"]),
+      })
+
+   # Indices sobre tabelas ou colunas que nao existem (apenas na analise estatica)
+   if esquema is not None:
+      for indice in indices:
+         tabela = esquema.get(indice["tabela"])
+         if tabela is None:
+            registrar(indice, "inexistente", f"tabela {indice['tabela']} nao existe")
+            continue
+         faltantes = [c for c in indice["colunas"] + indice["incluidas"] if c not in tabela["colunas"]]
+         if faltantes:
+            registrar(indice, "inexistente", f"colunas ausentes: {', '.join(faltantes)}")
+
+   validos = [i for i in indices if i["nome"] not in remover]
+
+   # Restricoes e indices unicos vem primeiro para serem mantidos. Um indice
+   # unico so e duplicado de outro unico; uma restricao, so de uma anterior
+   ordem = sorted(validos, key=lambda i: (not i["primario"], not i["restricao"], not i["unico"], i["nome"]))
+   for pos, indice in enumerate(ordem):
+      if indice["primario"] or indice["nome"] in remover:
+         continue
+      for outro in ordem:
+         if outro is indice or outro["nome"] in remover or outro["tabela"] != indice["tabela"]:
+            continue
+         if outro["predicado"] != indice["predicado"]:
+            continue
+         if indice["unico"] and not outro["unico"]:
+            continue
+         if outro["colunas"] == indice["colunas"] and set(indice["incluidas"]) <= set(outro["colunas"] + outro["incluidas"]):
+            anterior = ordem.index(outro) < pos
+            if anterior or (outro["incluidas"] != indice["incluidas"] and not indice["restricao"]):
+               registrar(indice, "duplicado", f"mesmas colunas de {outro['nome']}")
+               break
+         elif (len(outro["colunas"]) > len(indice["colunas"])
+               and outro["colunas"][:len(indice["colunas"])] == indice["colunas"]
+               and not indice["incluidas"] and not indice["unico"]):
+            registrar(indice, "prefixo", f"prefixo de {outro['nome']} {outro['colunas']}")
+            break
+
+   validos = [i for i in indices if i["nome"] not in remover]
+
+   # FKs sem indice de apoio (deletes e updates em cascata fazem seq scan)
+   faltando = []
+   for tabela, nome, colunas in fks:
+      if not any(i["tabela"] == tabela and _cobre(i, colunas) for i in validos):
+         faltando.append((tabela, nome, tuple(colunas)))
+         achados.append({
+            "tipo": "fk_sem_indice",
+            "indice": None,
+            "tabela": tabela,
+            "detalhe": f"{nome} ({', '.join(colunas)})",
+            "escritas": (escritas or {}).get(tabela),
+         })
+
+   # Sem uso: so remove se nao for o unico apoio de uma FK
+   for indice in validos:
+      if indice["scans"] != 0 or indice["unico"] or indice["restricao"]:
+         continue
+      apoio = [
+         (tabela, colunas) for tabela, _, colunas in fks
+         if tabela == indice["tabela"] and _cobre(indice, colunas)
+         and not any(o is not indice and o["tabela"] == tabela and _cobre(o, colunas) for o in validos)
+      ]
+      if apoio:
+         continue
+      registrar(indice, "sem_uso", f"idx_scan = 0, {indice['tamanho'] or 0} bytes")
+
+   return achados, remover, faltando
+
+# Proposta de novo indices.sql
+
+def nome_indice_fk(tabela, colunas):
+   return f"idx_{tabela}_{'_'.join(colunas)}"
+
+def propor_indices_sql(caminho_sql, remover, faltando):
+   with open(caminho_sql, "r", encoding="utf-8") as f:
+      original = f.read()
+
+   blocos = re.split(r'\n\s*\n', original.strip())
+   mantidos = []
+   comentario = ""
+   for bloco in blocos:
+      nome = re.search(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+IF\s+NOT\s+EXISTS\s+"?(\w+)"?', bloco, re.IGNORECASE)
+      if nome and nome.group(1) in remover:
+         # Comentarios antes do CREATE removido passam para o proximo bloco
+         linhas = [l for l in bloco.splitlines() if l.strip().startswith("--")]
+         comentario += "".join(f"{l}\n" for l in linhas)
+         continue
+      mantidos.append(comentario + bloco)
+      comentario = ""
+
+   for tabela, _, colunas in faltando:
+      mantidos.append(
+         f"CREATE INDEX IF NOT EXISTS {nome_indice_fk(tabela, colunas)}\n"
+         f"ON {tabela} ({', '.join(colunas)});"
+      )
+
+   proposto = "\n\n".join(mantidos)
+   if original.endswith("\n"):
+      proposto += "\n"
+   return original, proposto
+
+def diff_indices_sql(caminho_sql, original, proposto):
+   return "".join(difflib.unified_diff(
+      original.splitlines(keepends=True),
+      proposto.splitlines(keepends=True),
+      fromfile=caminho_sql,
+      tofile=f"{caminho_sql} (proposto)"
+   ))
+
+def analisar(caminho_tabelas, caminho_indices, conn_info=None, schema="public"):
+   esquema = carregar_esquema(caminho_tabelas)
+   do_arquivo = carregar_indices(caminho_indices)
+   nomes_arquivo = {i["nome"] for i in do_arquivo}
+
+   if conn_info:
+      import psycopg as psy
+      with psy.connect(conn_info) as conn:
+         indices = carregar_indices_banco(conn, schema)
+         fks = carregar_fks_banco(conn, schema)
+         escritas = carregar_escritas_banco(conn, {i["tabela"] for i in indices})
+      # Indices do arquivo que nao existem no banco sao avaliados estaticamente
+      no_banco = {i["nome"] for i in indices}
+      ausentes = [i for i in do_arquivo if i["nome"] not in no_banco]
+      achados, remover, faltando = classificar_indices(indices, fks, escritas=escritas)
+      achados_ausentes, remover_ausentes, _ = classificar_indices(
+         indices_de_restricoes(esquema) + ausentes, fks_do_esquema(esquema), esquema
+      )
+      achados += [a for a in achados_ausentes if a["indice"] in remover_ausentes & nomes_arquivo]
+      remover |= remover_ausentes & nomes_arquivo
+   else:
+      indices = indices_de_restricoes(esquema) + do_arquivo
+      achados, remover, faltando = classificar_indices(indices, fks_do_esquema(esquema), esquema)
+
+   original, proposto = propor_indices_sql(caminho_indices, remover & nomes_arquivo, faltando)
+   return achados, remover, original, proposto
+
+if __name__ == "__main__":
+   import sys
+   from psycopg import sql
+   from conectar import conectar_db, schema_configurado
+
+   tabelas_sql = r"sql\tabelas.sql"
+   indices_sql = r"sql\indices.sql"
+
+   conn_info = None
+   if "--estatico" not in sys.argv:
+      try:
+         conn_info = conectar_db()[0]
+      except Exception as e:
+         print(f"Sem conexao, usando analise estatica: {e}")
+
+   schema = schema_configurado() or "public"
+   achados, remover, original, proposto = analisar(tabelas_sql, indices_sql, conn_info, schema)
+   for achado in achados:
+      escritas = f" | escritas: {achado['escritas']}" if achado["escritas"] is not None else ""
+      print(f"[{achado['tipo']}] {achado['tabela']}.{achado['indice'] or '-'}: {achado['detalhe']}{escritas}")
+
+   for nome in sorted(remover):
+      print(sql.SQL("DROP INDEX IF EXISTS {};").format(sql.Identifier(schema, nome)).as_string(None))
+
+   print(diff_indices_sql(indices_sql, original, proposto))
+   if "--aplicar" in sys.argv:
+      with open(indices_sql, "w", encoding="utf-8") as f:
+         f.write(proposto)
+      print(f"{indices_sql} atualizado.")
@@ -0,0 +1,134 @@
+import numpy as np
+
+from calculos import PCI_GLP_KG, fator_simultaneidade, potencia_adotada
+from cenarios import capacidade_cilindro
+from unidades import potencia_computada
+
+# Simulacao da central ao longo do tempo: perfil de consumo, limite de
+# vaporizacao e massa armazenada, integrados com operacoes sobre o eixo inteiro.
+
+# Fracao da potencia adotada em cada hora do dia (perfil residencial)
+PERFIL_DIARIO_PADRAO = (
+   0.05, 0.05, 0.05, 0.05, 0.05, 0.15,
+   0.50, 0.80, 0.50, 0.30, 0.40, 0.80,
+   1.00, 0.60, 0.30, 0.25, 0.30, 0.50,
+   0.90, 1.00, 0.70, 0.40, 0.20, 0.10,
+)
+
+MINUTOS_DIA = 1440
+
+def perfil_consumo(pot_adotada, dias=7, passo_min=60, perfil=PERFIL_DIARIO_PADRAO, pci_kg=PCI_GLP_KG):
+   # Demanda em kg/h a cada passo; pot_adotada em kcal/min.
+   # O perfil pode ter qualquer numero de intervalos iguais por dia.
+   perfil = np.asarray(perfil, dtype=np.float64)
+   minutos = np.arange(0, dias * MINUTOS_DIA, passo_min)
+   indice = (minutos % MINUTOS_DIA) * len(perfil) // MINUTOS_DIA
+   return perfil[indice] * pot_adotada * 60 / pci_kg
+
+def simular_autonomia(demanda, passo_min, massa_kg, vaporizacao_kgh):
+   # demanda em kg/h por passo; massa e vaporizacao da bateria em uso.
+   # Autonomia em horas: 0 sem cilindros, None sem consumo (nao esgota)
+   dt = passo_min / 60
+   entregue = np.minimum(demanda, vaporizacao_kgh)
+   deficit = demanda - entregue
+   consumido = np.cumsum(entregue) * dt
+
+   extrapolada = False
+   if massa_kg <= 0:
+      autonomia = 0.0
+   elif not np.any(entregue > 0):
+      autonomia = None
+   else:
+      esgota = int(np.searchsorted(consumido, massa_kg))
+      if esgota < len(consumido):
+         autonomia = (esgota + 1) * dt
+      else:
+         # Nao esgota no horizonte: extrapola pelo consumo medio
+         autonomia = massa_kg / entregue.mean()
+         extrapolada = True
+
+   return {
+      "autonomia_horas": autonomia,
+      "autonomia_extrapolada": extrapolada,
+      "consumo_medio": float(entregue.mean()) if len(entregue) else 0.0,
+      "demanda_pico": float(demanda.max()) if len(demanda) else 0.0,
+      "deficit_pico": float(deficit.max()) if len(deficit) else 0.0,
+      "horas_com_deficit": float(np.count_nonzero(deficit > 0) * dt),
+      "massa_nao_atendida": float(deficit.sum() * dt),
+      "massa_restante": np.maximum(massa_kg - consumido, 0),
+   }
+
+def texto_autonomia(resultado):
+   horas = resultado["autonomia_horas"]
+   if horas is None:
+      return "sem consumo"
+   sufixo = " (extrapolada)" if resultado["autonomia_extrapolada"] else ""
+   return f"{horas / 24:.1f} dias{sufixo}"
+
+# Banco
+
+def carregar_central(conn, projeto_id):
+   # [(tipo, capacidade kg, taxa kg/h, quantidade em uso)]
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         SELECT c.tipo, c.taxa_vaporizacao, cp.quantidade_cilindros
+         FROM cilindro_projeto cp
+         JOIN cilindro c ON c.id = cp.cilindro_id
+         WHERE cp.projeto_id = %s
+         ORDER BY c.id
+         """,
+         (projeto_id,),
+      )
+      return [
+         (tipo, capacidade_cilindro(tipo), float(taxa), int(qtde))
+         for tipo, taxa, qtde in cur.fetchall()
+      ]
+
+def autonomia_central(cilindros, computada, dias=7, passo_min=60, perfil=PERFIL_DIARIO_PADRAO):
+   # cilindros como em carregar_central; computada em kcal/min.
+   # A bateria em uso e a de reserva tem a mesma quantidade de cilindros
+   adotada = potencia_adotada(computada, fator_simultaneidade(computada))
+   massa = sum(capacidade * qtde for _, capacidade, _, qtde in cilindros)
+   vaporizacao = sum(taxa * qtde for _, _, taxa, qtde in cilindros)
+
+   demanda = perfil_consumo(adotada, dias, passo_min, perfil)
+   resultado = simular_autonomia(demanda, passo_min, massa, vaporizacao)
+   resultado.update({
+      "cilindros": cilindros,
+      "capacidade_total": 2 * massa,
+      "vaporizacao": vaporizacao,
+   })
+   return resultado
+
+def autonomia_projeto(conn, projeto_id, dias=7, passo_min=60, perfil=PERFIL_DIARIO_PADRAO):
+   cilindros = carregar_central(conn, projeto_id)
+   computada = potencia_computada(conn, projeto_id)
+   return autonomia_central(cilindros, computada, dias, passo_min, perfil)
+
+if __name__ == "__main__":
+   import sys
+   import psycopg as psy
+   from conectar import conectar_db
+
+   # python functions\autonomia.py <projeto_id> [dias] [passo_min]
+   if len(sys.argv) < 2:
+      print("Uso: autonomia.py <projeto_id> [dias] [passo_min]")
+      sys.exit(1)
+
+   dias = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+   passo = int(sys.argv[3]) if len(sys.argv) > 3 else 60
+   conexao = conectar_db()
+   try:
+      with psy.connect(conexao[0]) as conn:
+         r = autonomia_projeto(conn, int(sys.argv[1]), dias, passo)
+      for tipo, capacidade, taxa, qtde in r["cilindros"]:
+         print(f'{qtde} x {tipo} ({capacidade:.0f} kg, {taxa:.2f} kg/h) em uso + {qtde} reserva')
+      print(f'Capacidade total: {r["capacidade_total"]:.0f} kg')
+      print(f'Autonomia da bateria em uso: {texto_autonomia(r)}')
+      print(f'Demanda de pico: {r["demanda_pico"]:.2f} kg/h, vaporizacao: {r["vaporizacao"]:.2f} kg/h')
+      print(f'Deficit de pico: {r["deficit_pico"]:.2f} kg/h em {r["horas_com_deficit"]:.1f} h')
+   except Exception as e:
+      print(f"Erro na simulacao de autonomia: {e}")
+      import traceback
+      traceback.print_exc()
@@ -0,0 +1,192 @@
+import asyncio
+import statistics
+import threading
+import time
+import uuid
+
+import psycopg as psy
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+
+from acesso_dados import (
+   COLUNAS_CRITERIO,
+   CRITERIOS_PADRAO,
+   SQL_ATUALIZAR_PROJETO,
+   SQL_UPSERT_CRITERIOS,
+   conectar,
+   criar_projeto,
+   salvar_projeto,
+)
+
+# Mede salvar/criar projeto com e sem pipeline atraves de um proxy TCP local
+# que atrasa cada pacote em rtt/2 em cada sentido.
+
+class ProxyLatencia:
+   def __init__(self, host, porta, rtt_ms):
+      self.host = host
+      self.porta = porta
+      self.atraso = rtt_ms / 2000
+      self.porta_local = None
+      self._loop = asyncio.new_event_loop()
+      self._pronto = threading.Event()
+      self._thread = threading.Thread(target=self._rodar, daemon=True)
+
+   def __enter__(self):
+      self._thread.start()
+      self._pronto.wait()
+      return self
+
+   def __exit__(self, *exc):
+      self._loop.call_soon_threadsafe(self._loop.stop)
+      self._thread.join()
+
+   def _rodar(self):
+      asyncio.set_event_loop(self._loop)
+      servidor = self._loop.run_until_complete(asyncio.start_server(self._cliente, "127.0.0.1", 0))
+      self.porta_local = servidor.sockets[0].getsockname()[1]
+      self._pronto.set()
+      self._loop.run_forever()
+      servidor.close()
+      pendentes = asyncio.all_tasks(self._loop)
+      for tarefa in pendentes:
+         tarefa.cancel()
+      self._loop.run_until_complete(asyncio.gather(*pendentes, return_exceptions=True))
+      self._loop.close()
+
+   async def _abrir_destino(self):
+      if self.host.startswith("/"):
+         return await asyncio.open_unix_connection(f"{self.host}/.s.PGSQL.{self.porta}")
+      return await asyncio.open_connection(self.host, self.porta)
+
+   async def _cliente(self, leitor, escritor):
+      destino_leitor, destino_escritor = await self._abrir_destino()
+      try:
+         await asyncio.gather(
+            self._encaminhar(leitor, destino_escritor),
+            self._encaminhar(destino_leitor, escritor),
+         )
+      except asyncio.CancelledError:
+         # Proxy encerrado com a conexao ainda aberta
+         escritor.close()
+         destino_escritor.close()
+
+   async def _encaminhar(self, leitor, escritor):
+      # Fila com horario de entrega: atrasa sem serializar os pacotes
+      fila = asyncio.Queue()
+
+      async def entregar():
+         while True:
+            entrega, dados = await fila.get()
+            espera = entrega - self._loop.time()
+            if espera > 0:
+               await asyncio.sleep(espera)
+            if dados is None:
+               escritor.close()
+               return
+            escritor.write(dados)
+            await escritor.drain()
+
+      tarefa = asyncio.ensure_future(entregar())
+      while True:
+         try:
+            dados = await leitor.read(65536)
+         except ConnectionError:
+            dados = b""
+         await fila.put((self._loop.time() + self.atraso, dados or None))
+         if not dados:
+            break
+      await tarefa
+
+def conn_info_proxy(conn_info, porta_local):
+   parametros = conninfo_to_dict(conn_info)
+   parametros.update(host="127.0.0.1", port=porta_local)
+   return make_conninfo(**parametros)
+
+def _destino(conn_info):
+   parametros = conninfo_to_dict(conn_info)
+   return parametros.get("host") or "localhost", int(parametros.get("port") or 5432)
+
+# Versoes sem pipeline (uma ida e volta por comando, mais BEGIN e COMMIT), como na interface antes
+
+def salvar_sequencial(conn, projeto_id, nome, descricao, criterios):
+   parametros = {c: criterios.get(c, CRITERIOS_PADRAO[c]) for c in COLUNAS_CRITERIO}
+   parametros["projeto_id"] = projeto_id
+   with conn.cursor() as cur:
+      cur.execute(SQL_ATUALIZAR_PROJETO, {"nome": nome, "descricao": descricao, "projeto_id": projeto_id})
+      cur.execute(SQL_UPSERT_CRITERIOS, parametros)
+
+def criar_sequencial(conn, nome, descricao, criterios):
+   parametros = {c: criterios.get(c, CRITERIOS_PADRAO[c]) for c in COLUNAS_CRITERIO}
+   with conn.cursor() as cur:
+      cur.execute("INSERT INTO projeto (nome, descricao) VALUES (%s, %s) RETURNING id", (nome, descricao))
+      parametros["projeto_id"] = cur.fetchone()[0]
+      cur.execute(SQL_UPSERT_CRITERIOS, parametros)
+   return parametros["projeto_id"]
+
+def _medir(funcao, repeticoes):
+   tempos = []
+   for _ in range(repeticoes):
+      inicio = time.perf_counter()
+      funcao()
+      tempos.append((time.perf_counter() - inicio) * 1000)
+   tempos.sort()
+   return statistics.median(tempos), tempos[int(0.95 * (len(tempos) - 1))]
+
+def medir(conn_info, rtt_ms, repeticoes=20):
+   host, porta = _destino(conn_info)
+   resultados = {}
+   criados = []
+   with ProxyLatencia(host, porta, rtt_ms) as proxy:
+      info = conn_info_proxy(conn_info, proxy.porta_local)
+      with psy.connect(info) as simples, conectar(info) as preparada:
+         # Projeto de trabalho para os saves; os criados sao apagados no final
+         projeto_id = criar_projeto(preparada, f"benchmark {uuid.uuid4().hex}", "{}", {})
+         criados.append(projeto_id)
+         try:
+            def salvar_antes():
+               salvar_sequencial(simples, projeto_id, "benchmark", "{}", CRITERIOS_PADRAO)
+               simples.commit()
+
+            def salvar_depois():
+               salvar_projeto(preparada, projeto_id, "benchmark", "{}", CRITERIOS_PADRAO)
+
+            def criar_antes():
+               criados.append(criar_sequencial(simples, f"benchmark {uuid.uuid4().hex}", "{}", CRITERIOS_PADRAO))
+               simples.commit()
+
+            def criar_depois():
+               criados.append(criar_projeto(preparada, f"benchmark {uuid.uuid4().hex}", "{}", CRITERIOS_PADRAO))
+
+            casos = (
+               ("salvar sequencial", salvar_antes),
+               ("salvar pipeline", salvar_depois),
+               ("criar sequencial", criar_antes),
+               ("criar pipeline", criar_depois),
+            )
+            for nome, funcao in casos:
+               funcao() # aquecimento (preparo no servidor)
+               resultados[nome] = _medir(funcao, repeticoes)
+         finally:
+            simples.rollback()
+            preparada.execute("DELETE FROM projeto WHERE id = ANY(%s)", (criados,))
+   return resultados
+
+if __name__ == "__main__":
+   import argparse
+   from conectar import conectar_db
+
+   # python functions\benchmark_escrita.py --rtt 1 50 --repeticoes 20
+   parser = argparse.ArgumentParser(description="Latencia de salvar/criar projeto com e sem pipeline")
+   parser.add_argument("--rtt", type=float, nargs="+", default=[1.0, 50.0], help="ms")
+   parser.add_argument("--repeticoes", type=int, default=20)
+   args = parser.parse_args()
+
+   conexao = conectar_db()
+   try:
+      for rtt in args.rtt:
+         print(f"RTT simulado: {rtt:g} ms")
+         for nome, (mediana, p95) in medir(conexao[0], rtt, args.repeticoes).items():
+            print(f"   {nome:<18} mediana {mediana:8.2f} ms   p95 {p95:8.2f} ms")
+   except Exception as e:
+      print(f"Erro no benchmark: {e}")
+      import traceback
+      traceback.print_exc()
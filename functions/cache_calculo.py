@@ -0,0 +1,177 @@
+import copy
+import hashlib
+import json
+from collections import OrderedDict
+
+from calculos import VERSAO_MOTOR, calcular_trecho, dimensionar_central
+
+CASAS_DECIMAIS = 6
+
+def versao_catalogo(conn):
+   # Hash do conteudo das tabelas de catalogo usadas nos calculos
+   with conn.cursor() as cur:
+      cur.execute("""
+         SELECT md5(concat_ws('|',
+            (SELECT string_agg(concat_ws(',', id, rugosidade_c), ';' ORDER BY id) FROM material),
+            (SELECT string_agg(concat_ws(',', id, material_id, diametro_nominal, diametro_interno), ';' ORDER BY id) FROM tubo),
+            (SELECT string_agg(concat_ws(',', id, material_id, categoria, diametro, nome, leqv), ';' ORDER BY id) FROM peca),
+            (SELECT string_agg(concat_ws(',', id, tipo, taxa_vaporizacao), ';' ORDER BY id) FROM cilindro)
+         ));""")
+      return cur.fetchone()[0]
+
+def _normalizar(valor):
+   if isinstance(valor, bool) or valor is None or isinstance(valor, str):
+      return valor
+   if isinstance(valor, (int, float)):
+      return round(float(valor), CASAS_DECIMAIS)
+   if isinstance(valor, dict):
+      return {str(k): _normalizar(v) for k, v in valor.items()}
+   if isinstance(valor, (list, tuple)):
+      return [_normalizar(v) for v in valor]
+   return str(valor)
+
+def impressao_digital(tipo, entradas, versao_catalogo, versao_motor=VERSAO_MOTOR):
+   dados = {
+      "tipo": tipo,
+      "versao_motor": versao_motor,
+      "versao_catalogo": versao_catalogo,
+      "entradas": _normalizar(entradas),
+   }
+   texto = json.dumps(dados, sort_keys=True, separators=(",", ":"))
+   return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+class CacheCalculo:
+   # LRU em memoria com a tabela cache_calculo como segundo nivel.
+   # Sem conexao o cache fica apenas em memoria.
+   def __init__(self, conn=None, versao_catalogo="", capacidade=4096):
+      self.conn = conn
+      self.versao_catalogo = versao_catalogo
+      self.capacidade = capacidade
+      self.memoria = OrderedDict()
+      self.pendentes = {}
+      self.acertos_memoria = 0
+      self.acertos_banco = 0
+      self.falhas = 0
+
+   def usar(self, conn):
+      # Liga o cache a conexao da vez (sessao da interface, lote do trabalhador)
+      # e confere a versao do catalogo; com outra versao a memoria e descartada
+      self.conn = conn
+      versao = versao_catalogo(conn)
+      if versao != self.versao_catalogo:
+         self.versao_catalogo = versao
+         self.memoria.clear()
+         self.pendentes.clear()
+      return self
+
+   def _guardar_memoria(self, chave, resultado):
+      self.memoria[chave] = resultado
+      self.memoria.move_to_end(chave)
+      while len(self.memoria) > self.capacidade:
+         self.memoria.popitem(last=False)
+
+   def _buscar_banco(self, chave):
+      if self.conn is None:
+         return None
+      with self.conn.cursor() as cur:
+         cur.execute("SELECT resultado FROM cache_calculo WHERE chave = %s", (chave,))
+         row = cur.fetchone()
+      return row[0] if row else None
+
+   def obter(self, tipo, entradas, calcular):
+      # Devolve sempre uma copia: quem altera o resultado nao altera o cache
+      chave = impressao_digital(tipo, entradas, self.versao_catalogo)
+      resultado = self.memoria.get(chave)
+      if resultado is not None:
+         self.memoria.move_to_end(chave)
+         self.acertos_memoria += 1
+         return copy.deepcopy(resultado)
+
+      pendente = self.pendentes.get(chave)
+      resultado = pendente[1] if pendente else self._buscar_banco(chave)
+      if resultado is not None:
+         self.acertos_banco += 1
+      else:
+         self.falhas += 1
+         resultado = calcular()
+         self.pendentes[chave] = (tipo, resultado)
+      self._guardar_memoria(chave, resultado)
+      return copy.deepcopy(resultado)
+
+   def trecho(self, potencia, d, lreal, delta_h, pecas, pressao_inicial, s,
+              vel_maxima, perda_maxima, **kwargs):
+      # A ordem das pecas nao altera o resultado
+      pecas = sorted((float(leqv), int(qtde)) for leqv, qtde in pecas)
+      entradas = {
+         "potencia": potencia, "d": d, "lreal": lreal, "delta_h": delta_h,
+         "pecas": pecas, "pressao_inicial": pressao_inicial, "s": s,
+         "vel_maxima": vel_maxima, "perda_maxima": perda_maxima, **kwargs,
+      }
+      return self.obter("trecho", entradas, lambda: calcular_trecho(
+         potencia, d, lreal, delta_h, pecas, pressao_inicial, s,
+         vel_maxima, perda_maxima, **kwargs
+      ))
+
+   def central(self, pot_computada, taxa_vaporizacao, **kwargs):
+      entradas = {"pot_computada": pot_computada, "taxa_vaporizacao": taxa_vaporizacao, **kwargs}
+      return self.obter("central", entradas, lambda: dimensionar_central(
+         pot_computada, taxa_vaporizacao, **kwargs
+      ))
+
+   def gravar(self):
+      # Grava em lote os resultados calculados desde a ultima chamada, na ordem
+      # das chaves: transacoes concorrentes nao se travam na chave unica
+      if self.conn is None or not self.pendentes:
+         self.pendentes.clear()
+         return 0
+      with self.conn.cursor() as cur:
+         cur.executemany(
+            """
+            INSERT INTO cache_calculo (chave, tipo, versao_motor, versao_catalogo, resultado)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (chave) DO NOTHING
+            """,
+            [
+               (chave, tipo, VERSAO_MOTOR, self.versao_catalogo, json.dumps(resultado))
+               for chave, (tipo, resultado) in sorted(self.pendentes.items())
+            ],
+         )
+      gravados = len(self.pendentes)
+      self.pendentes.clear()
+      return gravados
+
+   def invalidar(self, versao_catalogo=None):
+      # Troca a versao do catalogo e remove do banco as entradas de outras versoes
+      if versao_catalogo is not None:
+         self.versao_catalogo = versao_catalogo
+      self.memoria.clear()
+      self.pendentes.clear()
+      if self.conn is None:
+         return 0
+      with self.conn.cursor() as cur:
+         cur.execute(
+            "DELETE FROM cache_calculo WHERE versao_motor <> %s OR versao_catalogo <> %s",
+            (VERSAO_MOTOR, self.versao_catalogo),
+         )
+         return cur.rowcount
+
+   def estatisticas(self):
+      total = self.acertos_memoria + self.acertos_banco + self.falhas
+      return {
+         "acertos_memoria": self.acertos_memoria,
+         "acertos_banco": self.acertos_banco,
+         "falhas": self.falhas,
+         "taxa_acerto": (self.acertos_memoria + self.acertos_banco) / total if total else 0.0,
+         "em_memoria": len(self.memoria),
+      }
+
+if __name__ == "__main__":
+   import psycopg as psy
+   from conectar import conectar_db
+
+   conexao = conectar_db()
+   with psy.connect(conexao[0]) as conn:
+      cache = CacheCalculo(conn, versao_catalogo(conn))
+      removidos = cache.invalidar()
+      conn.commit()
+      print(f'Entradas de cache invalidadas: {removidos}')
@@ -1,15 +1,37 @@
 import math
 
+# Versao do motor de calculo (registrada em execucao_calculo)
+VERSAO_MOTOR = "1.0"
+
+# Constantes (GLP)
+PCI_GLP_KG = 11000 # kcal/kg
+PCI_GLP_M3 = 24000 # kcal/m3
+PRESSAO_ATMOSFERICA = 101.325 # kPa
+DENSIDADE_AR = 1.293 # kg/m3
+GRAVIDADE = 9.81 # m/s2
+LIMITE_BAIXA_PRESSAO = 7.5 # kPa
+
+# Fatores de conversao de potencia para kcal/min
+# Tabela unica: tambem alimenta unidade_potencia no banco (popular_banco.py)
+FATORES_KCALMIN = {
+   "kcal/min": 1.0,
+   "kcal/h": 1 / 60,
+   "kw": 60 / 4.1868,
+   "w": 0.06 / 4.1868,
+   "btu/h": 0.251996 / 60,
+   "kg/h": PCI_GLP_KG / 60,
+   "m3/h": PCI_GLP_M3 / 60,
+}
+
+def normalizar_unidade(unidade):
+   return "".join(str(unidade).split()).lower().replace("³", "3")
+
 # Converter unidades
-def converter_para_kcalmin(unidade):
-   if unidade == 'kw':
-      return unidade * 0.01434
-   elif unidade == 'kcal/h':
-      return unidade / 60
-   elif unidade == 'kg/h':
-      return unidade * 672000
-   else:
-      return unidade
+def converter_para_kcalmin(valor, unidade):
+   fator = FATORES_KCALMIN.get(normalizar_unidade(unidade))
+   if fator is None:
+      raise ValueError(f"Unidade de potencia desconhecida: {unidade}")
+   return valor * fator
 
 # Potencia computada - kcal/min
 # Fator de simultaneidade - %
@@ -32,4 +54,62 @@ def vazao_glp(pot_adotada,pci):
 
 # Número cilindros
 def num_cilindros(q, s, tv):
-   return math.ceil(q*s/tv)
\ No newline at end of file
+   return math.ceil(q*s/tv)
+
+# Comprimento equivalente - m
+# pecas: [(leqv, qtde), ...]
+def comprimento_equivalente(lreal, pecas):
+   return lreal + sum(leqv * qtde for leqv, qtde in pecas)
+
+# Perda de carga por atrito (NBR 15526) - kPa
+# q em m3/h, l em m, d interno em mm, p_inicial manometrica em kPa
+def perda_carga(q, l, d, s, p_inicial):
+   if p_inicial <= LIMITE_BAIXA_PRESSAO:
+      return 2273 * s * l * math.pow(q, 1.82) / math.pow(d, 4.82)
+   pa = p_inicial + PRESSAO_ATMOSFERICA
+   pb2 = pa**2 - 467000 * s * l * math.pow(q, 1.82) / math.pow(d, 4.82)
+   return pa - math.sqrt(max(pb2, 0))
+
+# Perda (+) ou ganho (-) de pressao pelo desnivel - kPa
+def perda_altura(delta_h, s):
+   return GRAVIDADE * DENSIDADE_AR * (s - 1) * delta_h / 1000
+
+# Velocidade - m/s
+def velocidade(q, d, p):
+   area = math.pi * math.pow(d / 1000, 2) / 4
+   return q / 3600 / area * PRESSAO_ATMOSFERICA / (p + PRESSAO_ATMOSFERICA)
+
+# Calculo de um trecho - mesmas colunas da tabela calculo
+# potencia em kcal/h, pci em kcal/m3
+def calcular_trecho(potencia, d, lreal, delta_h, pecas, pressao_inicial, s,
+                    vel_maxima, perda_maxima, pci=PCI_GLP_M3):
+   q = vazao_glp(potencia, pci)
+   ltotal = comprimento_equivalente(lreal, pecas)
+   dp = perda_carga(q, ltotal, d, s, pressao_inicial)
+   pressao_final = pressao_inicial - dp - perda_altura(delta_h, s)
+   v = velocidade(q, d, max(pressao_final, 0))
+   return {
+      "ltotal": ltotal,
+      "potencia": potencia,
+      "vazao": q,
+      "velocidade": v,
+      "perda_carga": dp,
+      "pressao_inicial": pressao_inicial,
+      "pressao_final": pressao_final,
+      "ok": v <= vel_maxima and pressao_inicial - pressao_final <= perda_maxima and pressao_final > 0,
+   }
+
+# Dimensionamento da central
+# pot_computada em kcal/min, taxa_vaporizacao em kg/h por cilindro
+def dimensionar_central(pot_computada, taxa_vaporizacao, fator_seguranca=1,
+                        pci_kg=PCI_GLP_KG, pci_m3=PCI_GLP_M3):
+   f = fator_simultaneidade(pot_computada)
+   adotada = potencia_adotada(pot_computada, f)
+   vazao_kg = vazao_glp(adotada * 60, pci_kg)
+   return {
+      "fator_simultaneidade": f,
+      "pot_adotada": adotada,
+      "vazao": vazao_glp(adotada * 60, pci_m3),
+      "vazao_kg": vazao_kg,
+      "num_cilindros": num_cilindros(vazao_kg, fator_seguranca, taxa_vaporizacao),
+   }
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from diametros import diametro_numerico
+
+# Catalogo (json/materiais, tubos, pecas, cilindros, reguladores) compilado em um arquivo
+# binario mapeado em memoria: arrays NumPy lidos direto do mmap, sem copia e
+# sem parse de JSON. O cabecalho guarda o hash das fontes; snapshot ausente ou
+# desatualizado cai para a leitura dos JSON.
+#
+# Tubos ordenados por (material, diametro_pol): o proximo diametro sai de uma
+# busca binaria no trecho do material.
+#
+# Layout: MAGICO | versao (u4) | tamanho do cabecalho (u4) | cabecalho JSON |
+# arrays alinhados em ALINHAMENTO bytes, nas posicoes indicadas no cabecalho.
+
+PASTA_JSON = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "json"))
+CAMINHO_PADRAO = os.path.join(PASTA_JSON, "catalogo.bin")
+FONTES = ("materiais.json", "tubos.json", "pecas.json", "cilindros.json", "reguladores.json")
+
+MAGICO = b"GLPCAT\0\0"
+VERSAO_FORMATO = 3
+ALINHAMENTO = 64
+
+def hash_fontes(pasta=PASTA_JSON):
+   h = hashlib.sha256()
+   for nome in FONTES:
+      with open(os.path.join(pasta, nome), "rb") as f:
+         h.update(nome.encode("utf-8") + b"\0" + f.read() + b"\0")
+   return h.hexdigest()
+
+def assinatura_fontes(pasta=PASTA_JSON):
+   # Tamanho e mtime das fontes: confere o snapshot sem ler os JSON
+   assinatura = {}
+   for nome in FONTES:
+      info = os.stat(os.path.join(pasta, nome))
+      assinatura[nome] = [info.st_size, info.st_mtime_ns]
+   return assinatura
+
+def _texto(valores):
+   # Strings em largura fixa (U<n>): mapeaveis como qualquer outro array
+   largura = max((len(v) for v in valores), default=1) or 1
+   return np.array(valores, dtype=f"<U{largura}")
+
+def ler_json(pasta=PASTA_JSON):
+   # Arrays do catalogo a partir dos JSON; material_id segue a ordem de materiais.json
+   def carregar(nome):
+      with open(os.path.join(pasta, nome), "r", encoding="utf-8") as f:
+         return json.load(f)
+
+   materiais = carregar("materiais.json")
+   tubos = carregar("tubos.json")
+   pecas = carregar("pecas.json")
+   cilindros = carregar("cilindros.json")
+   reguladores = carregar("reguladores.json")
+
+   tubo_linhas = sorted(
+      ((int(m), dn, float(di), *diametro_numerico(dn)) for m, itens in tubos.items() for dn, di in itens.items()),
+      key=lambda t: (t[0], t[4]),
+   )
+   peca_linhas = [
+      (int(m), categoria, diametro, nome, float(leqv), *diametro_numerico(diametro))
+      for categoria, mat_dict in pecas.items()
+      for m, diam_dict in mat_dict.items()
+      for diametro, pecas_dict in diam_dict.items()
+      for nome, leqv in pecas_dict.items()
+   ]
+   # Reguladores por estagio e vazao maxima
+   regulador_linhas = sorted(
+      (
+         (estagio, modelo, r.get("fabricante", ""), r.get("descricao", ""), *map(float, r["vazao"]),
+          *map(float, r["entrada"]), *map(float, r["saida"]))
+         for estagio, modelos in reguladores.items()
+         for modelo, r in modelos.items()
+      ),
+      key=lambda r: (r[0], r[5], r[1]),
+   )
+   return {
+      "material_id": np.arange(1, len(materiais) + 1, dtype=np.int32),
+      "material_chave": _texto(list(materiais)),
+      "material_nome": _texto([m["nome"] for m in materiais.values()]),
+      "material_c": np.array([m["c"] for m in materiais.values()], dtype=np.float64),
+      "material_descricao": _texto([m.get("descricao", "") for m in materiais.values()]),
+      "tubo_material": np.array([t[0] for t in tubo_linhas], dtype=np.int32),
+      "tubo_dn": _texto([t[1] for t in tubo_linhas]),
+      "tubo_di": np.array([t[2] for t in tubo_linhas], dtype=np.float64),
+      "tubo_mm": np.array([t[3] for t in tubo_linhas], dtype=np.float64),
+      "tubo_pol": np.array([t[4] for t in tubo_linhas], dtype=np.float64),
+      "peca_material": np.array([p[0] for p in peca_linhas], dtype=np.int32),
+      "peca_categoria": _texto([p[1] for p in peca_linhas]),
+      "peca_diametro": _texto([p[2] for p in peca_linhas]),
+      "peca_nome": _texto([p[3] for p in peca_linhas]),
+      "peca_leqv": np.array([p[4] for p in peca_linhas], dtype=np.float64),
+      "peca_mm": np.array([p[5] for p in peca_linhas], dtype=np.float64),
+      "peca_pol": np.array([p[6] for p in peca_linhas], dtype=np.float64),
+      "cilindro_tipo": _texto(list(cilindros)),
+      "cilindro_taxa": np.array(list(cilindros.values()), dtype=np.float64),
+      "regulador_estagio": _texto([r[0] for r in regulador_linhas]),
+      "regulador_modelo": _texto([r[1] for r in regulador_linhas]),
+      "regulador_fabricante": _texto([r[2] for r in regulador_linhas]),
+      "regulador_descricao": _texto([r[3] for r in regulador_linhas]),
+      "regulador_faixas": np.array([r[4:] for r in regulador_linhas], dtype=np.float64).reshape(-1, 6),
+   }
+
+def _alinhar(posicao):
+   return -(-posicao // ALINHAMENTO) * ALINHAMENTO
+
+def compilar(pasta=PASTA_JSON, destino=CAMINHO_PADRAO):
+   arrays = ler_json(pasta)
+   # Posicoes relativas ao inicio da area de dados
+   indice = {}
+   posicao = 0
+   for nome, array in arrays.items():
+      posicao = _alinhar(posicao)
+      indice[nome] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": posicao}
+      posicao += array.nbytes
+   cabecalho = json.dumps(
+      {"hash": hash_fontes(pasta), "fontes": assinatura_fontes(pasta), "arrays": indice},
+      separators=(",", ":"),
+   ).encode("utf-8")
+   inicio_dados = _alinhar(len(MAGICO) + 8 + len(cabecalho))
+
+   temporario = destino + ".tmp"
+   with open(temporario, "wb") as f:
+      f.write(MAGICO + struct.pack("<II", VERSAO_FORMATO, len(cabecalho)) + cabecalho)
+      for nome, array in arrays.items():
+         f.write(b"\0" * (inicio_dados + indice[nome]["offset"] - f.tell()))
+         f.write(np.ascontiguousarray(array).tobytes())
+   # Troca atomica: quem estiver com o arquivo antigo mapeado nao e afetado
+   os.replace(temporario, destino)
+   return destino
+
+class Catalogo:
+   def __init__(self, arrays, origem, hash_catalogo, mapa=None, fontes=None):
+      self.arrays = arrays
+      self.origem = origem # "binario" ou "json"
+      self.hash = hash_catalogo
+      self.fontes = fontes or {}
+      self._mapa = mapa
+
+   def __getattr__(self, nome):
+      try:
+         return self.__dict__["arrays"][nome]
+      except KeyError:
+         raise AttributeError(nome) from None
+
+   def fechar(self):
+      self.arrays = {}
+      if self._mapa is not None:
+         try:
+            self._mapa.close()
+         except BufferError:
+            # Ainda ha arrays em uso fora do catalogo: o mapa fecha com eles
+            pass
+         self._mapa = None
+
+   def diametro_interno(self, material_id, diametro_nominal):
+      # mm; None quando o tubo nao existe no catalogo
+      achados = np.flatnonzero((self.tubo_material == material_id) & (self.tubo_dn == diametro_nominal))
+      return float(self.tubo_di[achados[0]]) if len(achados) else None
+
+   def _tubos_material(self, material_id):
+      # Faixa [inicio, fim) do material nos tubos ordenados
+      inicio = int(np.searchsorted(self.tubo_material, material_id, side="left"))
+      fim = int(np.searchsorted(self.tubo_material, material_id, side="right"))
+      return inicio, fim
+
+   def proximo_tubo(self, material_id, diametro_pol, estrito=True):
+      # Indice do tubo seguinte (> diametro_pol; >= com estrito=False); None se nao houver
+      inicio, fim = self._tubos_material(material_id)
+      lado = "right" if estrito else "left"
+      posicao = inicio + int(np.searchsorted(self.tubo_pol[inicio:fim], diametro_pol, side=lado))
+      return posicao if posicao < fim else None
+
+   def tubo_minimo(self, material_id, diametro_interno):
+      # Menor tubo do material com diametro interno >= o pedido (mm); None se nenhum serve
+      inicio, fim = self._tubos_material(material_id)
+      posicao = inicio + int(np.searchsorted(self.tubo_di[inicio:fim], diametro_interno, side="left"))
+      return posicao if posicao < fim else None
+
+   def tubos_faixa(self, material_id, minimo_mm, maximo_mm):
+      # Indices dos tubos do material com diametro nominal entre minimo_mm e maximo_mm
+      inicio, fim = self._tubos_material(material_id)
+      mm = self.tubo_mm[inicio:fim]
+      return np.arange(
+         inicio + int(np.searchsorted(mm, minimo_mm, side="left")),
+         inicio + int(np.searchsorted(mm, maximo_mm, side="right")),
+      )
+
+   def leqv(self, material_id, diametro, nome, categoria=None):
+      mascara = (self.peca_material == material_id) & (self.peca_diametro == diametro) & (self.peca_nome == nome)
+      if categoria is not None:
+         mascara &= self.peca_categoria == categoria
+      achados = np.flatnonzero(mascara)
+      return float(self.peca_leqv[achados[0]]) if len(achados) else None
+
+   def taxa_vaporizacao(self, tipo):
+      achados = np.flatnonzero(self.cilindro_tipo == tipo)
+      return float(self.cilindro_taxa[achados[0]]) if len(achados) else None
+
+   # Linhas no formato dos upserts de popular_banco.py
+
+   def linhas_materiais(self):
+      return list(zip(self.material_nome.tolist(), self.material_c.tolist(), self.material_descricao.tolist()))
+
+   def linhas_tubos(self):
+      return list(zip(
+         self.tubo_material.tolist(),
+         self.tubo_dn.tolist(),
+         self.tubo_di.tolist(),
+         self.tubo_mm.tolist(),
+         self.tubo_pol.tolist(),
+      ))
+
+   def linhas_pecas(self):
+      return list(zip(
+         self.peca_material.tolist(),
+         self.peca_categoria.tolist(),
+         self.peca_diametro.tolist(),
+         self.peca_nome.tolist(),
+         self.peca_leqv.tolist(),
+         self.peca_mm.tolist(),
+         self.peca_pol.tolist(),
+      ))
+
+   def linhas_cilindros(self):
+      return list(zip(self.cilindro_tipo.tolist(), self.cilindro_taxa.tolist()))
+
+   def linhas_reguladores(self):
+      # (estagio, modelo, fabricante, descricao, vazao_min, vazao_max, entrada_min, entrada_max, saida_min, saida_max)
+      return [
+         (estagio, modelo, fabricante, descricao, *faixas)
+         for estagio, modelo, fabricante, descricao, faixas in zip(
+            self.regulador_estagio.tolist(),
+            self.regulador_modelo.tolist(),
+            self.regulador_fabricante.tolist(),
+            self.regulador_descricao.tolist(),
+            self.regulador_faixas.tolist(),
+         )
+      ]
+
+def _abrir_binario(caminho):
+   with open(caminho, "rb") as f:
+      mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+   try:
+      if mapa[:len(MAGICO)] != MAGICO:
+         raise ValueError(f"{caminho} nao e um catalogo compilado")
+      versao, tamanho = struct.unpack_from("<II", mapa, len(MAGICO))
+      if versao != VERSAO_FORMATO:
+         raise ValueError(f"Versao do catalogo {versao} diferente de {VERSAO_FORMATO}")
+      inicio = len(MAGICO) + 8
+      cabecalho = json.loads(mapa[inicio:inicio + tamanho])
+      inicio_dados = _alinhar(inicio + tamanho)
+      arrays = {}
+      for nome, info in cabecalho["arrays"].items():
+         dtype = np.dtype(info["dtype"])
+         contagem = math.prod(info["shape"])
+         arrays[nome] = np.frombuffer(
+            mapa, dtype=dtype, count=contagem, offset=inicio_dados + info["offset"]
+         ).reshape(info["shape"])
+   except Exception:
+      arrays = None
+      mapa.close()
+      raise
+   return Catalogo(arrays, "binario", cabecalho["hash"], mapa, cabecalho["fontes"])
+
+def abrir_catalogo(caminho=CAMINHO_PADRAO, pasta=PASTA_JSON, verificar=True):
+   # Snapshot binario quando existe e bate com os JSON; senao le os JSON.
+   # Fontes com o mesmo tamanho e mtime da compilacao dispensam o hash.
+   # verificar=False aceita o snapshot sem olhar as fontes (ex.: instalacao sem a pasta json).
+   if os.path.exists(caminho):
+      try:
+         catalogo = _abrir_binario(caminho)
+         if (not verificar or catalogo.fontes == assinatura_fontes(pasta)
+               or catalogo.hash == hash_fontes(pasta)):
+            return catalogo
+         catalogo.fechar()
+      except (ValueError, OSError) as e:
+         print(f"Catalogo binario ignorado: {e}")
+   return Catalogo(ler_json(pasta), "json", hash_fontes(pasta))
+
+if __name__ == "__main__":
+   import sys
+   import time
+
+   # python functions\catalogo_binario.py [destino]
+   destino = sys.argv[1] if len(sys.argv) > 1 else CAMINHO_PADRAO
+   try:
+      compilar(PASTA_JSON, destino)
+      for origem, abrir in (
+         ("binario", lambda: abrir_catalogo(destino)),
+         ("json", lambda: Catalogo(ler_json(PASTA_JSON), "json", "")),
+      ):
+         inicio = time.perf_counter()
+         catalogo = abrir()
+         print(f"{origem:<8} {len(catalogo.peca_leqv)} pecas, {len(catalogo.tubo_di)} tubos "
+               f"em {(time.perf_counter() - inicio) * 1e6:.0f} us")
+         catalogo.fechar()
+      print(f"Catalogo compilado em {destino}")
+   except Exception as e:
+      print(f"Erro ao compilar o catalogo: {e}")
+      import traceback
+      traceback.print_exc()
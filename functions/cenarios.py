@@ -0,0 +1,267 @@
+import re
+
+import numpy as np
+
+from acesso_dados import CRITERIOS_PADRAO
+from calculos import (
+   DENSIDADE_AR,
+   GRAVIDADE,
+   LIMITE_BAIXA_PRESSAO,
+   PCI_GLP_KG,
+   PCI_GLP_M3,
+   PRESSAO_ATMOSFERICA,
+)
+from rede import carregar_rede
+
+# Varredura de cenarios (what-if): produto cartesiano de projetos x cilindros x
+# autonomias x criterios, avaliado de uma vez com arrays numpy.
+
+# Temperatura do PCI volumetrico (calculos.PCI_GLP_M3): nela a varredura
+# coincide com calculos.calcular_trecho
+TEMPERATURA_REFERENCIA = 20.0 # C
+
+def capacidade_cilindro(tipo):
+   # "P-45" -> 45 kg
+   encontrado = re.search(r'(\d+(?:[.,]\d+)?)', str(tipo))
+   if not encontrado:
+      raise ValueError(f"Capacidade do cilindro nao identificada: {tipo}")
+   return float(encontrado.group(1).replace(",", "."))
+
+def faixa(inicio, fim=None, passo=None):
+   # Um valor ou uma faixa inclusiva, ex.: faixa(1.5, 2.0, 0.1)
+   if passo is not None and passo == 0:
+      raise ValueError("O passo da faixa nao pode ser zero")
+   if fim is None or fim == inicio:
+      return np.array([inicio], dtype=np.float64)
+   passo = passo or (fim - inicio)
+   if (fim - inicio) * passo < 0:
+      raise ValueError(f"Passo {passo} nao vai de {inicio} a {fim}")
+   return np.round(np.arange(inicio, fim + passo / 1000, passo), 6)
+
+# Versoes vetorizadas de calculos.py
+
+def fator_simultaneidade_lote(pot_computada):
+   c = np.asarray(pot_computada, dtype=np.float64)
+   with np.errstate(invalid="ignore"):
+      return np.select(
+         [c < 350, c < 9612, c < 20000],
+         [
+            np.full_like(c, 100.0),
+            100 / (1 + 0.001 * np.power(np.maximum(c - 349, 0), 0.8712)),
+            100 / (1 + 0.4705 * np.power(np.maximum(c - 1055, 0), 0.19931)),
+         ],
+         23.0,
+      )
+
+def perda_carga_lote(q, l, d, s, p_inicial):
+   termo = s * l * np.power(q, 1.82) / np.power(d, 4.82)
+   pa = p_inicial + PRESSAO_ATMOSFERICA
+   alta = pa - np.sqrt(np.maximum(pa**2 - 467000 * termo, 0))
+   return np.where(p_inicial <= LIMITE_BAIXA_PRESSAO, 2273 * termo, alta)
+
+def velocidade_lote(q, d, p):
+   area = np.pi * np.power(d / 1000, 2) / 4
+   return q / 3600 / area * PRESSAO_ATMOSFERICA / (p + PRESSAO_ATMOSFERICA)
+
+# Banco
+
+def carregar_projetos(conn, projeto_ids):
+   # {projeto_id: (potencia computada em kcal/min, (diametro_interno, ltotal, delta_h))}
+   # com um array por coluna, apenas os trechos da rede primaria com tubo
+   projetos = {}
+   potencias = {pid: 0.0 for pid in projeto_ids}
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         SELECT ep.projeto_id, SUM(ep.qtde_equipamentos * e.pot_kcalmin)
+         FROM equipamento_projeto ep
+         JOIN equipamento e ON e.id = ep.equipamento_id
+         WHERE ep.projeto_id = ANY(%s)
+         GROUP BY ep.projeto_id
+         """,
+         (list(projeto_ids),),
+      )
+      for pid, potencia in cur.fetchall():
+         potencias[pid] = float(potencia or 0)
+   rede = carregar_rede(conn, projeto_ids, com_nomes=False)
+   leq = rede.leq()
+   primaria = rede.mascara("primaria", com_diametro=True)
+   for pid, potencia in potencias.items():
+      selecao = primaria & (rede.projeto_id == pid)
+      projetos[pid] = (potencia, rede.arrays_calculo(selecao, leq))
+   return projetos
+
+def carregar_cilindros(conn, tipos=None):
+   with conn.cursor() as cur:
+      cur.execute("SELECT tipo, taxa_vaporizacao FROM cilindro ORDER BY id")
+      cilindros = [(tipo, float(taxa)) for tipo, taxa in cur.fetchall()]
+   if tipos:
+      cilindros = [c for c in cilindros if c[0] in tipos]
+   return cilindros
+
+# Varredura
+
+def varrer_cenarios(projetos, cilindros, autonomias, densidades, temperaturas, pressoes,
+                    fator_seguranca=1, vel_maxima=20, perda_maxima=CRITERIOS_PADRAO["perda_carga_maxima"],
+                    pci_kg=PCI_GLP_KG, pci_m3=PCI_GLP_M3):
+   # projetos: saida de carregar_projetos; cilindros: [(tipo, taxa kg/h)]
+   # autonomias em horas de consumo na vazao adotada, temperaturas em graus C,
+   # pressoes de operacao em kPa. Retorna um dict de arrays com um valor por cenario.
+   ids = list(projetos)
+   potencias = np.array([projetos[pid][0] for pid in ids], dtype=np.float64)
+   tipos = [c[0] for c in cilindros]
+   taxas = np.array([c[1] for c in cilindros], dtype=np.float64)
+   capacidades = np.array([capacidade_cilindro(t) for t in tipos], dtype=np.float64)
+
+   # Uma dimensao por eixo; o broadcasting gera o produto cartesiano
+   forma = (len(ids), len(tipos), len(autonomias), len(densidades), len(temperaturas), len(pressoes))
+   pot = potencias.reshape(-1, 1, 1, 1, 1, 1)
+   taxa = taxas.reshape(1, -1, 1, 1, 1, 1)
+   capacidade = capacidades.reshape(1, -1, 1, 1, 1, 1)
+   horas = np.asarray(autonomias, dtype=np.float64).reshape(1, 1, -1, 1, 1, 1)
+   s = np.asarray(densidades, dtype=np.float64).reshape(1, 1, 1, -1, 1, 1)
+   temperatura = np.asarray(temperaturas, dtype=np.float64).reshape(1, 1, 1, 1, -1, 1)
+   pressao = np.asarray(pressoes, dtype=np.float64).reshape(1, 1, 1, 1, 1, -1)
+
+   fator = fator_simultaneidade_lote(pot)
+   adotada = pot * fator / 100
+   vazao_kg = adotada * 60 / pci_kg
+   # Mesma base de calculos.calcular_trecho: potencia adotada (kcal/h) / PCI volumetrico
+   vazao_m3 = adotada * 60 / pci_m3
+
+   por_vaporizacao = np.ceil(vazao_kg * fator_seguranca / taxa)
+   por_autonomia = np.ceil(vazao_kg * horas / capacidade)
+   cilindros_em_uso = np.maximum(por_vaporizacao, por_autonomia)
+
+   # Verificacao conservadora da rede primaria: vazao total em cada trecho,
+   # pressao de operacao na entrada de cada um
+   vel_max = np.zeros(forma)
+   perda_max = np.zeros(forma)
+   for i, pid in enumerate(ids):
+      d, ltotal, delta_h = projetos[pid][1]
+      if not len(d):
+         continue
+      extra = (1,) * 5
+      d = d.reshape(extra + (-1,))
+      ltotal = ltotal.reshape(extra + (-1,))
+      delta_h = delta_h.reshape(extra + (-1,))
+      q = vazao_m3[i][..., None]
+      p = np.broadcast_to(pressao[0], forma[1:])[..., None]
+      s_i = s[0][..., None]
+      # Na temperatura de operacao a vazao volumetrica cresce e a massa
+      # especifica cai na mesma proporcao: as duas entram na perda de carga,
+      # a vazao tambem na velocidade
+      fator_t = (273.15 + temperatura[0])[..., None] / (273.15 + TEMPERATURA_REFERENCIA)
+      q_t = q * fator_t
+      dp = perda_carga_lote(q_t, ltotal, d, s_i / fator_t, p) + GRAVIDADE * DENSIDADE_AR * (s_i - 1) * delta_h / 1000
+      v = velocidade_lote(q_t, d, np.maximum(p - dp, 0))
+      vel_max[i] = v.max(axis=-1)
+      perda_max[i] = dp.max(axis=-1)
+
+   # Mesmos limites de calculos.calcular_trecho: velocidade, perda de carga
+   # maxima do criterio e pressao final positiva em todos os trechos
+   ok = (vel_max <= vel_maxima) & (perda_max <= perda_maxima) & (perda_max < pressao)
+
+   indices = np.indices(forma).reshape(len(forma), -1)
+   return {
+      "projeto_id": np.array(ids)[indices[0]],
+      "cilindro": np.array(tipos)[indices[1]],
+      "autonomia": np.asarray(autonomias, dtype=np.float64)[indices[2]],
+      "densidade_relativa": np.asarray(densidades, dtype=np.float64)[indices[3]],
+      "temperatura": np.asarray(temperaturas, dtype=np.float64)[indices[4]],
+      "pressao_operacao": np.asarray(pressoes, dtype=np.float64)[indices[5]],
+      "pot_computada": np.broadcast_to(pot, forma).ravel(),
+      "fator_simultaneidade": np.broadcast_to(fator, forma).ravel(),
+      "pot_adotada": np.broadcast_to(adotada, forma).ravel(),
+      "vazao_kg": np.broadcast_to(vazao_kg, forma).ravel(),
+      "num_cilindros": np.broadcast_to(cilindros_em_uso, forma).ravel().astype(int),
+      "massa_total": np.broadcast_to(cilindros_em_uso * capacidade, forma).ravel(),
+      "velocidade_max": vel_max.ravel(),
+      "perda_max_trecho": perda_max.ravel(),
+      "ok": ok.ravel(),
+   }
+
+def ordenar_cenarios(cenarios):
+   # Aprovados primeiro; depois menos cilindros, menor massa armazenada e menor perda
+   ordem = np.lexsort((
+      cenarios["perda_max_trecho"],
+      cenarios["massa_total"],
+      cenarios["num_cilindros"],
+      ~cenarios["ok"],
+   ))
+   return {chave: valores[ordem] for chave, valores in cenarios.items()}
+
+def tabela_cenarios(cenarios, limite=20):
+   colunas = (
+      ("projeto_id", "Projeto", "{}"),
+      ("cilindro", "Cilindro", "{}"),
+      ("autonomia", "Aut.(h)", "{:.0f}"),
+      ("densidade_relativa", "Dens.", "{:.2f}"),
+      ("temperatura", "T(C)", "{:.0f}"),
+      ("pressao_operacao", "P(kPa)", "{:.1f}"),
+      ("vazao_kg", "kg/h", "{:.2f}"),
+      ("num_cilindros", "Qtde", "{}"),
+      ("velocidade_max", "Vmax", "{:.2f}"),
+      ("perda_max_trecho", "dPmax", "{:.3f}"),
+      ("ok", "OK", "{}"),
+   )
+   total = len(cenarios["ok"])
+   linhas = [[titulo for _, titulo, _ in colunas]]
+   for i in range(min(limite, total)):
+      linhas.append([formato.format(cenarios[chave][i]) for chave, _, formato in colunas])
+   larguras = [max(len(linha[j]) for linha in linhas) for j in range(len(colunas))]
+   texto = ["  ".join(v.rjust(larguras[j]) for j, v in enumerate(linha)) for linha in linhas]
+   texto.append(f"{min(limite, total)} de {total} cenarios")
+   return "\n".join(texto)
+
+if __name__ == "__main__":
+   import argparse
+   import time
+   from conectar import conectar_db
+   from replicas import roteador_configurado
+
+   # python functions\cenarios.py 12 13 --autonomia 24 72 24 --densidade 1.5 2.0 0.1
+   parser = argparse.ArgumentParser(description="Varredura de cenarios de central de GLP")
+   parser.add_argument("projetos", type=int, nargs="+")
+   parser.add_argument("--cilindros", nargs="*", help="tipos, ex.: P-45 P-90 (padrao: todos)")
+   # Todos os eixos: um valor ou inicio fim passo
+   parser.add_argument("--autonomia", type=float, nargs="+", default=[24.0], help="valor ou inicio fim passo (h)")
+   parser.add_argument("--densidade", type=float, nargs="+", default=[1.8], help="valor ou inicio fim passo")
+   parser.add_argument(
+      "--temperatura", type=float, nargs="+", default=[TEMPERATURA_REFERENCIA], help="valor ou inicio fim passo (C)"
+   )
+   parser.add_argument("--pressao", type=float, nargs="+", default=[150.0], help="valor ou inicio fim passo (kPa)")
+   parser.add_argument("--vel-maxima", type=float, default=20.0)
+   parser.add_argument("--perda-maxima", type=float, default=CRITERIOS_PADRAO["perda_carga_maxima"], help="kPa")
+   parser.add_argument("--fator-seguranca", type=float, default=1.0)
+   parser.add_argument("--limite", type=int, default=20)
+   args = parser.parse_args()
+   for eixo in ("autonomia", "densidade", "temperatura", "pressao"):
+      if len(getattr(args, eixo)) > 3:
+         parser.error(f"--{eixo}: informe um valor ou inicio fim passo")
+   try:
+      faixas = [faixa(*getattr(args, eixo)) for eixo in ("autonomia", "densidade", "temperatura", "pressao")]
+   except ValueError as e:
+      parser.error(str(e))
+
+   conexao = conectar_db()
+   try:
+      # Somente leitura: servida por uma replica quando DB_REPLICAS estiver definida
+      with roteador_configurado(conexao[0], min_size=0) as roteador, roteador.leitura() as conn:
+         projetos = carregar_projetos(conn, args.projetos)
+         cilindros = carregar_cilindros(conn, args.cilindros)
+      inicio = time.perf_counter()
+      cenarios = ordenar_cenarios(varrer_cenarios(
+         projetos,
+         cilindros,
+         *faixas,
+         fator_seguranca=args.fator_seguranca,
+         vel_maxima=args.vel_maxima,
+         perda_maxima=args.perda_maxima,
+      ))
+      print(tabela_cenarios(cenarios, args.limite))
+      print(f"Tempo de calculo: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+   except Exception as e:
+      print(f"Erro na varredura de cenarios: {e}")
+      import traceback
+      traceback.print_exc()
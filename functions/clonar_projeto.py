@@ -0,0 +1,156 @@
+# Clonagem de projeto inteiramente no servidor: um unico comando com CTEs
+# de INSERT ... SELECT, sem trazer linhas para o Python.
+
+# Tabelas ligadas ao projeto, copiadas sem remapear ids
+TABELAS_PROJETO = (
+   "criterio_projeto",
+   "central_glp",
+   "equipamento_projeto",
+   "cilindro_projeto",
+   "regulador_projeto",
+)
+
+def colunas_copiaveis(cur, tabela, ignorar=("id", "projeto_id")):
+   cur.execute(
+      """
+      SELECT column_name
+      FROM information_schema.columns
+      WHERE table_schema = current_schema() AND table_name = %s
+         AND is_generated = 'NEVER'
+      ORDER BY ordinal_position
+      """,
+      (tabela,),
+   )
+   return [row[0] for row in cur.fetchall() if row[0] not in ignorar]
+
+def _lista(colunas, prefixo=""):
+   return ", ".join(f'{prefixo}"{c}"' for c in colunas)
+
+# Colunas de trecho que apontam para ponto: remapeadas para os pontos copiados
+PONTAS_TRECHO = {"ponto_inicio_id": "pi", "ponto_fim_id": "pf"}
+
+def _selecao_trecho(colunas):
+   return ", ".join(
+      f"{PONTAS_TRECHO[c]}.novo" if c in PONTAS_TRECHO else f't."{c}"'
+      for c in colunas
+   )
+
+# Tabelas de TABELAS_PROJETO com coluna que aponta para trecho: remapeada para os trechos copiados
+TRECHO_EM_TABELAS = {"regulador_projeto": "trecho_id"}
+
+def _selecao_tabela(tabela, colunas):
+   coluna_trecho = TRECHO_EM_TABELAS.get(tabela)
+   if coluna_trecho not in colunas:
+      return _lista(colunas, "x."), ""
+   selecao = ", ".join("mt.novo" if c == coluna_trecho else f'x."{c}"' for c in colunas)
+   return selecao, f'LEFT JOIN mapa_trecho mt ON mt.antigo = x."{coluna_trecho}"'
+
+def sql_clonar_projeto(cur):
+   colunas_projeto = colunas_copiaveis(cur, "projeto", ("id", "nome", "descricao", "created_at", "updated_at"))
+   colunas_ponto = colunas_copiaveis(cur, "ponto")
+   colunas_trecho = colunas_copiaveis(cur, "trecho")
+   colunas_trecho_peca = colunas_copiaveis(cur, "trecho_peca", ("id", "trecho_id"))
+
+   ctes = [
+      f"""novo_projeto AS (
+         INSERT INTO projeto (nome, descricao, {_lista(colunas_projeto)})
+         SELECT %(nome)s, COALESCE(%(descricao)s, o.descricao), {_lista(colunas_projeto, "o.")}
+         FROM projeto o
+         WHERE o.id = %(origem)s
+         RETURNING id
+      )""",
+      # Os novos ids de ponto e de trecho sao reservados antes para remapear
+      # as pontas dos trechos e trecho_peca
+      """mapa_ponto AS (
+         SELECT x.id AS antigo, nextval(pg_get_serial_sequence('ponto', 'id')) AS novo
+         FROM ponto x
+         WHERE x.projeto_id = %(origem)s
+      )""",
+      f"""pontos AS (
+         INSERT INTO ponto (id, projeto_id, {_lista(colunas_ponto)}) OVERRIDING SYSTEM VALUE
+         SELECT m.novo, p.id, {_lista(colunas_ponto, "x.")}
+         FROM ponto x
+         JOIN mapa_ponto m ON m.antigo = x.id
+         CROSS JOIN novo_projeto p
+         RETURNING 1
+      )""",
+      """mapa_trecho AS (
+         SELECT t.id AS antigo, nextval(pg_get_serial_sequence('trecho', 'id')) AS novo
+         FROM trecho t
+         WHERE t.projeto_id = %(origem)s
+      )""",
+      f"""trechos AS (
+         INSERT INTO trecho (id, projeto_id, {_lista(colunas_trecho)}) OVERRIDING SYSTEM VALUE
+         SELECT m.novo, p.id, {_selecao_trecho(colunas_trecho)}
+         FROM trecho t
+         JOIN mapa_trecho m ON m.antigo = t.id
+         LEFT JOIN mapa_ponto pi ON pi.antigo = t.ponto_inicio_id
+         LEFT JOIN mapa_ponto pf ON pf.antigo = t.ponto_fim_id
+         CROSS JOIN novo_projeto p
+         RETURNING 1
+      )""",
+      f"""trecho_pecas AS (
+         INSERT INTO trecho_peca (trecho_id, {_lista(colunas_trecho_peca)})
+         SELECT m.novo, {_lista(colunas_trecho_peca, "tp.")}
+         FROM trecho_peca tp
+         JOIN mapa_trecho m ON m.antigo = tp.trecho_id
+         RETURNING 1
+      )""",
+   ]
+   contagens = [
+      "(SELECT count(*) FROM pontos)",
+      "(SELECT count(*) FROM trechos)",
+      "(SELECT count(*) FROM trecho_pecas)",
+   ]
+
+   for tabela in TABELAS_PROJETO:
+      colunas = colunas_copiaveis(cur, tabela)
+      selecao, juncao = _selecao_tabela(tabela, colunas)
+      ctes.append(f"""{tabela}_novo AS (
+         INSERT INTO {tabela} (projeto_id, {_lista(colunas)})
+         SELECT p.id, {selecao}
+         FROM {tabela} x
+         {juncao}
+         CROSS JOIN novo_projeto p
+         WHERE x.projeto_id = %(origem)s
+         RETURNING 1
+      )""")
+      contagens.append(f"(SELECT count(*) FROM {tabela}_novo)")
+
+   return (
+      "WITH " + ",\n".join(ctes)
+      + f"\nSELECT (SELECT id FROM novo_projeto), {', '.join(contagens)}"
+   )
+
+def clonar_projeto(conn, origem, nome, descricao=None):
+   # Retorna (novo projeto_id, {tabela: linhas copiadas}); nao faz commit
+   with conn.cursor() as cur:
+      cur.execute(sql_clonar_projeto(cur), {"origem": origem, "nome": nome, "descricao": descricao})
+      row = cur.fetchone()
+   if row is None or row[0] is None:
+      raise ValueError(f"Projeto de origem {origem} nao encontrado")
+   tabelas = ("ponto", "trecho", "trecho_peca") + TABELAS_PROJETO
+   return row[0], dict(zip(tabelas, row[1:]))
+
+if __name__ == "__main__":
+   import sys
+   import psycopg as psy
+   from conectar import conectar_db
+
+   # python functions\clonar_projeto.py <projeto_id> "<novo nome>"
+   if len(sys.argv) < 3:
+      print('Uso: clonar_projeto.py <projeto_id> "<novo nome>"')
+      sys.exit(1)
+
+   conexao = conectar_db()
+   try:
+      with psy.connect(conexao[0]) as conn:
+         projeto_id, copiados = clonar_projeto(conn, int(sys.argv[1]), sys.argv[2])
+         conn.commit()
+      print(f'Projeto criado: {projeto_id}')
+      for tabela, linhas in copiados.items():
+         print(f'Copiando {linhas} linhas de {tabela}')
+   except Exception as e:
+      print(f"Erro ao clonar o projeto: {e}")
+      import traceback
+      traceback.print_exc()
@@ -1,14 +1,49 @@
 import os
+import re
 from dotenv import load_dotenv
 import psycopg as psy
+from psycopg.conninfo import make_conninfo
 load_dotenv()
+
+# Um schema por escritorio (inquilino) no mesmo banco; SCHEMA_NAME escolhe o schema
+# dos scripts e da interface. Nomes em minusculas para dispensar aspas no search_path
+PADRAO_SCHEMA = re.compile(r"^[a-z_][a-z0-9_]{0,62}$")
+
+def validar_schema(schema):
+   if not PADRAO_SCHEMA.match(schema or ""):
+      raise ValueError(f"Nome de schema invalido: {schema!r} (use letras minusculas, numeros e _)")
+   return schema
+
+def schema_configurado():
+   # None: search_path padrao do banco (public)
+   schema = (os.getenv('SCHEMA_NAME') or '').strip()
+   return validar_schema(schema) if schema else None
+
+def com_schema(conn_info, schema=None):
+   # search_path definido na abertura da conexao (parametro options), sem comando extra
+   schema = schema or schema_configurado()
+   if not schema:
+      return conn_info
+   return make_conninfo(conn_info, options=f"-c search_path={validar_schema(schema)}")
+
+def prepare_configurado():
+   # DB_PREPARE_THRESHOLD: execucoes de um comando antes de prepara-lo no servidor
+   # (padrao 0, ja na primeira). "desligado" nunca prepara: necessario atras do
+   # pgbouncer em modo transaction, que troca a conexao do servidor entre transacoes
+   valor = (os.getenv('DB_PREPARE_THRESHOLD') or '').strip().lower()
+   if not valor:
+      return 0
+   if valor in ('desligado', 'none'):
+      return None
+   return int(valor)
+
 def conectar_db():
    DB_NAME = os.getenv('DB_NAME')
    DB_USER = os.getenv('DB_USER')
    DB_PASSWORD = os.getenv('DB_PASSWORD')
    DB_HOST = os.getenv('DB_HOST')
 
-   conn_info = f"dbname={DB_NAME} user={DB_USER} password={DB_PASSWORD} host={DB_HOST}"
+   conn_info = com_schema(f"dbname={DB_NAME} user={DB_USER} password={DB_PASSWORD} host={DB_HOST}")
    try:
       with psy.connect(conn_info) as conn:
          print("Connected to database")
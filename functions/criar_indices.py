@@ -14,14 +14,17 @@ def indices_nomes(file_path):
       print(f"Erro ao ler o arquivo SQL: {e}")
       return None
 
-def criar_indices(conn_info, caminho_sql):
+def criar_indices(conn_info, caminho_sql, schema=None):
    import psycopg as psy
+   from psycopg import sql
    try:
       indices_arquivo = indices_nomes(caminho_sql) or []
       if not indices_arquivo:
          return []
       with psy.connect(conn_info) as conn:
          with conn.cursor() as cur:
+               if schema:
+                  cur.execute(sql.SQL("SET search_path TO {}").format(sql.Identifier(schema)))
                with open(caminho_sql, "r", encoding="utf-8") as f:
                   cur.execute(f.read())
                   # Indices existentes antes
@@ -30,7 +33,7 @@ def criar_indices(conn_info, caminho_sql):
                      indexname,
                      schemaname
                   FROM pg_indexes
-                  WHERE schemaname = 'public';""")
+                  WHERE schemaname = current_schema();""")
                criar_indices = {row[0] for row in cur.fetchall()}
 
                return list(criar_indices)
@@ -42,11 +45,11 @@ def criar_indices(conn_info, caminho_sql):
 
 if __name__ == "__main__":
    import re
-   from conectar import conectar_db
+   from conectar import conectar_db, schema_configurado
 
    file = r"sql\indices.sql"
    conexao = conectar_db()
-   criar_indices = criar_indices(conexao[0], file)
+   criar_indices = criar_indices(conexao[0], file, schema_configurado())
    for indice in criar_indices:
       print(f'Criando o indice: {indice}')
    
@@ -15,18 +15,26 @@ def tabelas_nomes(file_path):
       print(f"Erro ao ler o arquivo SQL: {e}")
       return None
 
-def criar_tabelas(conn_info, caminho_sql):
+def criar_tabelas(conn_info, caminho_sql, schema=None):
    import psycopg as psy
+   from psycopg import sql
+   from historico_calculo import preparar_particoes
    try:
       with psy.connect(conn_info) as conn:
          with conn.cursor() as cur:
+               # Schema do escritorio (inquilino): criado se preciso e usado por todo o script
+               if schema:
+                  cur.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(schema)))
+                  cur.execute(sql.SQL("SET search_path TO {}").format(sql.Identifier(schema)))
                with open(caminho_sql, "r", encoding="utf-8") as f:
                   cur.execute(f.read())
+               # Particoes de calculo dos proximos meses, fora das gravacoes
+               preparar_particoes(conn)
                # Tabelas existentes antes
                cur.execute("""
                   SELECT tablename
                   FROM pg_tables
-                  WHERE schemaname = 'public';""")
+                  WHERE schemaname = current_schema();""")
                criar_tabelas = {row[0] for row in cur.fetchall()}
 
                return list(criar_tabelas)
@@ -38,11 +46,11 @@ def criar_tabelas(conn_info, caminho_sql):
 
 if __name__ == "__main__":
    import re
-   from conectar import conectar_db
+   from conectar import conectar_db, schema_configurado
 
    file = r"sql\tabelas.sql"
    conexao = conectar_db()
-   criar_tabelas = criar_tabelas(conexao[0], file)
+   criar_tabelas = criar_tabelas(conexao[0], file, schema_configurado())
    for tabela in criar_tabelas:
       print(f'Criando a tabela: {tabela}')
    
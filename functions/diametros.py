@@ -0,0 +1,105 @@
+import bisect
+import re
+from fractions import Fraction
+
+# Diametro nominal numerico a partir dos textos do catalogo: "1/2", "1 1/4",
+# "2 1/2" (aco e cobre, em polegadas) ou "16", "20", "32" (PEX, em mm).
+# diametro_pol e a chave canonica (ordenacao, proximo diametro, tubo x peca do
+# mesmo material); diametro_mm e o nominal em mm (o proprio valor quando o
+# texto ja e metrico, senao polegadas * 25,4).
+
+MM_POR_POLEGADA = 25.4
+
+# Sem unidade no texto: acima disso o valor e lido como mm
+LIMITE_POLEGADAS = 12
+
+# Bitolas metricas (PEX/multicamada) e a polegada nominal equivalente
+EQUIVALENCIA_MM = {
+   16: 0.5,
+   20: 0.75,
+   25: 1.0,
+   26: 1.0,
+   32: 1.25,
+   40: 1.5,
+   50: 2.0,
+   63: 2.5,
+   75: 3.0,
+}
+
+_POLEGADAS = re.compile(r'("|polegadas?|pol\b|in\b)')
+_MM = re.compile(r"mm\b")
+_MISTO = re.compile(r"^(\d+)[\s.\-]+(\d+/\d+)$")
+
+def diametro_numerico(texto):
+   # (mm, pol) do texto nominal; ValueError se nao for um diametro
+   original = texto
+   texto = str(texto).strip().lower().replace(",", ".")
+   metrico = bool(_MM.search(texto))
+   em_polegadas = bool(_POLEGADAS.search(texto))
+   texto = " ".join(_MM.sub(" ", _POLEGADAS.sub(" ", texto)).split())
+   try:
+      misto = _MISTO.match(texto)
+      if misto:
+         valor = int(misto.group(1)) + Fraction(misto.group(2))
+      else:
+         valor = Fraction(texto)
+   except (ValueError, ZeroDivisionError):
+      raise ValueError(f"Diametro invalido: {original}") from None
+   if valor <= 0:
+      raise ValueError(f"Diametro invalido: {original}")
+
+   if not metrico and (em_polegadas or "/" in texto or valor <= LIMITE_POLEGADAS):
+      pol = float(valor)
+      return round(pol * MM_POR_POLEGADA, 2), round(pol, 4)
+   mm = float(valor)
+   pol = EQUIVALENCIA_MM.get(mm, mm / MM_POR_POLEGADA)
+   return round(mm, 2), round(pol, 4)
+
+def polegadas(texto):
+   # Chave canonica para comparar diametros digitados de formas diferentes; None se invalido
+   try:
+      return diametro_numerico(texto)[1]
+   except ValueError:
+      return None
+
+def proximo_diametro(ordenados, valor, estrito=True):
+   # Posicao do primeiro diametro > valor (>= com estrito=False) em uma lista ordenada; None no fim
+   posicao = (bisect.bisect_right if estrito else bisect.bisect_left)(ordenados, valor)
+   return posicao if posicao < len(ordenados) else None
+
+# Consultas pelo indice (material_id, diametro_pol) de tubo e peca
+
+SQL_PROXIMO_TUBO = """
+   SELECT id, diametro_nominal, diametro_interno, diametro_mm, diametro_pol
+   FROM tubo
+   WHERE material_id = %s AND diametro_pol > %s
+   ORDER BY diametro_pol
+   LIMIT 1"""
+
+SQL_TUBOS_FAIXA = """
+   SELECT id, diametro_nominal, diametro_interno, diametro_mm, diametro_pol
+   FROM tubo
+   WHERE material_id = %s AND diametro_pol BETWEEN %s AND %s
+   ORDER BY diametro_pol"""
+
+def proximo_tubo(conn, material_id, diametro_pol):
+   # Tubo imediatamente maior do mesmo material; None se ja e o maior
+   with conn.cursor() as cur:
+      cur.execute(SQL_PROXIMO_TUBO, (material_id, diametro_pol))
+      return cur.fetchone()
+
+def tubos_faixa(conn, material_id, minimo_pol, maximo_pol):
+   with conn.cursor() as cur:
+      cur.execute(SQL_TUBOS_FAIXA, (material_id, minimo_pol, maximo_pol))
+      return cur.fetchall()
+
+if __name__ == "__main__":
+   import sys
+
+   # python functions\diametros.py "1 1/4" 32 "3/4\""
+   for texto in sys.argv[1:] or ["1/2", "1 1/4", "2 1/2", "16", "32", "25 mm", '3/4"']:
+      try:
+         mm, pol = diametro_numerico(texto)
+         print(f"{texto:>8} -> {mm:7.2f} mm  {pol:.4g} pol")
+      except ValueError as e:
+         print(e)
@@ -0,0 +1,211 @@
+import re
+
+import numpy as np
+
+from acesso_dados import COLUNAS_CRITERIO, CRITERIOS_PADRAO
+from calculos import PCI_GLP_M3, calcular_trecho, fator_simultaneidade, potencia_adotada
+from historico_calculo import registrar_execucao
+from rastreamento import RASTREADOR, rastreado
+from rede import REDES, carregar_rede
+from unidades import potencia_computada
+
+# Dimensionamento com simetria: em torres residenciais a mesma instalacao de
+# apartamento se repete dezenas ou centenas de vezes. Os trechos sao agrupados
+# em unidades, unidades com a mesma geometria (tubo, comprimento, desnivel e
+# pecas de cada trecho) formam uma classe, e cada classe e calculada uma vez
+# so; o resultado do representante e replicado para todas as instancias.
+#
+# A unidade de um trecho vem do parametro unidades ({trecho_id: unidade}) ou
+# do prefixo do nome no levantamento: "AP101/A-B", "101:A-B". Trechos sem
+# unidade ficam cada um em uma unidade propria (e ainda se agrupam quando
+# identicos). Os criterios e a vazao sao os do projeto: a mesma para todas
+# as unidades da rede.
+
+PADRAO_UNIDADE = re.compile(r"^\s*(?P<unidade>[^/:]+?)\s*[/:]\s*(?P<local>.+?)\s*$")
+
+CASAS_ASSINATURA = 4
+
+def separar_unidade(nome):
+   # "AP101/A-B" -> ("AP101", "A-B"); sem prefixo -> (None, nome)
+   encontrado = PADRAO_UNIDADE.match(str(nome))
+   if encontrado:
+      return encontrado.group("unidade"), encontrado.group("local")
+   return None, str(nome).strip()
+
+def agrupar_unidades(rede, selecao, unidades=None):
+   # {chave da unidade: [(trecho local, posicao na rede), ...]} ordenado pelo trecho local
+   unidades = unidades or {}
+   grupos = {}
+   for i in np.flatnonzero(selecao).tolist():
+      trecho_id = int(rede.trecho_id[i])
+      nome = str(rede.nome[i]) if rede.nome is not None else str(trecho_id)
+      unidade, local = separar_unidade(nome)
+      if trecho_id in unidades:
+         unidade, local = unidades[trecho_id], nome
+      chave = ("unidade", int(rede.rede[i]), unidade) if unidade is not None else ("trecho", trecho_id)
+      grupos.setdefault(chave, []).append((local if unidade is not None else "", i))
+   for trechos in grupos.values():
+      trechos.sort()
+   return grupos
+
+def assinatura_unidade(rede, trechos):
+   # Geometria da unidade: identica -> mesmo resultado para os mesmos criterios e vazao
+   assinatura = []
+   for local, i in trechos:
+      peca_id, qtde = rede.pecas(i)
+      pecas = tuple(sorted(zip(peca_id.tolist(), qtde.tolist())))
+      assinatura.append((
+         local,
+         int(rede.rede[i]),
+         int(rede.tubo_id[i]),
+         round(float(rede.lreal[i]), CASAS_ASSINATURA),
+         round(float(rede.delta_h[i]), CASAS_ASSINATURA),
+         pecas,
+      ))
+   return tuple(assinatura)
+
+def classes_simetria(rede, selecao, unidades=None):
+   # Devolve (representante, classes): representante[i] e a posicao do trecho calculado
+   # no lugar do trecho i (-1 fora da selecao); classes = [[unidade, ...], ...]
+   representante = np.full(len(rede), -1, dtype=np.int64)
+   classes = {}
+   for chave, trechos in agrupar_unidades(rede, selecao, unidades).items():
+      classes.setdefault(assinatura_unidade(rede, trechos), []).append((chave, trechos))
+   for instancias in classes.values():
+      posicoes_base = np.array([i for _, i in instancias[0][1]], dtype=np.int64)
+      for _, trechos in instancias:
+         representante[[i for _, i in trechos]] = posicoes_base
+   return representante, [[chave for chave, _ in instancias] for instancias in classes.values()]
+
+def calcular_simetrico(rede, selecao, potencia, criterios, unidades=None, cache=None):
+   # potencia em kcal/h por trecho da selecao; criterios no formato de criterio_projeto.
+   # Retorna (resultados no formato de historico_calculo.COLUNAS_RESULTADO, resumo)
+   selecao = selecao & ~np.isnan(rede.diametro_interno)
+   representante, classes = classes_simetria(rede, selecao, unidades)
+   distintos = np.unique(representante[selecao])
+   calcular = cache.trecho if cache is not None else calcular_trecho
+
+   calculados = {}
+   with RASTREADOR.intervalo("calcular_classes", "calculo", trechos=len(distintos)):
+      for i in distintos.tolist():
+         inicio, fim = rede.offsets[i], rede.offsets[i + 1]
+         pecas = list(zip(
+            rede.catalogo_leqv[rede.peca[inicio:fim]].tolist(),
+            rede.qtde[inicio:fim].tolist(),
+         ))
+         calculados[i] = calcular(
+            potencia,
+            float(rede.diametro_interno[i]),
+            float(rede.lreal[i]),
+            float(rede.delta_h[i]),
+            pecas,
+            criterios["pressao_operacao"],
+            criterios["densidade_relativa"],
+            criterios["vel_maxima"],
+            criterios["perda_carga_maxima"],
+         )
+
+   # Replica o resultado do representante para cada instancia
+   resultados = []
+   for i in np.flatnonzero(selecao).tolist():
+      base = int(representante[i])
+      resultado = dict(calculados[base])
+      resultado["trecho_id"] = int(rede.trecho_id[i])
+      if base != i:
+         resultado["observacao"] = f"simetria: igual ao trecho {int(rede.trecho_id[base])}"
+      resultados.append(resultado)
+   resumo = {
+      "trechos": len(resultados),
+      "unidades": sum(len(c) for c in classes),
+      "classes": len(classes),
+      "calculados": len(distintos),
+   }
+   return resultados, resumo
+
+# Banco
+
+def carregar_criterios(conn, projeto_id):
+   with conn.cursor() as cur:
+      cur.execute(
+         f"SELECT {', '.join(COLUNAS_CRITERIO)} FROM criterio_projeto WHERE projeto_id = %s",
+         (projeto_id,),
+      )
+      row = cur.fetchone()
+   if row is None:
+      return dict(CRITERIOS_PADRAO)
+   return {c: (float(v) if c != "observacao" else v) for c, v in zip(COLUNAS_CRITERIO, row)}
+
+@rastreado("calculo")
+def dimensionar_projeto(conn, projeto_id, vazao_unidade=None, unidades=None, cache=None, gravar=True,
+                        substituir=False):
+   # Rede primaria com a potencia adotada do projeto; rede secundaria com a vazao
+   # por unidade (m3/h), quando informada. Grava uma execucao em calculo; com
+   # substituir=True os resultados anteriores dos trechos calculados sao apagados.
+   criterios = carregar_criterios(conn, projeto_id)
+   rede = carregar_rede(conn, [projeto_id])
+   pot = potencia_computada(conn, projeto_id)
+   redes = {"primaria": potencia_adotada(pot, fator_simultaneidade(pot)) * 60}
+   if vazao_unidade:
+      redes["secundaria"] = vazao_unidade * PCI_GLP_M3
+
+   resultados = []
+   resumo = {}
+   for nome_rede, potencia in redes.items():
+      parciais, resumo[nome_rede] = calcular_simetrico(
+         rede, rede.mascara(nome_rede), potencia, criterios, unidades, cache
+      )
+      resultados.extend(parciais)
+
+   execucao_id = None
+   if gravar and resultados:
+      parametros = {
+         "criterios": {c: criterios[c] for c in COLUNAS_CRITERIO if c != "observacao"},
+         "pot_computada": pot,
+         "vazao_unidade": vazao_unidade,
+         "simetria": resumo,
+      }
+      execucao_id = registrar_execucao(conn, projeto_id, parametros, resultados, substituir=substituir)
+      if cache is not None:
+         cache.gravar()
+   return execucao_id, resumo
+
+if __name__ == "__main__":
+   import sys
+   import time
+   import psycopg as psy
+   from cache_calculo import CacheCalculo
+   from conectar import conectar_db
+
+   # python functions\dimensionamento.py <projeto_id> [vazao por unidade m3/h] [--substituir]
+   substituir = "--substituir" in sys.argv
+   argumentos = [a for a in sys.argv[1:] if a != "--substituir"]
+   if not argumentos:
+      print("Uso: dimensionamento.py <projeto_id> [vazao_unidade] [--substituir]")
+      sys.exit(1)
+
+   conexao = conectar_db()
+   try:
+      with psy.connect(conexao[0]) as conn:
+         inicio = time.perf_counter()
+         cache = CacheCalculo().usar(conn)
+         execucao_id, resumo = dimensionar_projeto(
+            conn,
+            int(argumentos[0]),
+            float(argumentos[1]) if len(argumentos) > 1 else None,
+            cache=cache,
+            substituir=substituir,
+         )
+         conn.commit()
+      print(f"Execucao {execucao_id} em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+      for nome_rede in REDES:
+         if nome_rede in resumo:
+            r = resumo[nome_rede]
+            print(f"{nome_rede:<10} {r['trechos']:>6} trechos em {r['unidades']} unidades, "
+                  f"{r['classes']} classes, {r['calculados']} calculados")
+      e = cache.estatisticas()
+      print(f"cache: {e['acertos_memoria'] + e['acertos_banco']} acertos, {e['falhas']} calculados "
+            f"({e['taxa_acerto']:.1%})")
+   except Exception as e:
+      print(f"Erro ao dimensionar o projeto: {e}")
+      import traceback
+      traceback.print_exc()
@@ -0,0 +1,448 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import psycopg as psy
+
+from acesso_dados import COLUNAS_CRITERIO, CRITERIOS_PADRAO, executar_alteracoes
+from autonomia import carregar_central
+from historico_calculo import ultimos_calculos
+from rastreamento import rastreado
+from rede import carregar_rede
+from reguladores import reguladores_projeto
+from unidades import potencia_computada
+
+# Espelho local (SQLite) dos catalogos e dos projetos abertos recentemente.
+# Sincroniza de forma incremental pelo updated_at do projeto (mantido por
+# trigger, sql/tabelas.sql), serve as leituras localmente e guarda as
+# alteracoes feitas sem conexao em uma fila enviada na proxima sincronizacao.
+
+CAMINHO_PADRAO = os.path.join(os.path.expanduser("~"), ".glp_sizer", "espelho.sqlite3")
+
+# Tabela de catalogo -> coluna de ordenacao
+CATALOGOS = {
+   "material": "id",
+   "tubo": "id",
+   "peca": "id",
+   "cilindro": "id",
+   "regulador": "id",
+   "equipamento": "id",
+   "unidade_potencia": "unidade",
+}
+
+# Margem sobre a marca d'agua: now() e o inicio da transacao, que pode
+# confirmar depois de outra com horario posterior
+MARGEM_SINCRONIZACAO = timedelta(minutes=1)
+
+MAXIMO_SNAPSHOTS = 20
+
+# Formato dos dados do snapshot; snapshots de outra versao sao buscados de novo
+VERSAO_SNAPSHOT = 3
+
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S.%f"
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS catalogo(
+   tabela TEXT PRIMARY KEY,
+   hash TEXT NOT NULL,
+   colunas TEXT NOT NULL,
+   linhas TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS projeto(
+   id INTEGER PRIMARY KEY,
+   nome TEXT NOT NULL,
+   descricao TEXT,
+   created_at TEXT NOT NULL,
+   updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS snapshot(
+   projeto_id INTEGER PRIMARY KEY,
+   updated_at TEXT NOT NULL,
+   aberto_em TEXT NOT NULL,
+   dados TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS fila_escrita(
+   id INTEGER PRIMARY KEY AUTOINCREMENT,
+   projeto_id INTEGER NOT NULL,
+   projeto TEXT NOT NULL,
+   criterios TEXT NOT NULL,
+   criterios_existem INTEGER NOT NULL,
+   criado_em TEXT NOT NULL,
+   base_updated_at TEXT, -- updated_at do projeto em que a edicao se baseou; NULL sobrescreve
+   estado TEXT NOT NULL DEFAULT 'pendente', -- pendente, conflito ou falhou
+   erro TEXT
+);
+"""
+
+# Colunas da fila acrescentadas depois: espelhos antigos recebem-nas na abertura
+COLUNAS_FILA = {
+   "base_updated_at": "TEXT",
+   "estado": "TEXT NOT NULL DEFAULT 'pendente'",
+   "erro": "TEXT",
+}
+
+ESTADOS_REJEITADOS = ("conflito", "falhou")
+
+def _texto_data(valor):
+   return valor.strftime(FORMATO_DATA)
+
+def _agora():
+   return _texto_data(datetime.now())
+
+def _json(valor):
+   return json.dumps(valor, ensure_ascii=True, default=str)
+
+class EspelhoLocal:
+   def __init__(self, caminho=None, **kwargs):
+      # kwargs vao para sqlite3.connect (ex.: check_same_thread=False no teste de carga)
+      self.caminho = caminho or CAMINHO_PADRAO
+      pasta = os.path.dirname(self.caminho)
+      if pasta:
+         os.makedirs(pasta, exist_ok=True)
+      self.db = sqlite3.connect(self.caminho, **kwargs)
+      self.db.executescript(ESQUEMA)
+      existentes = {row[1] for row in self.db.execute("PRAGMA table_info(fila_escrita)")}
+      for coluna, tipo in COLUNAS_FILA.items():
+         if coluna not in existentes:
+            self.db.execute(f"ALTER TABLE fila_escrita ADD COLUMN {coluna} {tipo}")
+      self.db.commit()
+
+   def fechar(self):
+      self.db.close()
+
+   # Sincronizacao
+
+   @rastreado("banco")
+   def sincronizar(self, conn):
+      # conn de acesso_dados.conectar (autocommit): cada item da fila e uma transacao
+      enviadas = self.enviar_fila(conn)
+      catalogos = self.sincronizar_catalogos(conn)
+      projetos = self.sincronizar_projetos(conn)
+      return {"enviadas": enviadas, "catalogos": catalogos, "projetos": projetos}
+
+   def sincronizar_catalogos(self, conn):
+      # Compara o hash de cada tabela no servidor e traz apenas as que mudaram
+      locais = dict(self.db.execute("SELECT tabela, hash FROM catalogo"))
+      with conn.cursor() as cur:
+         cur.execute(" UNION ALL ".join(
+            f"SELECT '{tabela}', md5(coalesce(string_agg(t::text, ';' ORDER BY t.{chave}), '')) FROM {tabela} t"
+            for tabela, chave in CATALOGOS.items()
+         ))
+         remotos = cur.fetchall()
+         alteradas = []
+         for tabela, hash_remoto in remotos:
+            if locais.get(tabela) == hash_remoto:
+               continue
+            cur.execute(f"SELECT * FROM {tabela} ORDER BY {CATALOGOS[tabela]}")
+            colunas = [c.name for c in cur.description]
+            self.db.execute(
+               "INSERT OR REPLACE INTO catalogo (tabela, hash, colunas, linhas) VALUES (?, ?, ?, ?)",
+               (tabela, hash_remoto, _json(colunas), _json(cur.fetchall())),
+            )
+            alteradas.append(tabela)
+      self.db.commit()
+      return alteradas
+
+   def sincronizar_projetos(self, conn):
+      # Traz os projetos alterados desde a ultima sincronizacao e remove os apagados
+      marca = self.db.execute("SELECT max(updated_at) FROM projeto").fetchone()[0]
+      desde = datetime.strptime(marca, FORMATO_DATA) - MARGEM_SINCRONIZACAO if marca else datetime.min
+      with conn.cursor() as cur:
+         cur.execute(
+            """
+            SELECT id, nome, descricao, created_at, updated_at
+            FROM projeto
+            WHERE updated_at > %s
+            """,
+            (desde,),
+         )
+         alterados = cur.fetchall()
+         cur.execute("SELECT id FROM projeto")
+         existentes = {row[0] for row in cur.fetchall()}
+
+      self.db.executemany(
+         "INSERT OR REPLACE INTO projeto (id, nome, descricao, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+         [(pid, nome, descricao, _texto_data(criado), _texto_data(alterado))
+          for pid, nome, descricao, criado, alterado in alterados],
+      )
+      locais = {row[0] for row in self.db.execute("SELECT id FROM projeto")}
+      apagados = [(pid,) for pid in locais - existentes]
+      self.db.executemany("DELETE FROM projeto WHERE id = ?", apagados)
+      self.db.executemany("DELETE FROM snapshot WHERE projeto_id = ?", apagados)
+      self.db.commit()
+      return len(alterados)
+
+   # Leitura
+
+   def projetos(self):
+      # [(id, nome, descricao, created_at)] como na listagem da interface
+      return [
+         (pid, nome, descricao, datetime.strptime(criado, FORMATO_DATA))
+         for pid, nome, descricao, criado in self.db.execute(
+            "SELECT id, nome, descricao, created_at FROM projeto ORDER BY created_at DESC"
+         )
+      ]
+
+   def catalogo(self, tabela):
+      row = self.db.execute("SELECT colunas, linhas FROM catalogo WHERE tabela = ?", (tabela,)).fetchone()
+      if row is None:
+         return [], []
+      return json.loads(row[0]), [tuple(linha) for linha in json.loads(row[1])]
+
+   def abrir_projeto(self, projeto_id, obter_conexao=None):
+      # Com conexao (obter_conexao devolve uma conexao psycopg), confere o
+      # updated_at do projeto no servidor (uma consulta pela chave primaria):
+      # igual ao do snapshot, serve o snapshot local; senao busca de novo.
+      # Sem conexao, serve o ultimo snapshot guardado, mesmo desatualizado.
+      row = self.db.execute(
+         "SELECT dados, updated_at FROM snapshot WHERE projeto_id = ?",
+         (projeto_id,),
+      ).fetchone()
+      if row is not None and json.loads(row[0]).get("versao") != VERSAO_SNAPSHOT:
+         row = None
+      if row is not None and obter_conexao is None:
+         return self._servir_snapshot(projeto_id, row[0])
+      if obter_conexao is None:
+         raise LookupError(f"Projeto {projeto_id} nao esta no espelho local")
+      try:
+         with obter_conexao() as conn:
+            if row is not None:
+               servidor = conn.execute("SELECT updated_at FROM projeto WHERE id = %s", (projeto_id,)).fetchone()
+               if servidor is not None and _texto_data(servidor[0]) == row[1]:
+                  return self._servir_snapshot(projeto_id, row[0])
+            return self.atualizar_snapshot(conn, projeto_id)
+      except LookupError:
+         raise
+      except Exception:
+         if row is None:
+            raise
+         return json.loads(row[0])
+
+   def _servir_snapshot(self, projeto_id, dados):
+      self.db.execute("UPDATE snapshot SET aberto_em = ? WHERE projeto_id = ?", (_agora(), projeto_id))
+      self.db.commit()
+      return json.loads(dados)
+
+   @rastreado("banco")
+   def atualizar_snapshot(self, conn, projeto_id):
+      with conn.cursor() as cur:
+         # updated_at lido antes dos dados: uma escrita concorrente so deixa o
+         # snapshot mais novo que a marca, e ele e buscado de novo na proxima vez
+         cur.execute(
+            "SELECT nome, descricao, created_at, updated_at FROM projeto WHERE id = %s",
+            (projeto_id,),
+         )
+         projeto = cur.fetchone()
+         if projeto is None:
+            self.descartar(projeto_id)
+            raise LookupError(f"Projeto {projeto_id} nao encontrado")
+         cur.execute(
+            f"SELECT {', '.join(COLUNAS_CRITERIO)} FROM criterio_projeto WHERE projeto_id = %s",
+            (projeto_id,),
+         )
+         criterios = cur.fetchone()
+      nome, descricao, criado, alterado = projeto
+      dados = {
+         "versao": VERSAO_SNAPSHOT,
+         "id": projeto_id,
+         "nome": nome,
+         "descricao": descricao,
+         "criterios": dict(zip(COLUNAS_CRITERIO, criterios)) if criterios else None,
+         "pot_computada": potencia_computada(conn, projeto_id),
+         "cilindros": carregar_central(conn, projeto_id),
+         "rede": carregar_rede(conn, [projeto_id]).para_dict(),
+         "calculos": ultimos_calculos(conn, projeto_id),
+         "reguladores": reguladores_projeto(conn, projeto_id),
+      }
+      texto = _json(dados)
+      self.db.execute(
+         "INSERT OR REPLACE INTO projeto (id, nome, descricao, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+         (projeto_id, nome, descricao, _texto_data(criado), _texto_data(alterado)),
+      )
+      self.db.execute(
+         "INSERT OR REPLACE INTO snapshot (projeto_id, updated_at, aberto_em, dados) VALUES (?, ?, ?, ?)",
+         (projeto_id, _texto_data(alterado), _agora(), texto),
+      )
+      self.db.execute(
+         """
+         DELETE FROM snapshot WHERE projeto_id NOT IN (
+            SELECT projeto_id FROM snapshot ORDER BY aberto_em DESC LIMIT ?
+         )
+         """,
+         (MAXIMO_SNAPSHOTS,),
+      )
+      self.db.commit()
+      # Mesmo formato da leitura local (tuplas viram listas, datas viram texto)
+      return json.loads(texto)
+
+   def descartar(self, projeto_id):
+      self.db.execute("DELETE FROM snapshot WHERE projeto_id = ?", (projeto_id,))
+      self.db.commit()
+
+   # Escrita
+
+   def enfileirar_alteracoes(self, projeto_id, projeto, criterios, criterios_existem=True):
+      # Mesmos argumentos de salvar_alteracoes; a copia local ja reflete a alteracao.
+      # A base e o updated_at conhecido do projeto, conferido no envio
+      row = self.db.execute("SELECT updated_at FROM projeto WHERE id = ?", (projeto_id,)).fetchone()
+      self.db.execute(
+         """
+         INSERT INTO fila_escrita (projeto_id, projeto, criterios, criterios_existem, criado_em, base_updated_at)
+         VALUES (?, ?, ?, ?, ?, ?)
+         """,
+         (projeto_id, _json(projeto), _json(criterios), int(criterios_existem), _agora(), row[0] if row else None),
+      )
+      self.aplicar_alteracoes(projeto_id, projeto, criterios, criterios_existem)
+
+   def aplicar_alteracoes(self, projeto_id, projeto, criterios, criterios_existem=True, updated_at=None):
+      # Copia local apos salvar; o snapshot e buscado de novo quando o
+      # updated_at do servidor chegar na proxima sincronizacao. updated_at
+      # (retorno de salvar_alteracoes) vira a base das proximas edicoes offline
+      if projeto:
+         colunas = sorted(projeto)
+         self.db.execute(
+            f"UPDATE projeto SET {', '.join(f'{c} = ?' for c in colunas)} WHERE id = ?",
+            [projeto[c] for c in colunas] + [projeto_id],
+         )
+      if updated_at is not None:
+         self.db.execute("UPDATE projeto SET updated_at = ? WHERE id = ?", (_texto_data(updated_at), projeto_id))
+      row = self.db.execute("SELECT dados FROM snapshot WHERE projeto_id = ?", (projeto_id,)).fetchone()
+      if row is not None:
+         dados = json.loads(row[0])
+         dados.update(projeto)
+         if criterios or not criterios_existem:
+            dados["criterios"] = {**(dados["criterios"] or CRITERIOS_PADRAO), **criterios}
+         self.db.execute("UPDATE snapshot SET dados = ? WHERE projeto_id = ?", (_json(dados), projeto_id))
+      self.db.commit()
+
+   def pendentes(self):
+      return self.db.execute("SELECT count(*) FROM fila_escrita WHERE estado = 'pendente'").fetchone()[0]
+
+   def rejeitadas(self):
+      # [(item_id, projeto_id, estado, erro, criado_em)] que nao foram aplicados no servidor
+      return self.db.execute(
+         f"""
+         SELECT id, projeto_id, estado, erro, criado_em
+         FROM fila_escrita
+         WHERE estado IN ({", ".join("?" * len(ESTADOS_REJEITADOS))})
+         ORDER BY id
+         """,
+         ESTADOS_REJEITADOS,
+      ).fetchall()
+
+   def resolver_rejeitada(self, item_id, reenviar=False):
+      # reenviar: volta para a fila sem base, sobrescrevendo o servidor; senao descarta
+      if reenviar:
+         self.db.execute(
+            "UPDATE fila_escrita SET estado = 'pendente', erro = NULL, base_updated_at = NULL WHERE id = ?",
+            (item_id,),
+         )
+      else:
+         self.db.execute("DELETE FROM fila_escrita WHERE id = ?", (item_id,))
+      self.db.commit()
+
+   def _restaurar_projeto(self, projeto_id, servidor):
+      # Item rejeitado: a copia local volta a do servidor (a edicao fica no item)
+      if servidor is not None:
+         nome, descricao, criado, alterado = servidor
+         self.db.execute(
+            "INSERT OR REPLACE INTO projeto (id, nome, descricao, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (projeto_id, nome, descricao, _texto_data(criado), _texto_data(alterado)),
+         )
+      self.db.execute("DELETE FROM snapshot WHERE projeto_id = ?", (projeto_id,))
+
+   @rastreado("banco")
+   def enviar_fila(self, conn):
+      # Em ordem; cada item so sai da fila depois de confirmado no servidor.
+      # Apenas as colunas alteradas sao enviadas, e so se o projeto nao mudou
+      # no servidor depois da base da edicao; senao o item vira conflito. Erro
+      # definitivo (ex.: nome repetido) vira falha. Os dois ficam guardados com
+      # o motivo e o restante da fila segue; erro de conexao interrompe o envio.
+      enviadas = 0
+      fila = self.db.execute(
+         """
+         SELECT id, projeto_id, projeto, criterios, criterios_existem
+         FROM fila_escrita
+         WHERE estado = 'pendente'
+         ORDER BY id
+         """
+      ).fetchall()
+      for item_id, projeto_id, projeto, criterios, criterios_existem in fila:
+         # A base pode ter avancado com o envio de um item anterior do mesmo projeto
+         base = self.db.execute("SELECT base_updated_at FROM fila_escrita WHERE id = ?", (item_id,)).fetchone()[0]
+         servidor = nova_base = None
+         estado, erro = "enviada", None
+         try:
+            with conn.transaction(), conn.cursor() as cur:
+               cur.execute(
+                  "SELECT nome, descricao, created_at, updated_at FROM projeto WHERE id = %s FOR UPDATE",
+                  (projeto_id,),
+               )
+               servidor = cur.fetchone()
+               if servidor is None:
+                  # Projeto apagado no servidor: a alteracao e descartada
+                  estado = "apagado"
+               elif base is not None and servidor[3] > datetime.strptime(base, FORMATO_DATA):
+                  estado = "conflito"
+                  erro = (f"Projeto alterado no servidor em {_texto_data(servidor[3])}, "
+                          f"depois da base da edicao offline ({base})")
+               else:
+                  executar_alteracoes(
+                     cur, projeto_id, json.loads(projeto), json.loads(criterios), bool(criterios_existem)
+                  )
+                  cur.execute("SELECT updated_at FROM projeto WHERE id = %s", (projeto_id,))
+                  nova_base = cur.fetchone()[0]
+         except psy.OperationalError:
+            raise
+         except (psy.Error, ValueError) as e:
+            estado, erro = "falhou", str(e).strip()
+
+         if estado == "enviada":
+            enviadas += 1
+            self.db.execute("DELETE FROM fila_escrita WHERE id = ?", (item_id,))
+            self.db.execute(
+               """
+               UPDATE fila_escrita SET base_updated_at = ?
+               WHERE projeto_id = ? AND estado = 'pendente' AND base_updated_at = ?
+               """,
+               (_texto_data(nova_base), projeto_id, base),
+            )
+         elif estado == "apagado":
+            self.db.execute("DELETE FROM fila_escrita WHERE id = ?", (item_id,))
+         else:
+            self.db.execute("UPDATE fila_escrita SET estado = ?, erro = ? WHERE id = ?", (estado, erro, item_id))
+            self._restaurar_projeto(projeto_id, servidor)
+         self.db.commit()
+      return enviadas
+
+if __name__ == "__main__":
+   import sys
+   import time
+   from acesso_dados import conectar
+   from conectar import conectar_db
+
+   # python functions\espelho_local.py [projeto_id] [caminho.sqlite3]
+   conexao = conectar_db()
+   espelho = EspelhoLocal(sys.argv[2] if len(sys.argv) > 2 else None)
+   try:
+      with conectar(conexao[0]) as conn:
+         resumo = espelho.sincronizar(conn)
+      print(f'Fila enviada: {resumo["enviadas"]}, catalogos atualizados: {", ".join(resumo["catalogos"]) or "nenhum"}')
+      print(f'Projetos atualizados: {resumo["projetos"]}, no espelho: {len(espelho.projetos())}')
+      if len(sys.argv) > 1:
+         projeto_id = int(sys.argv[1])
+         espelho.descartar(projeto_id)
+         for origem in ("servidor", "espelho"):
+            inicio = time.perf_counter()
+            dados = espelho.abrir_projeto(projeto_id, lambda: conectar(conexao[0]))
+            print(f'{dados["nome"]} aberto ({origem}) em {(time.perf_counter() - inicio) * 1000:.2f} ms')
+   except Exception as e:
+      print(f"Erro na sincronizacao do espelho local: {e}")
+      import traceback
+      traceback.print_exc()
+   finally:
+      espelho.fechar()
@@ -0,0 +1,379 @@
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from psycopg_pool import ConnectionPool
+
+from cache_calculo import CacheCalculo
+from dimensionamento import dimensionar_projeto
+from historico_calculo import preparar_particoes
+from rastreamento import rastreado
+from reguladores import selecionar_reguladores
+
+# Fila de recalculo no proprio banco (tarefa_calculo), sem broker externo:
+# depois de uma mudanca de catalogo ou de norma, todos os projetos sao
+# enfileirados e varios trabalhadores (processos, em uma ou mais maquinas)
+# reservam lotes com FOR UPDATE SKIP LOCKED, de modo que dois trabalhadores
+# nunca pegam a mesma tarefa nem esperam um pelo outro.
+#
+# Cada tarefa roda em uma transacao propria: o resultado e a marca de
+# concluida sao gravados juntos. Uma thread por trabalhador atualiza o
+# heartbeat das tarefas em execucao; tarefas com heartbeat vencido (processo
+# morto, maquina desligada) voltam para a fila. Falhas voltam com espera
+# exponencial ate max_tentativas. Os contadores de cada trabalhador ficam em
+# trabalhador_calculo para acompanhar a vazao e escalar horizontalmente.
+# Cada trabalhador tem um CacheCalculo: trechos iguais entre projetos do
+# mesmo modelo sao calculados uma vez.
+
+TAMANHO_LOTE = 20
+INTERVALO_HEARTBEAT = 10 # s
+HEARTBEAT_VENCIDO = 60 # s sem heartbeat: a tarefa volta para a fila
+ESPERA_BASE = 30 # s; nova tentativa em ESPERA_BASE * 2^(tentativas - 1)
+ESPERA_FILA_VAZIA = 5 # s
+
+ESTADOS = ("pendente", "executando", "concluida", "falhou")
+
+# Executores por tipo de tarefa: (conn, projeto_id, parametros, cache) -> (execucao_id, trechos)
+
+def vazao_unidade_anterior(conn, projeto_id):
+   # Vazao por unidade do ultimo dimensionamento gravado (idx_execucao_calculo_projeto)
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         SELECT (parametros->>'vazao_unidade')::float8
+         FROM execucao_calculo
+         WHERE projeto_id = %s
+         ORDER BY executado_em DESC, id DESC
+         LIMIT 1
+         """,
+         (projeto_id,),
+      )
+      row = cur.fetchone()
+   return row[0] if row else None
+
+def _dimensionar(conn, projeto_id, parametros, cache=None):
+   vazao_unidade = parametros.get("vazao_unidade") or vazao_unidade_anterior(conn, projeto_id)
+   execucao_id, resumo = dimensionar_projeto(
+      conn, projeto_id, vazao_unidade, cache=cache, substituir=parametros.get("substituir", True)
+   )
+   return execucao_id, sum(r["trechos"] for r in resumo.values())
+
+def _reguladores(conn, projeto_id, parametros, cache=None):
+   selecionados, _ = selecionar_reguladores(conn, projeto_id)
+   return None, len(selecionados)
+
+EXECUTORES = {
+   "dimensionar": _dimensionar,
+   "reguladores": _reguladores,
+}
+
+# Fila
+
+@rastreado("banco")
+def enfileirar(conn, projeto_ids=None, tipo="dimensionar", parametros=None, lote="", max_tentativas=3):
+   # Uma tarefa por projeto (todos com projeto_ids=None) em um unico INSERT ... SELECT;
+   # projetos que ja tem tarefa ativa do mesmo tipo sao ignorados. Nao faz commit
+   if tipo not in EXECUTORES:
+      raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         INSERT INTO tarefa_calculo (projeto_id, tipo, parametros, lote, max_tentativas)
+         SELECT p.id, %(tipo)s, %(parametros)s, %(lote)s, %(max_tentativas)s
+         FROM projeto p
+         WHERE %(projeto_ids)s::int[] IS NULL OR p.id = ANY(%(projeto_ids)s::int[])
+         ORDER BY p.id
+         ON CONFLICT (projeto_id, tipo) WHERE estado IN ('pendente', 'executando') DO NOTHING
+         """,
+         {
+            "tipo": tipo,
+            "parametros": json.dumps(parametros or {}, ensure_ascii=True),
+            "lote": lote,
+            "max_tentativas": max_tentativas,
+            "projeto_ids": None if projeto_ids is None else list(projeto_ids),
+         },
+      )
+      return cur.rowcount
+
+SQL_RESERVAR = """
+   UPDATE tarefa_calculo t
+   SET estado = 'executando', trabalhador = %(trabalhador)s, tentativas = t.tentativas + 1,
+      iniciado_em = now(), heartbeat_em = now(), erro = NULL
+   FROM (
+      SELECT id
+      FROM tarefa_calculo
+      WHERE estado = 'pendente' AND disponivel_em <= now()
+      ORDER BY disponivel_em, id
+      LIMIT %(limite)s
+      FOR UPDATE SKIP LOCKED
+   ) livre
+   WHERE t.id = livre.id
+   RETURNING t.id, t.projeto_id, t.tipo, t.parametros"""
+
+@rastreado("banco")
+def reservar(conn, trabalhador, limite=TAMANHO_LOTE):
+   # [(tarefa_id, projeto_id, tipo, parametros), ...]; o chamador faz o commit
+   with conn.cursor() as cur:
+      cur.execute(SQL_RESERVAR, {"trabalhador": trabalhador, "limite": limite})
+      return sorted(cur.fetchall())
+
+def recuperar_abandonadas(conn, vencido=HEARTBEAT_VENCIDO):
+   # Tarefas sem heartbeat ha mais de `vencido` segundos voltam para a fila (ou falham)
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         UPDATE tarefa_calculo
+         SET estado = CASE WHEN tentativas >= max_tentativas THEN 'falhou' ELSE 'pendente' END,
+            concluido_em = CASE WHEN tentativas >= max_tentativas THEN now() END,
+            erro = 'heartbeat vencido (' || coalesce(trabalhador, '') || ')',
+            trabalhador = NULL, disponivel_em = now()
+         WHERE estado = 'executando' AND heartbeat_em < now() - make_interval(secs => %s)
+         """,
+         (vencido,),
+      )
+      return cur.rowcount
+
+def concluir(conn, tarefa_id, trabalhador, execucao_id):
+   # False se a tarefa nao e mais deste trabalhador (heartbeat vencido e reservada de novo)
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         UPDATE tarefa_calculo
+         SET estado = 'concluida', execucao_id = %s, concluido_em = clock_timestamp(),
+            heartbeat_em = clock_timestamp()
+         WHERE id = %s AND trabalhador = %s AND estado = 'executando'
+         """,
+         (execucao_id, tarefa_id, trabalhador),
+      )
+      return cur.rowcount == 1
+
+def falhar(conn, tarefa_id, trabalhador, erro, espera_base=ESPERA_BASE):
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         UPDATE tarefa_calculo
+         SET estado = CASE WHEN tentativas >= max_tentativas THEN 'falhou' ELSE 'pendente' END,
+            concluido_em = CASE WHEN tentativas >= max_tentativas THEN clock_timestamp() END,
+            disponivel_em = clock_timestamp() + make_interval(secs => %s * power(2, tentativas - 1)),
+            trabalhador = NULL, erro = %s
+         WHERE id = %s AND trabalhador = %s AND estado = 'executando'
+         """,
+         (espera_base, erro, tarefa_id, trabalhador),
+      )
+
+def situacao_fila(conn, lote=None):
+   # {estado: quantidade}
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         SELECT estado, count(*)
+         FROM tarefa_calculo
+         WHERE %(lote)s::text IS NULL OR lote = %(lote)s
+         GROUP BY estado
+         """,
+         {"lote": lote},
+      )
+      contagens = dict(cur.fetchall())
+   return {estado: contagens.get(estado, 0) for estado in ESTADOS}
+
+def vazao_trabalhadores(conn):
+   # (nome, ativo, tarefas_ok, tarefas_falha, trechos, tarefas/s, trechos/s, ocupacao)
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         SELECT nome, encerrado_em IS NULL, tarefas_ok, tarefas_falha, trechos,
+            tarefas_ok / d.segundos, trechos / d.segundos, segundos_ocupado / d.segundos
+         FROM trabalhador_calculo
+         CROSS JOIN LATERAL (
+            SELECT greatest(extract(epoch FROM coalesce(encerrado_em, heartbeat_em) - iniciado_em)::float8, 1e-3)
+               AS segundos
+         ) d
+         ORDER BY iniciado_em DESC, nome
+         """
+      )
+      return cur.fetchall()
+
+# Trabalhador
+
+class Trabalhador:
+   # Um processo: uma conexao para as tarefas e outra para o heartbeat, do mesmo pool
+   def __init__(self, conninfo, nome=None, tamanho_lote=TAMANHO_LOTE, intervalo_heartbeat=INTERVALO_HEARTBEAT,
+                heartbeat_vencido=HEARTBEAT_VENCIDO, espera_base=ESPERA_BASE):
+      self.nome = nome or f"{socket.gethostname()}:{os.getpid()}"
+      self.tamanho_lote = tamanho_lote
+      self.intervalo_heartbeat = intervalo_heartbeat
+      self.heartbeat_vencido = heartbeat_vencido
+      self.espera_base = espera_base
+      self.pool = ConnectionPool(conninfo, min_size=2, max_size=2, open=False, name=self.nome)
+      self.cache = CacheCalculo()
+      self.estatisticas = {"tarefas_ok": 0, "tarefas_falha": 0, "perdidas": 0, "trechos": 0,
+                           "segundos_ocupado": 0.0, "segundos": 0.0}
+      self._parar = threading.Event()
+      self._heartbeat = None
+
+   def _registrar(self):
+      with self.pool.connection() as conn:
+         conn.execute(
+            """
+            INSERT INTO trabalhador_calculo (nome, host, pid)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (nome) DO UPDATE SET
+               host = EXCLUDED.host, pid = EXCLUDED.pid, iniciado_em = now(), heartbeat_em = now(),
+               encerrado_em = NULL, tarefas_ok = 0, tarefas_falha = 0, trechos = 0, segundos_ocupado = 0
+            """,
+            (self.nome, socket.gethostname(), os.getpid()),
+         )
+
+   def _bater(self):
+      while not self._parar.wait(self.intervalo_heartbeat):
+         try:
+            with self.pool.connection() as conn:
+               conn.execute(
+                  "UPDATE tarefa_calculo SET heartbeat_em = now() WHERE trabalhador = %s AND estado = 'executando'",
+                  (self.nome,),
+               )
+               conn.execute("UPDATE trabalhador_calculo SET heartbeat_em = now() WHERE nome = %s", (self.nome,))
+         except Exception as e:
+            print(f"Erro no heartbeat de {self.nome}: {e}")
+
+   def _acumular(self, conn, ok, falhas, trechos, ocupado):
+      conn.execute(
+         """
+         UPDATE trabalhador_calculo
+         SET tarefas_ok = tarefas_ok + %s, tarefas_falha = tarefas_falha + %s, trechos = trechos + %s,
+            segundos_ocupado = segundos_ocupado + %s, heartbeat_em = now()
+         WHERE nome = %s
+         """,
+         (ok, falhas, trechos, ocupado, self.nome),
+      )
+      conn.commit()
+
+   def processar_lote(self, conn, tarefas):
+      ok = falhas = trechos = 0
+      ocupado = 0.0
+      self.cache.usar(conn)
+      for tarefa_id, projeto_id, tipo, parametros in tarefas:
+         inicio = time.perf_counter()
+         try:
+            execucao_id, calculados = EXECUTORES[tipo](conn, projeto_id, parametros or {}, self.cache)
+            if concluir(conn, tarefa_id, self.nome, execucao_id):
+               conn.commit()
+               ok += 1
+               trechos += calculados
+            else:
+               conn.rollback()
+               self.estatisticas["perdidas"] += 1
+         except Exception as e:
+            conn.rollback()
+            falhar(conn, tarefa_id, self.nome, f"{type(e).__name__}: {e}", self.espera_base)
+            conn.commit()
+            falhas += 1
+            print(f"Erro na tarefa {tarefa_id} (projeto {projeto_id}): {e}")
+         ocupado += time.perf_counter() - inicio
+      self._acumular(conn, ok, falhas, trechos, ocupado)
+      for chave, valor in (("tarefas_ok", ok), ("tarefas_falha", falhas), ("trechos", trechos),
+                           ("segundos_ocupado", ocupado)):
+         self.estatisticas[chave] += valor
+
+   def executar(self, parar_quando_vazia=True, maximo_lotes=None):
+      inicio = time.perf_counter()
+      self.pool.open(wait=True)
+      try:
+         self._registrar()
+         # Particoes de calculo na partida, nao no meio das gravacoes
+         with self.pool.connection() as conn:
+            preparar_particoes(conn)
+         self._heartbeat = threading.Thread(target=self._bater, name=f"heartbeat {self.nome}", daemon=True)
+         self._heartbeat.start()
+         lotes = 0
+         while maximo_lotes is None or lotes < maximo_lotes:
+            with self.pool.connection() as conn:
+               recuperar_abandonadas(conn, self.heartbeat_vencido)
+               tarefas = reservar(conn, self.nome, self.tamanho_lote)
+               conn.commit()
+               if tarefas:
+                  self.processar_lote(conn, tarefas)
+                  lotes += 1
+                  continue
+            if parar_quando_vazia:
+               break
+            time.sleep(ESPERA_FILA_VAZIA)
+      finally:
+         self._parar.set()
+         if self._heartbeat is not None:
+            self._heartbeat.join()
+         try:
+            with self.pool.connection() as conn:
+               conn.execute(
+                  "UPDATE trabalhador_calculo SET encerrado_em = now(), heartbeat_em = now() WHERE nome = %s",
+                  (self.nome,),
+               )
+         finally:
+            self.pool.close()
+      self.estatisticas["segundos"] = time.perf_counter() - inicio
+      return dict(self.estatisticas, nome=self.nome, cache=self.cache.estatisticas())
+
+def _executar_trabalhador(argumentos):
+   conninfo, opcoes, parar_quando_vazia = argumentos
+   return Trabalhador(conninfo, **opcoes).executar(parar_quando_vazia)
+
+def executar_trabalhadores(conninfo, processos=None, parar_quando_vazia=True, **opcoes):
+   # Varios trabalhadores nesta maquina; outras maquinas rodam o mesmo comando
+   processos = processos or os.cpu_count() or 1
+   tarefas = [(conninfo, opcoes, parar_quando_vazia)] * processos
+   if processos <= 1:
+      return [_executar_trabalhador(t) for t in tarefas]
+   with ProcessPoolExecutor(max_workers=processos) as pool:
+      return list(pool.map(_executar_trabalhador, tarefas))
+
+if __name__ == "__main__":
+   import argparse
+   import psycopg as psy
+   from conectar import conectar_db
+
+   # python functions\fila_calculo.py enfileirar --lote "catalogo 2025-06"
+   # python functions\fila_calculo.py trabalhar --processos 4
+   # python functions\fila_calculo.py situacao
+   parser = argparse.ArgumentParser(description="Fila de recalculo de projetos")
+   comandos = parser.add_subparsers(dest="comando", required=True)
+   enfileirar_cmd = comandos.add_parser("enfileirar")
+   enfileirar_cmd.add_argument("projetos", type=int, nargs="*")
+   enfileirar_cmd.add_argument("--tipo", choices=tuple(EXECUTORES), default="dimensionar")
+   enfileirar_cmd.add_argument("--vazao-unidade", type=float, default=None)
+   enfileirar_cmd.add_argument("--lote", default="")
+   enfileirar_cmd.add_argument("--tentativas", type=int, default=3)
+   trabalhar_cmd = comandos.add_parser("trabalhar")
+   trabalhar_cmd.add_argument("--processos", type=int, default=None)
+   trabalhar_cmd.add_argument("--lote", type=int, default=TAMANHO_LOTE)
+   trabalhar_cmd.add_argument("--continuo", action="store_true")
+   situacao_cmd = comandos.add_parser("situacao")
+   situacao_cmd.add_argument("--lote", default=None)
+   args = parser.parse_args()
+
+   conexao = conectar_db()
+   try:
+      if args.comando == "enfileirar":
+         parametros = {"vazao_unidade": args.vazao_unidade} if args.vazao_unidade else {}
+         with psy.connect(conexao[0]) as conn:
+            total = enfileirar(conn, args.projetos or None, args.tipo, parametros, args.lote, args.tentativas)
+            conn.commit()
+         print(f"{total} tarefas enfileiradas")
+      elif args.comando == "trabalhar":
+         for r in executar_trabalhadores(conexao[0], args.processos, not args.continuo, tamanho_lote=args.lote):
+            print(f"{r['nome']:<30} {r['tarefas_ok']:>6} ok {r['tarefas_falha']:>4} falhas "
+                  f"{r['tarefas_ok'] / max(r['segundos'], 1e-3):8.2f} projetos/s "
+                  f"{r['trechos'] / max(r['segundos'], 1e-3):10.1f} trechos/s "
+                  f"cache {r['cache']['taxa_acerto']:6.1%} acertos")
+      else:
+         with psy.connect(conexao[0]) as conn:
+            print(", ".join(f"{estado}: {n}" for estado, n in situacao_fila(conn, args.lote).items()))
+            for nome, ativo, ok, falhas, trechos, tarefas_s, trechos_s, ocupacao in vazao_trabalhadores(conn):
+               print(f"{nome:<30} {'ativo' if ativo else 'encerrado':<9} {ok:>6} ok {falhas:>4} falhas "
+                     f"{tarefas_s:8.2f} projetos/s {trechos_s:10.1f} trechos/s {ocupacao:6.1%} ocupado")
+   except Exception as e:
+      print(f"Erro na fila de recalculo: {e}")
+      import traceback
+      traceback.print_exc()
@@ -0,0 +1,224 @@
+import json
+import re
+from datetime import date
+
+from calculos import VERSAO_MOTOR
+
+COLUNAS_RESULTADO = (
+   "trecho_id",
+   "ltotal",
+   "potencia",
+   "velocidade",
+   "perda_carga",
+   "pressao_inicial",
+   "pressao_final",
+   "ok",
+   "observacao",
+)
+
+# Particoes mensais de calculo. Sao criadas com antecedencia (preparar_particoes,
+# chamada por criar_tabelas.py, inquilinos.py, pelos trabalhadores da fila e pelo
+# comando de manutencao abaixo), fora da transacao que grava os resultados: criar
+# uma particao trava a tabela calculo inteira. Um mes sem particao cai em
+# calculo_padrao, e as linhas vao para a particao do mes quando ela e criada.
+
+MESES_ANTECIPADOS = 3
+
+def nome_particao(data):
+   return f"calculo_{data.year:04d}{data.month:02d}"
+
+def _proximo_mes(data):
+   if data.month == 12:
+      return date(data.year + 1, 1, 1)
+   return date(data.year, data.month + 1, 1)
+
+def criar_particao_calculo(conn, data):
+   inicio = date(data.year, data.month, 1)
+   fim = _proximo_mes(inicio)
+   nome = nome_particao(inicio)
+   with conn.cursor() as cur:
+      cur.execute("SELECT to_regclass(%s)", (nome,))
+      if cur.fetchone()[0] is not None:
+         return nome
+      # A particao nao pode ser criada com linhas do mes na particao padrao
+      cur.execute(
+         "SELECT EXISTS (SELECT 1 FROM calculo_padrao WHERE executado_em >= %s AND executado_em < %s)",
+         (inicio, fim),
+      )
+      mover = cur.fetchone()[0]
+      if mover:
+         cur.execute("CREATE TEMP TABLE calculo_movido (LIKE calculo)")
+         cur.execute(
+            """
+            WITH movidos AS (
+               DELETE FROM calculo_padrao WHERE executado_em >= %s AND executado_em < %s RETURNING *
+            )
+            INSERT INTO calculo_movido SELECT * FROM movidos""",
+            (inicio, fim),
+         )
+      cur.execute(f"""
+         CREATE TABLE IF NOT EXISTS "{nome}" PARTITION OF calculo
+         FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}');""")
+      if mover:
+         cur.execute("INSERT INTO calculo SELECT * FROM calculo_movido")
+         cur.execute("DROP TABLE calculo_movido")
+   return nome
+
+def preparar_particoes(conn, meses=MESES_ANTECIPADOS, hoje=None):
+   # Mes corrente e os proximos meses; uma trava por vez (varios trabalhadores)
+   hoje = hoje or date.today()
+   data = date(hoje.year, hoje.month, 1)
+   with conn.cursor() as cur:
+      cur.execute("SELECT pg_advisory_xact_lock(hashtext('calculo_particoes'))")
+   criadas = []
+   for _ in range(meses + 1):
+      criadas.append(criar_particao_calculo(conn, data))
+      data = _proximo_mes(data)
+   return criadas
+
+def listar_particoes_calculo(conn):
+   with conn.cursor() as cur:
+      cur.execute("""
+         SELECT c.relname
+         FROM pg_inherits i
+         JOIN pg_class c ON c.oid = i.inhrelid
+         WHERE i.inhparent = 'calculo'::regclass
+         ORDER BY c.relname;""")
+      nomes = [row[0] for row in cur.fetchall()]
+   return [n for n in nomes if re.fullmatch(r'calculo_\d{6}', n)]
+
+def arquivar_particoes(conn, antes_de, apagar=False):
+   # Desanexa (e opcionalmente apaga) os meses inteiramente anteriores a antes_de.
+   # A particao desanexada vira uma tabela comum, pronta para pg_dump.
+   limite = nome_particao(antes_de)
+   arquivadas = []
+   try:
+      with conn.cursor() as cur:
+         for nome in listar_particoes_calculo(conn):
+            if nome >= limite:
+               continue
+            cur.execute(f'ALTER TABLE calculo DETACH PARTITION "{nome}";')
+            if apagar:
+               cur.execute(f'DROP TABLE IF EXISTS "{nome}";')
+            arquivadas.append(nome)
+      conn.commit()
+   except Exception as e:
+      print(f"Erro ao arquivar particoes: {e}")
+      conn.rollback()
+      import traceback
+      traceback.print_exc()
+   return arquivadas
+
+# Execucoes
+
+def gravar_resultados(conn, execucao_id, executado_em, resultados):
+   # Um COPY para a execucao inteira (menos idas e volta e menos parse que um INSERT por linha)
+   with conn.cursor() as cur:
+      with cur.copy(
+         f"COPY calculo (execucao_id, executado_em, {', '.join(COLUNAS_RESULTADO)}) FROM STDIN"
+      ) as copy:
+         for r in resultados:
+            copy.write_row((execucao_id, executado_em, *(r.get(c) for c in COLUNAS_RESULTADO)))
+      return cur.rowcount
+
+def substituir_resultados(conn, projeto_id, execucao_id, trecho_ids):
+   # Remove os resultados anteriores dos trechos e as execucoes que ficaram vazias.
+   # Na mesma transacao da gravacao: quem le ve o resultado antigo ou o novo, nunca os dois
+   with conn.cursor() as cur:
+      cur.execute(
+         "DELETE FROM calculo WHERE trecho_id = ANY(%s) AND execucao_id <> %s",
+         (list(trecho_ids), execucao_id),
+      )
+      removidos = cur.rowcount
+      cur.execute(
+         """
+         DELETE FROM execucao_calculo e
+         WHERE e.projeto_id = %s AND e.id <> %s
+            AND NOT EXISTS (
+               SELECT 1 FROM calculo c
+               WHERE c.execucao_id = e.id AND c.executado_em = e.executado_em
+            )
+         """,
+         (projeto_id, execucao_id),
+      )
+   return removidos
+
+def registrar_execucao(conn, projeto_id, parametros, resultados, versao_motor=VERSAO_MOTOR, substituir=False):
+   # resultados: dicts com as chaves de COLUNAS_RESULTADO. Com substituir=True os
+   # resultados anteriores dos mesmos trechos sao apagados. Nao faz commit; o insert em
+   # execucao_calculo toca o projeto (trigger), o que serializa gravacoes concorrentes.
+   # Nao cria particao (preparar_particoes): sem a do mes, as linhas vao para calculo_padrao
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         INSERT INTO execucao_calculo (projeto_id, parametros, versao_motor)
+         VALUES (%s, %s, %s)
+         RETURNING id, executado_em
+         """,
+         (projeto_id, json.dumps(parametros, ensure_ascii=True), versao_motor),
+      )
+      execucao_id, executado_em = cur.fetchone()
+   if substituir:
+      substituir_resultados(conn, projeto_id, execucao_id, [r["trecho_id"] for r in resultados])
+   gravar_resultados(conn, execucao_id, executado_em, resultados)
+   return execucao_id
+
+def execucoes_projeto(conn, projeto_id, limite=20):
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         SELECT id, parametros, versao_motor, executado_em
+         FROM execucao_calculo
+         WHERE projeto_id = %s
+         ORDER BY executado_em DESC, id DESC
+         LIMIT %s
+         """,
+         (projeto_id, limite),
+      )
+      return cur.fetchall()
+
+def ultimos_calculos(conn, projeto_id):
+   # Um index scan em idx_calculo_trecho_data por trecho via LATERAL ... LIMIT 1
+   with conn.cursor() as cur:
+      cur.execute(
+         f"""
+         SELECT t.id, c.execucao_id, c.executado_em,
+            {", ".join(f"c.{col}" for col in COLUNAS_RESULTADO[1:])}
+         FROM trecho t
+         CROSS JOIN LATERAL (
+            SELECT *
+            FROM calculo
+            WHERE calculo.trecho_id = t.id
+            ORDER BY calculo.executado_em DESC, calculo.execucao_id DESC
+            LIMIT 1
+         ) c
+         WHERE t.projeto_id = %s
+         ORDER BY t.id
+         """,
+         (projeto_id,),
+      )
+      return cur.fetchall()
+
+if __name__ == "__main__":
+   import sys
+   import psycopg as psy
+   from conectar import conectar_db
+
+   # python functions\historico_calculo.py particoes [meses]
+   # python functions\historico_calculo.py AAAA-MM-DD [--apagar]
+   if len(sys.argv) < 2:
+      print("Uso: historico_calculo.py particoes [meses] | AAAA-MM-DD [--apagar]")
+      sys.exit(1)
+
+   conexao = conectar_db()
+   if sys.argv[1] == "particoes":
+      meses = int(sys.argv[2]) if len(sys.argv) > 2 else MESES_ANTECIPADOS
+      with psy.connect(conexao[0]) as conn:
+         for particao in preparar_particoes(conn, meses):
+            print(f'Particao pronta: {particao}')
+      sys.exit(0)
+
+   antes_de = date.fromisoformat(sys.argv[1])
+   with psy.connect(conexao[0]) as conn:
+      for particao in arquivar_particoes(conn, antes_de, apagar="--apagar" in sys.argv):
+         print(f'Arquivando a particao: {particao}')
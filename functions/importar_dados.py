@@ -0,0 +1,435 @@
+import csv
+import os
+import re
+import unicodedata
+
+from calculos import FATORES_KCALMIN, normalizar_unidade
+from diametros import polegadas
+from pontos import TIPOS_PONTO, atualizar_comprimentos, ligar_trechos
+from rastreamento import rastreado
+
+# Importacao em lote de planilhas (CSV/XLSX): leitura em streaming, resolucao
+# do catalogo em memoria, COPY para tabelas temporarias e merge no banco.
+
+COLUNAS_EQUIPAMENTOS = ("nome", "categoria", "unidade_medida", "pot_unitaria", "qtde")
+COLUNAS_TRECHOS = ("trecho", "material", "diametro", "lreal")
+COLUNAS_PECAS = ("trecho", "categoria", "peca", "qtde")
+COLUNAS_PONTOS = ("ponto", "x", "y")
+
+# Tamanho maximo dos textos (VARCHAR das tabelas), conferido antes do COPY
+TAMANHOS_EQUIPAMENTOS = {"nome": 100, "categoria": 100, "unidade_medida": 10, "fabricante": 100, "modelo": 100}
+TAMANHOS_TRECHOS = {"trecho": 50}
+TAMANHOS_PONTOS = {"ponto": 50}
+
+def normalizar(texto):
+   texto = unicodedata.normalize("NFKD", str(texto or "").strip().casefold())
+   return " ".join("".join(c for c in texto if not unicodedata.combining(c)).split())
+
+def _numero(valor):
+   # Separador decimal: com virgula e ponto, o ultimo dos dois ("1.234,5" e
+   # "1,234.5"); sozinho, virgula ou ponto, salvo se repetido ("1.234.567").
+   # O outro so e aceito como milhar, em grupos de tres digitos
+   if isinstance(valor, (int, float)):
+      return float(valor)
+   texto = str(valor or "").strip().replace(" ", "")
+   sinal = ""
+   if texto[:1] in ("+", "-"):
+      sinal, texto = texto[0], texto[1:]
+   virgulas, pontos = texto.count(","), texto.count(".")
+   if virgulas and pontos:
+      decimal = "," if texto.rfind(",") > texto.rfind(".") else "."
+   elif virgulas > 1 or pontos > 1:
+      decimal = None
+   else:
+      decimal = "," if virgulas else "."
+   milhar = {",": ".", ".": ","}.get(decimal, "," if virgulas else ".")
+   inteiro, _, fracao = texto.rpartition(decimal) if decimal and decimal in texto else (texto, "", "")
+   if decimal and decimal in inteiro:
+      raise ValueError(f"Numero invalido: {valor}")
+   if milhar in inteiro and not re.fullmatch(rf"\d{{1,3}}(?:{re.escape(milhar)}\d{{3}})+", inteiro):
+      raise ValueError(f"Separador de milhar invalido: {valor}")
+   return float(sinal + inteiro.replace(milhar, "") + ("." + fracao if fracao else ""))
+
+# Leitura em streaming
+
+def _linhas_csv(caminho):
+   with open(caminho, "r", encoding="utf-8-sig", newline="") as f:
+      amostra = f.read(4096)
+      f.seek(0)
+      try:
+         dialeto = csv.Sniffer().sniff(amostra, delimiters=";,\t")
+      except csv.Error:
+         dialeto = csv.excel
+      leitor = csv.reader(f, dialeto)
+      cabecalho = [normalizar(c).replace(" ", "_") for c in next(leitor, [])]
+      for numero, valores in enumerate(leitor, start=2):
+         if any(v.strip() for v in valores):
+            yield numero, dict(zip(cabecalho, valores))
+
+def _linhas_xlsx(caminho):
+   try:
+      from openpyxl import load_workbook
+   except ImportError:
+      raise RuntimeError("Instale openpyxl para importar arquivos .xlsx")
+   livro = load_workbook(caminho, read_only=True, data_only=True)
+   try:
+      linhas = livro.active.iter_rows(values_only=True)
+      cabecalho = [normalizar(c).replace(" ", "_") for c in next(linhas, ())]
+      for numero, valores in enumerate(linhas, start=2):
+         if any(v not in (None, "") for v in valores):
+            yield numero, dict(zip(cabecalho, valores))
+   finally:
+      livro.close()
+
+def ler_linhas(caminho):
+   if os.path.splitext(caminho)[1].lower() in (".xlsx", ".xlsm"):
+      return _linhas_xlsx(caminho)
+   return _linhas_csv(caminho)
+
+# Indice do catalogo em memoria
+
+def _chave_diametro(texto, diametro_pol=None):
+   # diametro_pol do banco (REAL) arredondado como em diametros.py; texto se nao for numerico
+   if diametro_pol is None:
+      diametro_pol = polegadas(texto)
+   return normalizar(texto) if diametro_pol is None else round(diametro_pol, 4)
+
+def carregar_indice_catalogo(conn):
+   indice = {"material": {}, "tubo": {}, "peca": {}}
+   with conn.cursor() as cur:
+      cur.execute("SELECT id, nome FROM material")
+      for material_id, nome in cur.fetchall():
+         indice["material"][normalizar(nome)] = material_id
+         indice["material"][str(material_id)] = material_id
+      # Diametros pela chave numerica: "1.1/4", "1 1/4\"" e "32" (PEX) caem no mesmo tubo
+      cur.execute("SELECT id, material_id, diametro_nominal, diametro_pol FROM tubo")
+      for tubo_id, material_id, diametro, diametro_pol in cur.fetchall():
+         indice["tubo"][(material_id, _chave_diametro(diametro, diametro_pol))] = tubo_id
+      cur.execute("SELECT id, material_id, categoria, diametro, nome, diametro_pol FROM peca")
+      for peca_id, material_id, categoria, diametro, nome, diametro_pol in cur.fetchall():
+         chave = (material_id, normalizar(categoria), _chave_diametro(diametro, diametro_pol), normalizar(nome))
+         indice["peca"][chave] = peca_id
+   return indice
+
+def _faltantes(linha, colunas):
+   return [c for c in colunas if linha.get(c) in (None, "")]
+
+def _longos(linha, tamanhos):
+   return [f"{c} com mais de {n} caracteres" for c, n in tamanhos.items() if len(str(linha.get(c) or "").strip()) > n]
+
+def _novo_relatorio():
+   # lidas: linhas do arquivo; aceitas: linhas sem erro enviadas ao banco;
+   # importadas: registros inseridos ou atualizados (linhas repetidas viram um so)
+   return {"lidas": 0, "aceitas": 0, "importadas": 0, "erros": []}
+
+def _contar_aceitas(relatorio):
+   relatorio["aceitas"] = relatorio["lidas"] - len(relatorio["erros"])
+
+def _criar_staging(cur, tabela, colunas):
+   # Varias importacoes na mesma transacao (ex.: trechos e pontos) reaproveitam
+   # a tabela temporaria em vez de recria-la; ela some no commit
+   cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {tabela}({colunas}) ON COMMIT DROP")
+   cur.execute(f"TRUNCATE {tabela}")
+
+# Equipamentos
+
+@rastreado("banco")
+def importar_equipamentos(conn, projeto_id, caminho):
+   relatorio = _novo_relatorio()
+   with conn.cursor() as cur:
+      _criar_staging(cur, "stg_equipamento", """
+            linha INTEGER,
+            nome VARCHAR(100),
+            categoria VARCHAR(100),
+            unidade_medida VARCHAR(10),
+            pot_unitaria REAL,
+            qtde INTEGER,
+            fabricante VARCHAR(100),
+            modelo VARCHAR(100)
+         """)
+      with cur.copy("""
+         COPY stg_equipamento (linha, nome, categoria, unidade_medida, pot_unitaria, qtde, fabricante, modelo)
+         FROM STDIN""") as copy:
+         for numero, linha in ler_linhas(caminho):
+            relatorio["lidas"] += 1
+            faltantes = _faltantes(linha, COLUNAS_EQUIPAMENTOS)
+            if faltantes:
+               relatorio["erros"].append((numero, f"colunas vazias: {', '.join(faltantes)}"))
+               continue
+            try:
+               potencia = _numero(linha["pot_unitaria"])
+               qtde = int(_numero(linha["qtde"]))
+            except ValueError:
+               relatorio["erros"].append((numero, "potencia ou quantidade invalida"))
+               continue
+            if potencia <= 0 or qtde < 0:
+               relatorio["erros"].append((numero, "potencia deve ser > 0 e quantidade >= 0"))
+               continue
+            if normalizar_unidade(linha["unidade_medida"]) not in FATORES_KCALMIN:
+               relatorio["erros"].append((numero, f"unidade desconhecida: {linha['unidade_medida']}"))
+               continue
+            longos = _longos(linha, TAMANHOS_EQUIPAMENTOS)
+            if longos:
+               relatorio["erros"].append((numero, ", ".join(longos)))
+               continue
+            copy.write_row((
+               numero,
+               str(linha["nome"]).strip(),
+               str(linha["categoria"]).strip(),
+               str(linha["unidade_medida"]).strip(),
+               potencia,
+               qtde,
+               str(linha.get("fabricante") or "").strip() or None,
+               str(linha.get("modelo") or "").strip() or None,
+            ))
+
+      cur.execute("""
+         INSERT INTO equipamento (nome, categoria, unidade_medida, pot_unitaria, fabricante, modelo)
+         SELECT DISTINCT ON (nome, unidade_medida, pot_unitaria)
+            nome, categoria, unidade_medida, pot_unitaria, fabricante, modelo
+         FROM stg_equipamento
+         ORDER BY nome, unidade_medida, pot_unitaria, linha DESC
+         ON CONFLICT (nome, unidade_medida, pot_unitaria) DO UPDATE SET
+            categoria = EXCLUDED.categoria,
+            fabricante = COALESCE(EXCLUDED.fabricante, equipamento.fabricante),
+            modelo = COALESCE(EXCLUDED.modelo, equipamento.modelo);""")
+      cur.execute("""
+         INSERT INTO equipamento_projeto (projeto_id, equipamento_id, qtde_equipamentos)
+         SELECT %s, e.id, SUM(s.qtde)
+         FROM stg_equipamento s
+         JOIN equipamento e
+            ON e.nome = s.nome AND e.unidade_medida = s.unidade_medida AND e.pot_unitaria = s.pot_unitaria
+         GROUP BY e.id
+         ON CONFLICT (projeto_id, equipamento_id) DO UPDATE SET
+            qtde_equipamentos = EXCLUDED.qtde_equipamentos;""", (projeto_id,))
+      relatorio["importadas"] = cur.rowcount
+   _contar_aceitas(relatorio)
+   return relatorio
+
+# Trechos e pecas
+
+@rastreado("banco")
+def importar_trechos(conn, projeto_id, caminho_trechos, caminho_pecas=None, rede_padrao="primaria", indice=None):
+   indice = indice or carregar_indice_catalogo(conn)
+   relatorio = _novo_relatorio()
+   relatorio["pecas"] = _novo_relatorio()
+   # (rede, nome) -> (material_id, diametro) para herdar nas pecas
+   trechos = {}
+
+   with conn.cursor() as cur:
+      _criar_staging(cur, "stg_trecho", """
+            linha INTEGER,
+            rede VARCHAR(10),
+            nome VARCHAR(50),
+            tubo_id INTEGER,
+            lreal REAL,
+            delta_h REAL
+         """)
+      _criar_staging(cur, "stg_trecho_peca", """
+            linha INTEGER,
+            rede VARCHAR(10),
+            nome VARCHAR(50),
+            peca_id INTEGER,
+            qtde INTEGER
+         """)
+
+      with cur.copy("COPY stg_trecho (linha, rede, nome, tubo_id, lreal, delta_h) FROM STDIN") as copy:
+         for numero, linha in ler_linhas(caminho_trechos):
+            relatorio["lidas"] += 1
+            faltantes = _faltantes(linha, COLUNAS_TRECHOS)
+            if faltantes:
+               relatorio["erros"].append((numero, f"colunas vazias: {', '.join(faltantes)}"))
+               continue
+            rede = normalizar(linha.get("rede") or rede_padrao)
+            if rede not in ("primaria", "secundaria"):
+               relatorio["erros"].append((numero, f"rede invalida: {linha.get('rede')}"))
+               continue
+            material_id = indice["material"].get(normalizar(linha["material"]))
+            diametro = _chave_diametro(linha["diametro"])
+            tubo_id = indice["tubo"].get((material_id, diametro))
+            if tubo_id is None:
+               relatorio["erros"].append((numero, f"tubo nao encontrado: {linha['material']} {linha['diametro']}"))
+               continue
+            try:
+               lreal = _numero(linha["lreal"])
+               delta_h = _numero(linha.get("delta_h") or 0)
+            except ValueError:
+               relatorio["erros"].append((numero, "lreal ou delta_h invalido"))
+               continue
+            if lreal <= 0:
+               relatorio["erros"].append((numero, "lreal deve ser > 0"))
+               continue
+            longos = _longos(linha, TAMANHOS_TRECHOS)
+            if longos:
+               relatorio["erros"].append((numero, ", ".join(longos)))
+               continue
+            nome = str(linha["trecho"]).strip()
+            trechos[(rede, normalizar(nome))] = (material_id, diametro, nome)
+            copy.write_row((numero, rede, nome, tubo_id, lreal, delta_h))
+
+      if caminho_pecas:
+         pecas = relatorio["pecas"]
+         with cur.copy("COPY stg_trecho_peca (linha, rede, nome, peca_id, qtde) FROM STDIN") as copy:
+            for numero, linha in ler_linhas(caminho_pecas):
+               pecas["lidas"] += 1
+               faltantes = _faltantes(linha, COLUNAS_PECAS)
+               if faltantes:
+                  pecas["erros"].append((numero, f"colunas vazias: {', '.join(faltantes)}"))
+                  continue
+               rede = normalizar(linha.get("rede") or rede_padrao)
+               trecho = trechos.get((rede, normalizar(linha["trecho"])))
+               if trecho is None:
+                  pecas["erros"].append((numero, f"trecho nao importado: {rede} {linha['trecho']}"))
+                  continue
+               material_id, diametro, nome = trecho
+               if linha.get("material"):
+                  material_id = indice["material"].get(normalizar(linha["material"]))
+               if linha.get("diametro"):
+                  diametro = _chave_diametro(linha["diametro"])
+               peca_id = indice["peca"].get(
+                  (material_id, normalizar(linha["categoria"]), diametro, normalizar(linha["peca"]))
+               )
+               if peca_id is None:
+                  pecas["erros"].append((numero, f"peca nao encontrada: {linha['categoria']} {linha['peca']} {diametro}"))
+                  continue
+               try:
+                  qtde = int(_numero(linha["qtde"]))
+               except ValueError:
+                  pecas["erros"].append((numero, "quantidade invalida"))
+                  continue
+               if qtde <= 0:
+                  pecas["erros"].append((numero, "quantidade deve ser > 0"))
+                  continue
+               copy.write_row((numero, rede, nome, peca_id, qtde))
+
+      cur.execute("""
+         INSERT INTO trecho (projeto_id, rede, nome, tubo_id, lreal, delta_h)
+         SELECT DISTINCT ON (rede, nome) %s, rede, nome, tubo_id, lreal, delta_h
+         FROM stg_trecho
+         ORDER BY rede, nome, linha DESC
+         ON CONFLICT (projeto_id, rede, nome) DO UPDATE SET
+            tubo_id = EXCLUDED.tubo_id,
+            lreal = EXCLUDED.lreal,
+            delta_h = EXCLUDED.delta_h;""", (projeto_id,))
+      relatorio["importadas"] = cur.rowcount
+
+      if caminho_pecas:
+         # As pecas importadas substituem as pecas atuais dos trechos importados
+         cur.execute("""
+            DELETE FROM trecho_peca tp
+            USING trecho t, stg_trecho s
+            WHERE tp.trecho_id = t.id
+               AND t.projeto_id = %s AND t.rede = s.rede AND t.nome = s.nome;""", (projeto_id,))
+         cur.execute("""
+            INSERT INTO trecho_peca (trecho_id, peca_id, qtde_peca)
+            SELECT t.id, s.peca_id, SUM(s.qtde)
+            FROM stg_trecho_peca s
+            JOIN trecho t ON t.projeto_id = %s AND t.rede = s.rede AND t.nome = s.nome
+            GROUP BY t.id, s.peca_id;""", (projeto_id,))
+         relatorio["pecas"]["importadas"] = cur.rowcount
+   _contar_aceitas(relatorio)
+   _contar_aceitas(relatorio["pecas"])
+   return relatorio
+
+# Pontos (coordenadas exportadas do CAD)
+
+@rastreado("banco")
+def importar_pontos(conn, projeto_id, caminho, atualizar_trechos=True, ortogonal=False):
+   # Colunas: ponto, x, y e opcionalmente z e tipo. Com atualizar_trechos, liga os
+   # trechos aos pontos pelo nome e recalcula lreal/delta_h na mesma transacao.
+   relatorio = _novo_relatorio()
+   with conn.cursor() as cur:
+      _criar_staging(cur, "stg_ponto", """
+            linha INTEGER,
+            nome VARCHAR(50),
+            tipo VARCHAR(20),
+            x DOUBLE PRECISION,
+            y DOUBLE PRECISION,
+            z DOUBLE PRECISION
+         """)
+      with cur.copy("COPY stg_ponto (linha, nome, tipo, x, y, z) FROM STDIN") as copy:
+         for numero, linha in ler_linhas(caminho):
+            relatorio["lidas"] += 1
+            faltantes = _faltantes(linha, COLUNAS_PONTOS)
+            if faltantes:
+               relatorio["erros"].append((numero, f"colunas vazias: {', '.join(faltantes)}"))
+               continue
+            tipo = normalizar(linha.get("tipo") or "derivacao")
+            if tipo not in TIPOS_PONTO:
+               relatorio["erros"].append((numero, f"tipo invalido: {linha.get('tipo')}"))
+               continue
+            try:
+               x, y = _numero(linha["x"]), _numero(linha["y"])
+               z = _numero(linha.get("z") or 0)
+            except ValueError:
+               relatorio["erros"].append((numero, "coordenada invalida"))
+               continue
+            longos = _longos(linha, TAMANHOS_PONTOS)
+            if longos:
+               relatorio["erros"].append((numero, ", ".join(longos)))
+               continue
+            copy.write_row((numero, str(linha["ponto"]).strip(), tipo, x, y, z))
+
+      cur.execute("""
+         INSERT INTO ponto (projeto_id, nome, tipo, x, y, z)
+         SELECT DISTINCT ON (nome) %s, nome, tipo, x, y, z
+         FROM stg_ponto
+         ORDER BY nome, linha DESC
+         ON CONFLICT (projeto_id, nome) DO UPDATE SET
+            tipo = EXCLUDED.tipo,
+            x = EXCLUDED.x,
+            y = EXCLUDED.y,
+            z = EXCLUDED.z;""", (projeto_id,))
+      relatorio["importadas"] = cur.rowcount
+   _contar_aceitas(relatorio)
+   if atualizar_trechos:
+      relatorio["trechos_ligados"] = ligar_trechos(conn, projeto_id)
+      relatorio["comprimentos"] = atualizar_comprimentos(conn, projeto_id, ortogonal)
+   return relatorio
+
+def resumo_relatorio(relatorio, limite=20):
+   linhas = [
+      f"Linhas lidas: {relatorio['lidas']} | aceitas: {relatorio['aceitas']} | "
+      f"registros gravados: {relatorio['importadas']} | erros: {len(relatorio['erros'])}"
+   ]
+   linhas += [f"  linha {numero}: {mensagem}" for numero, mensagem in relatorio["erros"][:limite]]
+   if len(relatorio["erros"]) > limite:
+      linhas.append(f"  ... mais {len(relatorio['erros']) - limite} erros")
+   if "comprimentos" in relatorio:
+      linhas.append(
+         f"Trechos ligados aos pontos: {relatorio['trechos_ligados']} | "
+         f"comprimentos recalculados: {relatorio['comprimentos']}"
+      )
+   if "pecas" in relatorio:
+      linhas.append("Pecas:")
+      linhas.append(resumo_relatorio(relatorio["pecas"], limite))
+   return "\n".join(linhas)
+
+if __name__ == "__main__":
+   import sys
+   import psycopg as psy
+   from conectar import conectar_db
+
+   # python functions\importar_dados.py equipamentos <projeto_id> equipamentos.csv
+   # python functions\importar_dados.py trechos <projeto_id> trechos.csv [pecas.csv]
+   # python functions\importar_dados.py pontos <projeto_id> pontos.csv
+   if len(sys.argv) < 4 or sys.argv[1] not in ("equipamentos", "trechos", "pontos"):
+      print("Uso: importar_dados.py equipamentos|trechos|pontos <projeto_id> arquivo [pecas]")
+      sys.exit(1)
+
+   conexao = conectar_db()
+   try:
+      with psy.connect(conexao[0]) as conn:
+         if sys.argv[1] == "equipamentos":
+            relatorio = importar_equipamentos(conn, int(sys.argv[2]), sys.argv[3])
+         elif sys.argv[1] == "pontos":
+            relatorio = importar_pontos(conn, int(sys.argv[2]), sys.argv[3])
+         else:
+            pecas = sys.argv[4] if len(sys.argv) > 4 else None
+            relatorio = importar_trechos(conn, int(sys.argv[2]), sys.argv[3], pecas)
+         conn.commit()
+      print(resumo_relatorio(relatorio))
+   except Exception as e:
+      print(f"Erro ao importar: {e}")
+      import traceback
+      traceback.print_exc()
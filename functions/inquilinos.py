@@ -0,0 +1,170 @@
+import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import psycopg as psy
+from psycopg import sql
+from psycopg_pool import ConnectionPool
+
+from conectar import validar_schema
+from historico_calculo import preparar_particoes
+from popular_banco import alimentar_tudo
+
+# Um schema por escritorio (inquilino) no mesmo banco. Os scripts de sql/ nao
+# qualificam nomes: rodam no schema do search_path, e as funcoes de trigger
+# guardam o search_path da criacao (SET search_path FROM CURRENT).
+#
+# PoolInquilinos serve varios escritorios com um pool so: o search_path e
+# definido na retirada da conexao, e so quando o schema muda. O comando de
+# administracao cria, migra (reaplica os scripts, que sao idempotentes) ou
+# apaga varios schemas em paralelo, com concorrencia limitada e o tempo de
+# cada schema.
+
+PASTA_SQL = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "sql"))
+SCRIPTS = ("tabelas.sql", "indices.sql")
+
+CONCORRENCIA = 4
+LOCK_TIMEOUT = "30s"
+
+def _definir_schema(conn, schema):
+   conn.execute(sql.SQL("SET search_path TO {}").format(sql.Identifier(validar_schema(schema))))
+
+class PoolInquilinos:
+   # Um pool compartilhado; conexao(schema) entrega a conexao ja no schema do escritorio
+   def __init__(self, conn_info, min_size=1, max_size=10, **kwargs):
+      self.pool = ConnectionPool(conn_info, min_size=min_size, max_size=max_size, open=False, **kwargs)
+      self._schemas = weakref.WeakKeyDictionary()
+
+   def __enter__(self):
+      self.pool.open(wait=True)
+      return self
+
+   def __exit__(self, *exc):
+      self.pool.close()
+
+   @contextmanager
+   def conexao(self, schema):
+      with self.pool.connection() as conn:
+         if self._schemas.get(conn) != schema:
+            # Fora de transacao: um rollback do chamador nao desfaz o SET
+            _definir_schema(conn, schema)
+            conn.commit()
+            self._schemas[conn] = schema
+         yield conn
+
+# Administracao
+
+def listar_inquilinos(conn):
+   # Schemas com as tabelas do sistema (projeto)
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         SELECT table_schema
+         FROM information_schema.tables
+         WHERE table_name = 'projeto' AND table_type = 'BASE TABLE'
+         ORDER BY table_schema
+         """
+      )
+      return [row[0] for row in cur.fetchall()]
+
+def _existe(conn, schema):
+   with conn.cursor() as cur:
+      cur.execute("SELECT 1 FROM pg_namespace WHERE nspname = %s", (schema,))
+      return cur.fetchone() is not None
+
+def _aplicar_scripts(conn, schema):
+   _definir_schema(conn, schema)
+   for script in SCRIPTS:
+      with open(os.path.join(PASTA_SQL, script), "r", encoding="utf-8") as f:
+         conn.execute(f.read())
+   preparar_particoes(conn)
+
+def criar_inquilino(conn, schema, popular=True):
+   # Schema, tabelas, indices e catalogo em uma transacao
+   conn.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(validar_schema(schema))))
+   _aplicar_scripts(conn, schema)
+   if popular:
+      alimentar_tudo(conn)
+   conn.commit()
+
+def migrar_inquilino(conn, schema, popular=False):
+   # Reaplica os scripts (CREATE ... IF NOT EXISTS e ALTERs de atualizacao)
+   if not _existe(conn, validar_schema(schema)):
+      raise LookupError(f"Schema {schema} nao existe")
+   _aplicar_scripts(conn, schema)
+   if popular:
+      alimentar_tudo(conn)
+   conn.commit()
+
+def dropar_inquilino(conn, schema):
+   conn.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(validar_schema(schema))))
+   conn.commit()
+
+ACOES = {
+   "criar": criar_inquilino,
+   "migrar": migrar_inquilino,
+   "dropar": dropar_inquilino,
+}
+
+def _executar(conn_info, acao, schema, lock_timeout, opcoes):
+   inicio = time.perf_counter()
+   try:
+      # Conexao propria por schema: o search_path de um nao vaza para o outro
+      with psy.connect(conn_info) as conn:
+         conn.execute(sql.SQL("SET lock_timeout = {}").format(sql.Literal(lock_timeout)))
+         ACOES[acao](conn, schema, **opcoes)
+      return {"schema": schema, "ok": True, "segundos": time.perf_counter() - inicio, "erro": None}
+   except Exception as e:
+      return {"schema": schema, "ok": False, "segundos": time.perf_counter() - inicio, "erro": str(e)}
+
+def executar_inquilinos(conn_info, acao, schemas, concorrencia=CONCORRENCIA, lock_timeout=LOCK_TIMEOUT, **opcoes):
+   # No maximo `concorrencia` schemas ao mesmo tempo; um resultado por schema, na ordem pedida
+   if acao not in ACOES:
+      raise ValueError(f"Acao desconhecida: {acao}")
+   schemas = [validar_schema(s) for s in schemas]
+   with ThreadPoolExecutor(max_workers=max(1, concorrencia)) as pool:
+      return list(pool.map(lambda s: _executar(conn_info, acao, s, lock_timeout, opcoes), schemas))
+
+if __name__ == "__main__":
+   import argparse
+   from conectar import conectar_db
+
+   # python functions\inquilinos.py criar escritorio_a escritorio_b --concorrencia 4
+   # python functions\inquilinos.py migrar --todos
+   # python functions\inquilinos.py listar
+   parser = argparse.ArgumentParser(description="Schemas de escritorios (inquilinos)")
+   parser.add_argument("acao", choices=("listar",) + tuple(ACOES))
+   parser.add_argument("schemas", nargs="*")
+   parser.add_argument("--todos", action="store_true", help="todos os schemas existentes (migrar/dropar)")
+   parser.add_argument("--concorrencia", type=int, default=CONCORRENCIA)
+   parser.add_argument("--lock-timeout", default=LOCK_TIMEOUT)
+   parser.add_argument("--sem-catalogo", action="store_true", help="criar sem popular o catalogo")
+   args = parser.parse_args()
+
+   # A conexao base ignora SCHEMA_NAME: cada acao escolhe o proprio schema
+   os.environ.pop("SCHEMA_NAME", None)
+   conexao = conectar_db()
+   try:
+      with psy.connect(conexao[0]) as conn:
+         existentes = listar_inquilinos(conn)
+      if args.acao == "listar":
+         for schema in existentes:
+            print(schema)
+      else:
+         schemas = existentes if args.todos else args.schemas
+         opcoes = {"popular": not args.sem_catalogo} if args.acao == "criar" else {}
+         inicio = time.perf_counter()
+         resultados = executar_inquilinos(
+            conexao[0], args.acao, schemas, args.concorrencia, args.lock_timeout, **opcoes
+         )
+         for r in resultados:
+            situacao = "ok" if r["ok"] else f"erro: {r['erro']}"
+            print(f"{r['schema']:<30} {r['segundos'] * 1000:9.1f} ms  {situacao}")
+         falhas = sum(not r["ok"] for r in resultados)
+         print(f"{len(resultados)} schemas em {time.perf_counter() - inicio:.2f} s, {falhas} com erro")
+   except Exception as e:
+      print(f"Erro na administracao dos schemas: {e}")
+      import traceback
+      traceback.print_exc()
@@ -0,0 +1,316 @@
+import heapq
+
+import numpy as np
+
+from dimensionamento import separar_unidade
+from rastreamento import rastreado
+
+# Pontos da instalacao com coordenadas 3D (metros, z = cota) e indice espacial
+# em memoria (arvore KD em arrays NumPy, construida em O(n log n)). No banco,
+# ponto.posicao = point(x, y) tem indice GiST para vizinho mais proximo em
+# planta e janelas; a cota usa o indice (projeto_id, z).
+#
+# Os trechos ligam dois pontos (ponto_inicio_id, ponto_fim_id), preenchidos
+# pelo nome do trecho no levantamento: "A-B" liga os pontos A e B, e
+# "AP101/A-B" liga "AP101/A" e "AP101/B". Com as pontas ligadas, lreal e
+# delta_h saem das coordenadas.
+
+TIPOS_PONTO = ("central", "prumada", "derivacao", "consumo")
+
+TAMANHO_FOLHA = 16
+
+class ArvoreKD:
+   # Arvore KD estatica: nos guardados em arrays (faixa de ordem, filhos e caixa envolvente)
+   def __init__(self, coordenadas, folha=TAMANHO_FOLHA):
+      self.pontos = np.ascontiguousarray(coordenadas, dtype=np.float64)
+      if self.pontos.ndim != 2:
+         raise ValueError("Coordenadas devem ter forma (n, dimensoes)")
+      self.folha = max(int(folha), 1)
+      self.ordem = np.arange(len(self.pontos), dtype=np.int64)
+      self._construir()
+
+   def __len__(self):
+      return len(self.pontos)
+
+   def _construir(self):
+      # Divide pela mediana do eixo mais largo (argpartition, O(n) por nivel)
+      faixas = [(0, len(self.pontos))]
+      filhos = [(-1, -1)]
+      minimos = [None]
+      maximos = [None]
+      pilha = [0] if len(self.pontos) else []
+      while pilha:
+         no = pilha.pop()
+         inicio, fim = faixas[no]
+         bloco = self.ordem[inicio:fim]
+         coordenadas = self.pontos[bloco]
+         minimos[no] = coordenadas.min(axis=0)
+         maximos[no] = coordenadas.max(axis=0)
+         if fim - inicio <= self.folha:
+            continue
+         eixo = int(np.argmax(maximos[no] - minimos[no]))
+         meio = (fim - inicio) // 2
+         self.ordem[inicio:fim] = bloco[np.argpartition(coordenadas[:, eixo], meio)]
+         esquerda, direita = len(faixas), len(faixas) + 1
+         faixas += [(inicio, inicio + meio), (inicio + meio, fim)]
+         filhos += [(-1, -1), (-1, -1)]
+         minimos += [None, None]
+         maximos += [None, None]
+         filhos[no] = (esquerda, direita)
+         pilha += [esquerda, direita]
+
+      dimensoes = self.pontos.shape[1]
+      self.faixas = np.array(faixas, dtype=np.int64).reshape(-1, 2)
+      self.filhos = np.array(filhos, dtype=np.int64).reshape(-1, 2)
+      vazio = np.zeros(dimensoes)
+      self.minimos = np.array([vazio if m is None else m for m in minimos]).reshape(-1, dimensoes)
+      self.maximos = np.array([vazio if m is None else m for m in maximos]).reshape(-1, dimensoes)
+
+   def _distancia_caixa(self, no, ponto):
+      # Distancia ao quadrado do ponto a caixa do no (0 dentro dela)
+      fora = np.maximum(np.maximum(self.minimos[no] - ponto, ponto - self.maximos[no]), 0)
+      return float(fora @ fora)
+
+   def vizinhos(self, ponto, k=1, raio=np.inf):
+      # [(distancia, indice)] dos k pontos mais proximos, do mais perto ao mais longe
+      ponto = np.asarray(ponto, dtype=np.float64)
+      if not len(self.pontos) or k <= 0:
+         return []
+      limite = raio * raio
+      melhores = [] # heap de (-distancia2, indice), no maximo k
+      fila = [(self._distancia_caixa(0, ponto), 0)]
+      while fila:
+         distancia, no = heapq.heappop(fila)
+         pior = -melhores[0][0] if len(melhores) == k else limite
+         if distancia > pior:
+            break
+         esquerda, direita = self.filhos[no]
+         if esquerda < 0:
+            inicio, fim = self.faixas[no]
+            indices = self.ordem[inicio:fim]
+            diferenca = self.pontos[indices] - ponto
+            for d2, indice in zip(np.einsum("ij,ij->i", diferenca, diferenca).tolist(), indices.tolist()):
+               if d2 > limite:
+                  continue
+               if len(melhores) < k:
+                  heapq.heappush(melhores, (-d2, indice))
+               elif d2 < -melhores[0][0]:
+                  heapq.heapreplace(melhores, (-d2, indice))
+            continue
+         for filho in (esquerda, direita):
+            heapq.heappush(fila, (self._distancia_caixa(filho, ponto), int(filho)))
+      return [(float(np.sqrt(-d2)), indice) for d2, indice in sorted(melhores, reverse=True)]
+
+   def mais_proximo(self, ponto):
+      # (distancia, indice) ou None se a arvore estiver vazia
+      achados = self.vizinhos(ponto, 1)
+      return achados[0] if achados else None
+
+   def caixa(self, minimo, maximo):
+      # Indices (ordenados) dos pontos dentro da caixa [minimo, maximo], limites inclusos
+      minimo = np.asarray(minimo, dtype=np.float64)
+      maximo = np.asarray(maximo, dtype=np.float64)
+      if not len(self.pontos):
+         return np.empty(0, dtype=np.int64)
+      partes = []
+      pilha = [0]
+      while pilha:
+         no = pilha.pop()
+         if np.any(self.maximos[no] < minimo) or np.any(self.minimos[no] > maximo):
+            continue
+         inicio, fim = self.faixas[no]
+         if np.all(self.minimos[no] >= minimo) and np.all(self.maximos[no] <= maximo):
+            partes.append(self.ordem[inicio:fim])
+            continue
+         esquerda, direita = self.filhos[no]
+         if esquerda < 0:
+            indices = self.ordem[inicio:fim]
+            coordenadas = self.pontos[indices]
+            partes.append(indices[np.all((coordenadas >= minimo) & (coordenadas <= maximo), axis=1)])
+            continue
+         pilha += [int(esquerda), int(direita)]
+      return np.sort(np.concatenate(partes)) if partes else np.empty(0, dtype=np.int64)
+
+class Pontos:
+   # Pontos de um projeto em colunas, com as arvores KD criadas sob demanda
+   def __init__(self, ponto_id, nome, tipo, xyz):
+      self.ponto_id = np.asarray(ponto_id, dtype=np.int32)
+      self.nome = np.asarray(nome, dtype=np.str_)
+      self.tipo = np.asarray(tipo, dtype=np.str_)
+      self.xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+      self._arvore = None
+      self._prumadas = None
+
+   def __len__(self):
+      return len(self.ponto_id)
+
+   @property
+   def arvore(self):
+      if self._arvore is None:
+         self._arvore = ArvoreKD(self.xyz)
+      return self._arvore
+
+   def prumada_mais_proxima(self, xyz):
+      # (ponto_id, distancia em planta) da prumada mais proxima de cada consulta; -1/inf sem prumadas
+      consultas = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+      if self._prumadas is None:
+         posicoes = np.flatnonzero(self.tipo == "prumada")
+         # Prumada e vertical: a distancia que importa e a em planta (x, y)
+         self._prumadas = (posicoes, ArvoreKD(self.xyz[posicoes, :2]))
+      posicoes, arvore = self._prumadas
+      ids = np.full(len(consultas), -1, dtype=np.int64)
+      distancias = np.full(len(consultas), np.inf)
+      for j, consulta in enumerate(consultas[:, :2]):
+         achado = arvore.mais_proximo(consulta)
+         if achado is not None:
+            distancias[j], indice = achado
+            ids[j] = self.ponto_id[posicoes[indice]]
+      return ids, distancias
+
+   def no_andar(self, cota, tolerancia=0.5, minimo_xy=None, maximo_xy=None):
+      # ponto_id dos pontos com z em cota +/- tolerancia (opcionalmente dentro de uma janela em planta)
+      minimo = [-np.inf, -np.inf] if minimo_xy is None else list(minimo_xy)
+      maximo = [np.inf, np.inf] if maximo_xy is None else list(maximo_xy)
+      indices = self.arvore.caixa(minimo + [cota - tolerancia], maximo + [cota + tolerancia])
+      return self.ponto_id[indices]
+
+def comprimentos(inicio, fim, ortogonal=False):
+   # (lreal, delta_h) entre pares de coordenadas; ortogonal soma |dx| + |dy| + |dz|
+   diferenca = np.asarray(fim, dtype=np.float64) - np.asarray(inicio, dtype=np.float64)
+   if ortogonal:
+      lreal = np.abs(diferenca).sum(axis=-1)
+   else:
+      lreal = np.sqrt(np.einsum("...i,...i->...", diferenca, diferenca))
+   return lreal, diferenca[..., 2]
+
+def pontas_do_trecho(nome):
+   # "A-B" -> ("A", "B"); "AP101/A-B" -> ("AP101/A", "AP101/B"); None se nao houver as duas pontas
+   unidade, local = separar_unidade(nome)
+   partes = [p.strip() for p in local.split("-")]
+   if len(partes) != 2 or not all(partes):
+      return None
+   if unidade is None:
+      return partes[0], partes[1]
+   return f"{unidade}/{partes[0]}", f"{unidade}/{partes[1]}"
+
+# Banco
+
+def carregar_pontos(conn, projeto_id):
+   with conn.cursor() as cur:
+      cur.execute(
+         "SELECT id, nome, tipo, x, y, z FROM ponto WHERE projeto_id = %s ORDER BY id",
+         (projeto_id,),
+      )
+      linhas = cur.fetchall()
+   return Pontos(
+      [l[0] for l in linhas],
+      [l[1] for l in linhas],
+      [l[2] for l in linhas],
+      [l[3:] for l in linhas],
+   )
+
+SQL_PROXIMOS = """
+   SELECT id, nome, tipo, x, y, z, posicao <-> point(%(x)s, %(y)s) AS distancia
+   FROM ponto
+   WHERE projeto_id = %(projeto_id)s AND (%(tipo)s::text IS NULL OR tipo = %(tipo)s)
+   ORDER BY posicao <-> point(%(x)s, %(y)s)
+   LIMIT %(limite)s"""
+
+def pontos_proximos(conn, projeto_id, x, y, tipo=None, limite=1):
+   # Vizinhos em planta pelo indice GiST (busca KNN)
+   with conn.cursor() as cur:
+      cur.execute(SQL_PROXIMOS, {"projeto_id": projeto_id, "x": x, "y": y, "tipo": tipo, "limite": limite})
+      return cur.fetchall()
+
+def pontos_no_andar(conn, projeto_id, cota, tolerancia=0.5):
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         SELECT id, nome, tipo, x, y, z
+         FROM ponto
+         WHERE projeto_id = %s AND z BETWEEN %s AND %s
+         ORDER BY nome
+         """,
+         (projeto_id, cota - tolerancia, cota + tolerancia),
+      )
+      return cur.fetchall()
+
+@rastreado("banco")
+def ligar_trechos(conn, projeto_id, sobrescrever=False):
+   # Preenche ponto_inicio_id/ponto_fim_id pelo nome dos trechos; devolve quantos foram ligados
+   with conn.cursor() as cur:
+      cur.execute(
+         "SELECT id, nome FROM trecho WHERE projeto_id = %s"
+         + ("" if sobrescrever else " AND (ponto_inicio_id IS NULL OR ponto_fim_id IS NULL)"),
+         (projeto_id,),
+      )
+      pares = [(trecho_id, pontas_do_trecho(nome)) for trecho_id, nome in cur.fetchall()]
+      pares = [(trecho_id, pontas) for trecho_id, pontas in pares if pontas]
+      if not pares:
+         return 0
+      # Um UPDATE para todos os trechos, com as pontas em arrays
+      cur.execute(
+         """
+         UPDATE trecho t
+         SET ponto_inicio_id = a.id, ponto_fim_id = b.id
+         FROM unnest(%s::int[], %s::text[], %s::text[]) AS l(trecho_id, inicio, fim)
+         JOIN ponto a ON a.projeto_id = %s AND a.nome = l.inicio
+         JOIN ponto b ON b.projeto_id = %s AND b.nome = l.fim
+         WHERE t.id = l.trecho_id
+         """,
+         (
+            [p[0] for p in pares],
+            [p[1][0] for p in pares],
+            [p[1][1] for p in pares],
+            projeto_id,
+            projeto_id,
+         ),
+      )
+      return cur.rowcount
+
+@rastreado("banco")
+def atualizar_comprimentos(conn, projeto_id, ortogonal=False):
+   # lreal e delta_h pelas coordenadas das pontas, em um unico UPDATE; devolve quantos mudaram
+   distancia = (
+      "abs(b.x - a.x) + abs(b.y - a.y) + abs(b.z - a.z)"
+      if ortogonal
+      else "sqrt((b.x - a.x) ^ 2 + (b.y - a.y) ^ 2 + (b.z - a.z) ^ 2)"
+   )
+   with conn.cursor() as cur:
+      cur.execute(
+         f"""
+         UPDATE trecho t
+         SET lreal = {distancia}, delta_h = b.z - a.z
+         FROM ponto a, ponto b
+         WHERE t.projeto_id = %s
+            AND a.id = t.ponto_inicio_id
+            AND b.id = t.ponto_fim_id
+            AND {distancia} > 0
+            AND (t.lreal, t.delta_h) IS DISTINCT FROM (({distancia})::real, (b.z - a.z)::real)
+         """,
+         (projeto_id,),
+      )
+      return cur.rowcount
+
+if __name__ == "__main__":
+   import sys
+   import psycopg as psy
+   from conectar import conectar_db
+
+   # python functions\pontos.py <projeto_id> [--ortogonal]
+   if len(sys.argv) < 2:
+      print("Uso: pontos.py <projeto_id> [--ortogonal]")
+      sys.exit(1)
+
+   projeto_id = int(sys.argv[1])
+   conexao = conectar_db()
+   try:
+      with psy.connect(conexao[0]) as conn:
+         ligados = ligar_trechos(conn, projeto_id)
+         alterados = atualizar_comprimentos(conn, projeto_id, "--ortogonal" in sys.argv)
+         conn.commit()
+      print(f"{ligados} trechos ligados aos pontos, {alterados} comprimentos atualizados")
+   except Exception as e:
+      print(f"Erro ao atualizar os trechos pelos pontos: {e}")
+      import traceback
+      traceback.print_exc()
@@ -1,19 +1,41 @@
 import psycopg as psy
-from conectar import conectar_db
-import json
+from conectar import conectar_db, prepare_configurado
+from calculos import FATORES_KCALMIN
 import re
+from catalogo_binario import abrir_catalogo
 
-with open(r'json\pecas.json', 'r', encoding='utf-8') as f:
-   pecas = json.load(f)
-
-with open(r'json\materiais.json', 'r', encoding='utf-8') as f:
-   materiais = json.load(f)  
-
-with open(r'json\tubos.json', 'r', encoding='utf-8') as f:
-   tubos = json.load(f)
-
-with open(r'json\cilindros.json', 'r', encoding='utf-8') as f:
-   cilindros = json.load(f)
+def upsert_unidades(conn, dados):
+   try:
+      with conn.cursor() as cur:
+         cur.executemany("""
+            INSERT INTO unidade_potencia (unidade, fator_kcalmin)
+            VALUES (%s, %s)
+            ON CONFLICT (unidade) DO UPDATE SET
+               fator_kcalmin = EXCLUDED.fator_kcalmin;
+         """, dados)
+         # Recalcula equipamento.pot_kcalmin apenas onde o fator mudou
+         cur.execute("""
+            UPDATE equipamento
+            SET pot_kcalmin = pot_kcalmin(pot_unitaria, unidade_medida)
+            WHERE pot_kcalmin IS DISTINCT FROM pot_kcalmin(pot_unitaria, unidade_medida);
+         """)
+         # Banco antigo: pot_kcalmin so vira NOT NULL depois de preenchida (sql\tabelas.sql)
+         cur.execute("""
+            DO $$
+            BEGIN
+               IF NOT EXISTS (
+                  SELECT 1 FROM pg_attribute
+                  WHERE attrelid = 'equipamento'::regclass AND attname = 'pot_kcalmin' AND attnotnull
+               ) AND NOT EXISTS (SELECT 1 FROM equipamento WHERE pot_kcalmin IS NULL) THEN
+                  ALTER TABLE equipamento ALTER COLUMN pot_kcalmin SET NOT NULL;
+               END IF;
+            END;
+            $$;
+         """)
+   except Exception as e:
+      print(f"Erro ao inserir unidade: {e}")
+      import traceback
+      traceback.print_exc()
 
 def upsert_materiais(conn, dados):
    try:   
@@ -48,10 +70,12 @@ def upsert_tubos(conn, dados):
    try:
       with conn.cursor() as cur:
          cur.executemany("""
-            INSERT INTO tubo (material_id, diametro_nominal, diametro_interno)
-            VALUES (%s, %s, %s)
+            INSERT INTO tubo (material_id, diametro_nominal, diametro_interno, diametro_mm, diametro_pol)
+            VALUES (%s, %s, %s, %s, %s)
             ON CONFLICT (material_id, diametro_nominal) DO UPDATE SET
-               diametro_interno = EXCLUDED.diametro_interno;
+               diametro_interno = EXCLUDED.diametro_interno,
+               diametro_mm = EXCLUDED.diametro_mm,
+               diametro_pol = EXCLUDED.diametro_pol;
          """, dados)
    except Exception as e:
       print(f"Erro ao inserir tubo: {e}")
@@ -62,35 +86,50 @@ def upsert_pecas(conn, dados):
    try:
       with conn.cursor() as cur:
          cur.executemany("""
-            INSERT INTO peca (material_id, categoria, diametro, nome, comprimento_equivalente)
-            VALUES (%s, %s, %s, %s, %s)
+            INSERT INTO peca (material_id, categoria, diametro, nome, leqv, diametro_mm, diametro_pol)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
             ON CONFLICT (material_id, categoria, diametro, nome) DO UPDATE SET
-               comprimento_equivalente = EXCLUDED.comprimento_equivalente;
+               leqv = EXCLUDED.leqv,
+               diametro_mm = EXCLUDED.diametro_mm,
+               diametro_pol = EXCLUDED.diametro_pol;
          """, dados)
    except Exception as e:
       print(f"Erro ao inserir peca: {e}")
       import traceback
       traceback.print_exc()
 
-def alimentar_tudo(conn):
-   dados_cilindros = list(cilindros.items())
-   upsert_cilindros(conn, dados_cilindros)
-
-   dados_materiais = [(m['nome'], m['c'], m.get('descricao', '')) for m in materiais.values()]
-   upsert_materiais(conn, dados_materiais)
+def upsert_reguladores(conn, dados):
+   try:
+      with conn.cursor() as cur:
+         cur.executemany("""
+            INSERT INTO regulador (estagio, modelo, fabricante, descricao, vazao_min, vazao_max,
+               entrada_min, entrada_max, saida_min, saida_max)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (estagio, fabricante, modelo) DO UPDATE SET
+               descricao = EXCLUDED.descricao,
+               vazao_min = EXCLUDED.vazao_min,
+               vazao_max = EXCLUDED.vazao_max,
+               entrada_min = EXCLUDED.entrada_min,
+               entrada_max = EXCLUDED.entrada_max,
+               saida_min = EXCLUDED.saida_min,
+               saida_max = EXCLUDED.saida_max;
+         """, dados)
+   except Exception as e:
+      print(f"Erro ao inserir regulador: {e}")
+      import traceback
+      traceback.print_exc()
 
-   dados_tubos = []
-   for material_id, itens in tubos.items():
-      dados_tubos.extend((material_id, dn, di) for dn, di in itens.items())
-   upsert_tubos(conn, dados_tubos)
+def alimentar_tudo(conn):
+   upsert_unidades(conn, list(FATORES_KCALMIN.items()))
 
-   dados_pecas = []
-   for categoria, mat_dict in pecas.items():
-      for material_id, diam_dict in mat_dict.items():
-         for diametro, pecas_dict in diam_dict.items():
-            dados_pecas.extend((material_id, categoria, diametro, nome, comp)
-                               for nome, comp in pecas_dict.items())
-   upsert_pecas(conn, dados_pecas)
+   # Snapshot binario compilado dos JSON (catalogo_binario.py); JSON se estiver desatualizado.
+   # Tubos e pecas ja trazem o diametro numerico (diametros.py)
+   catalogo = abrir_catalogo()
+   upsert_cilindros(conn, catalogo.linhas_cilindros())
+   upsert_materiais(conn, catalogo.linhas_materiais())
+   upsert_tubos(conn, catalogo.linhas_tubos())
+   upsert_pecas(conn, catalogo.linhas_pecas())
+   upsert_reguladores(conn, catalogo.linhas_reguladores())
 
    conn.commit()
          
@@ -98,7 +137,8 @@ def alimentar_tudo(conn):
 def main():
    conn = conectar_db()[0]
    try:
-      with psy.connect(conn) as conn:
+      # Upserts preparados no servidor na primeira execucao (DB_PREPARE_THRESHOLD)
+      with psy.connect(conn, prepare_threshold=prepare_configurado()) as conn:
          try:
             conn.autocommit = False
             alimentar_tudo(conn)
@@ -0,0 +1,250 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Diagnostico de desempenho: intervalos de tempo (eventos da interface, banco,
+# calculos) exportados como Chrome trace, perfilador por amostragem exportado
+# para o speedscope e perfilador deterministico (cProfile, arquivo .prof).
+#
+# DIAGNOSTICO no ambiente liga os modos ao iniciar, separados por virgula:
+#   DIAGNOSTICO=rastreamento,amostragem
+# DIAGNOSTICO_SAIDA define a pasta dos arquivos exportados ao fechar.
+
+MODOS = ("rastreamento", "amostragem", "cprofile")
+
+MAXIMO_EVENTOS = 200000
+
+INTERVALO_AMOSTRAGEM = 0.001 # s; na pratica limitado pela troca de GIL (sys.getswitchinterval)
+
+class Amostrador:
+   # Amostra a pilha de uma thread em intervalos fixos a partir de outra thread
+   def __init__(self, thread_id, intervalo=INTERVALO_AMOSTRAGEM):
+      self.thread_id = thread_id
+      self.intervalo = intervalo
+      self.frames = {} # (nome, arquivo, linha) -> indice
+      self.amostras = []
+      self.pesos = []
+      self.inicio = None
+      self.fim = None
+      self._parar = threading.Event()
+      self._thread = None
+
+   def iniciar(self):
+      self._parar.clear()
+      self.inicio = time.perf_counter()
+      self._thread = threading.Thread(target=self._rodar, name="amostrador", daemon=True)
+      self._thread.start()
+
+   def parar(self):
+      self._parar.set()
+      if self._thread is not None:
+         self._thread.join()
+         self._thread = None
+      self.fim = time.perf_counter()
+
+   def _rodar(self):
+      anterior = time.perf_counter()
+      while not self._parar.wait(self.intervalo):
+         frame = sys._current_frames().get(self.thread_id)
+         agora = time.perf_counter()
+         if frame is None:
+            break
+         pilha = []
+         while frame is not None:
+            codigo = frame.f_code
+            chave = (codigo.co_name, codigo.co_filename, codigo.co_firstlineno)
+            indice = self.frames.get(chave)
+            if indice is None:
+               indice = self.frames[chave] = len(self.frames)
+            pilha.append(indice)
+            frame = frame.f_back
+         pilha.reverse()
+         self.amostras.append(pilha)
+         self.pesos.append((agora - anterior) * 1000)
+         anterior = agora
+
+   def speedscope(self, nome="GLP Installation Sizer"):
+      frames = [None] * len(self.frames)
+      for (funcao, arquivo, linha), indice in self.frames.items():
+         frames[indice] = {"name": funcao, "file": arquivo, "line": linha}
+      fim = self.fim if self.fim is not None else time.perf_counter()
+      return {
+         "$schema": "https://www.speedscope.app/file-format-schema.json",
+         "shared": {"frames": frames},
+         "profiles": [{
+            "type": "sampled",
+            "name": nome,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": (fim - self.inicio) * 1000 if self.inicio is not None else 0,
+            "samples": self.amostras,
+            "weights": self.pesos,
+         }],
+         "name": nome,
+         "exporter": "rastreamento.py",
+      }
+
+class Rastreador:
+   def __init__(self):
+      self.ativo = False
+      self.eventos = deque(maxlen=MAXIMO_EVENTOS)
+      self.origem = time.perf_counter()
+      self.amostrador = None
+      self.perfil = None
+
+   # Intervalos
+
+   def iniciar(self):
+      self.ativo = True
+
+   def parar(self):
+      self.ativo = False
+
+   def limpar(self):
+      self.eventos.clear()
+      self.origem = time.perf_counter()
+
+   def registrar(self, nome, categoria, inicio, fim, args=None):
+      self.eventos.append((nome, categoria, inicio, fim, threading.get_ident(), args))
+
+   @contextmanager
+   def intervalo(self, nome, categoria="geral", **args):
+      if not self.ativo:
+         yield
+         return
+      inicio = time.perf_counter()
+      try:
+         yield
+      finally:
+         self.registrar(nome, categoria, inicio, time.perf_counter(), args or None)
+
+   def chrome_trace(self):
+      pid = os.getpid()
+      eventos = [{
+         "name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+         "args": {"name": "GLP Installation Sizer"},
+      }]
+      for nome, categoria, inicio, fim, tid, args in self.eventos:
+         evento = {
+            "name": nome,
+            "cat": categoria,
+            "ph": "X",
+            "ts": (inicio - self.origem) * 1e6,
+            "dur": (fim - inicio) * 1e6,
+            "pid": pid,
+            "tid": tid,
+         }
+         if args:
+            evento["args"] = {chave: str(valor) for chave, valor in args.items()}
+         eventos.append(evento)
+      return {"traceEvents": eventos, "displayTimeUnit": "ms"}
+
+   def resumo(self, limite=15):
+      # [(nome, categoria, chamadas, total ms, maximo ms)] pelo tempo total
+      totais = {}
+      for nome, categoria, inicio, fim, _, _ in self.eventos:
+         chamadas, total, maximo = totais.get((nome, categoria), (0, 0.0, 0.0))
+         duracao = (fim - inicio) * 1000
+         totais[(nome, categoria)] = (chamadas + 1, total + duracao, max(maximo, duracao))
+      linhas = [(nome, categoria, *valores) for (nome, categoria), valores in totais.items()]
+      return sorted(linhas, key=lambda linha: linha[3], reverse=True)[:limite]
+
+   # Perfiladores
+
+   def iniciar_amostragem(self, thread_id=None, intervalo=INTERVALO_AMOSTRAGEM):
+      if self.amostrador is not None:
+         return
+      self.amostrador = Amostrador(thread_id or threading.main_thread().ident, intervalo)
+      self.amostrador.iniciar()
+
+   def parar_amostragem(self):
+      # Devolve o amostrador parado, pronto para exportar
+      amostrador, self.amostrador = self.amostrador, None
+      if amostrador is not None:
+         amostrador.parar()
+      return amostrador
+
+   def iniciar_cprofile(self):
+      # Perfila apenas a thread que chama (a da interface)
+      if self.perfil is not None:
+         return
+      self.perfil = cProfile.Profile()
+      self.perfil.enable()
+
+   def parar_cprofile(self):
+      perfil, self.perfil = self.perfil, None
+      if perfil is not None:
+         perfil.disable()
+      return perfil
+
+   # Exportacao
+
+   def exportar_chrome(self, caminho):
+      with open(caminho, "w", encoding="utf-8") as f:
+         json.dump(self.chrome_trace(), f)
+      return caminho
+
+   def exportar_speedscope(self, caminho, amostrador):
+      with open(caminho, "w", encoding="utf-8") as f:
+         json.dump(amostrador.speedscope(), f)
+      return caminho
+
+   def exportar_tudo(self, pasta):
+      # Para os perfiladores ativos e grava o que houver; devolve os arquivos
+      os.makedirs(pasta, exist_ok=True)
+      sufixo = time.strftime("%Y%m%d_%H%M%S")
+      arquivos = []
+      if self.eventos:
+         arquivos.append(self.exportar_chrome(os.path.join(pasta, f"rastreamento_{sufixo}.json")))
+      amostrador = self.parar_amostragem()
+      if amostrador is not None and amostrador.amostras:
+         arquivos.append(self.exportar_speedscope(os.path.join(pasta, f"amostragem_{sufixo}.speedscope.json"), amostrador))
+      perfil = self.parar_cprofile()
+      if perfil is not None:
+         caminho = os.path.join(pasta, f"cprofile_{sufixo}.prof")
+         perfil.dump_stats(caminho)
+         arquivos.append(caminho)
+      return arquivos
+
+   def configurar_ambiente(self, valor=None):
+      # Liga os modos listados em DIAGNOSTICO; devolve os modos ligados
+      valor = os.getenv("DIAGNOSTICO", "") if valor is None else valor
+      modos = [m.strip().lower() for m in valor.split(",") if m.strip()]
+      if "1" in modos or "tudo" in modos:
+         modos = ["rastreamento", "amostragem"]
+      desconhecidos = [m for m in modos if m not in MODOS]
+      if desconhecidos:
+         raise ValueError(f"Modos de diagnostico desconhecidos: {', '.join(desconhecidos)}")
+      if "rastreamento" in modos:
+         self.iniciar()
+      if "amostragem" in modos:
+         self.iniciar_amostragem()
+      if "cprofile" in modos:
+         self.iniciar_cprofile()
+      return modos
+
+# Instancia unica usada pela interface e pelos modulos de calculo
+RASTREADOR = Rastreador()
+
+def rastreado(categoria="geral", nome=None):
+   # Decorador: registra cada chamada como um intervalo quando o rastreador esta ativo
+   def decorador(funcao):
+      rotulo = nome or funcao.__qualname__
+
+      @functools.wraps(funcao)
+      def envolvida(*args, **kwargs):
+         if not RASTREADOR.ativo:
+            return funcao(*args, **kwargs)
+         inicio = time.perf_counter()
+         try:
+            return funcao(*args, **kwargs)
+         finally:
+            RASTREADOR.registrar(rotulo, categoria, inicio, time.perf_counter())
+      return envolvida
+   return decorador
@@ -0,0 +1,218 @@
+import numpy as np
+
+# Modelo da rede em memoria como colunas (struct-of-arrays): um array tipado
+# por atributo de trecho e as pecas em formato CSR (offsets por trecho), com a
+# peca codificada como indice inteiro no catalogo carregado junto.
+# O servidor empacota as linhas em um unico bytea (int4send/float8send, big-endian)
+# que vira um array estruturado com np.frombuffer, sem criar objetos Python por linha.
+
+REDES = ("primaria", "secundaria")
+
+SQL_TRECHOS = """
+   SELECT coalesce(string_agg(
+      int4send(t.id) || int4send(t.projeto_id) || int2send((t.rede = 'secundaria')::int::int2)
+      || int4send(coalesce(t.tubo_id, -1)) || float8send(coalesce(tb.diametro_interno::float8, 'NaN'))
+      || float8send(t.lreal::float8) || float8send(t.delta_h::float8),
+      ''::bytea ORDER BY t.id), ''::bytea)
+   FROM trecho t
+   LEFT JOIN tubo tb ON tb.id = t.tubo_id
+   WHERE t.projeto_id = ANY(%s)"""
+
+# Index-only scan em idx_trechopeca_trecho_peca (trecho_id, peca_id) INCLUDE (qtde_peca)
+SQL_PECAS = """
+   SELECT coalesce(string_agg(
+      int4send(tp.trecho_id) || int4send(tp.peca_id) || int4send(tp.qtde_peca),
+      ''::bytea ORDER BY tp.trecho_id, tp.peca_id), ''::bytea)
+   FROM trecho_peca tp
+   JOIN trecho t ON t.id = tp.trecho_id
+   WHERE t.projeto_id = ANY(%s)"""
+
+SQL_CATALOGO_PECAS = """
+   SELECT coalesce(string_agg(int4send(id) || float8send(leqv::float8), ''::bytea ORDER BY id), ''::bytea)
+   FROM peca"""
+
+# Textos para exibicao em uma string so, separados por SEPARADOR
+SEPARADOR = "\x1f"
+
+SQL_NOMES = """
+   SELECT coalesce(string_agg(t.nome, E'\\x1f' ORDER BY t.id), ''),
+      coalesce(string_agg(coalesce(tb.diametro_nominal, ''), E'\\x1f' ORDER BY t.id), ''),
+      count(*)
+   FROM trecho t
+   LEFT JOIN tubo tb ON tb.id = t.tubo_id
+   WHERE t.projeto_id = ANY(%s)"""
+
+# Tudo em uma consulta: um unico snapshot, mesmo em READ COMMITTED e qualquer
+# que seja a transacao de quem chama (trechos, pecas e nomes sempre coerentes)
+SQL_REDE = f"SELECT ({SQL_TRECHOS}), ({SQL_PECAS}), ({SQL_CATALOGO_PECAS})"
+SQL_REDE_NOMES = f"{SQL_REDE}, n.* FROM ({SQL_NOMES}) n"
+
+CAMPOS_TRECHO = (
+   ("trecho_id", ">i4"),
+   ("projeto_id", ">i4"),
+   ("rede", ">i2"),
+   ("tubo_id", ">i4"),
+   ("diametro_interno", ">f8"),
+   ("lreal", ">f8"),
+   ("delta_h", ">f8"),
+)
+CAMPOS_PECA = (("trecho_id", ">i4"), ("peca_id", ">i4"), ("qtde", ">i4"))
+CAMPOS_CATALOGO = (("peca_id", ">i4"), ("leqv", ">f8"))
+
+def ler_empacotado(cur, sql, params, campos):
+   cur.execute(sql, params, binary=True)
+   return desempacotar(cur.fetchone()[0], campos)
+
+def desempacotar(dados, campos):
+   # Um bytea com registros de largura fixa -> {campo: array na ordem nativa}
+   dtype = np.dtype(list(campos))
+   if len(dados) % dtype.itemsize:
+      raise ValueError("Registros empacotados com tamanho inesperado")
+   linhas = np.frombuffer(dados, dtype=dtype)
+   return {nome: linhas[nome].astype(np.dtype(tipo).newbyteorder("=")) for nome, tipo in campos}
+
+class Rede:
+   # Trechos ordenados por id; as pecas do trecho i ficam em offsets[i]:offsets[i + 1]
+   def __init__(self, trecho_id, projeto_id, rede, tubo_id, diametro_interno, lreal, delta_h,
+                offsets, peca, qtde, catalogo_peca_id, catalogo_leqv, nome=None, diametro_nominal=None):
+      self.trecho_id = np.asarray(trecho_id, dtype=np.int32)
+      self.projeto_id = np.asarray(projeto_id, dtype=np.int32)
+      self.rede = np.asarray(rede, dtype=np.int8) # indice em REDES
+      self.tubo_id = np.asarray(tubo_id, dtype=np.int32) # -1 sem tubo
+      self.diametro_interno = np.asarray(diametro_interno, dtype=np.float64) # NaN sem tubo
+      self.lreal = np.asarray(lreal, dtype=np.float64)
+      self.delta_h = np.asarray(delta_h, dtype=np.float64)
+      self.offsets = np.asarray(offsets, dtype=np.int64)
+      self.peca = np.asarray(peca, dtype=np.int32) # indice em catalogo_peca_id
+      self.qtde = np.asarray(qtde, dtype=np.int32)
+      self.catalogo_peca_id = np.asarray(catalogo_peca_id, dtype=np.int32)
+      self.catalogo_leqv = np.asarray(catalogo_leqv, dtype=np.float64)
+      # Textos so para exibicao (opcionais)
+      self.nome = None if nome is None else np.asarray(nome, dtype=np.str_)
+      self.diametro_nominal = None if diametro_nominal is None else np.asarray(diametro_nominal, dtype=np.str_)
+
+   def __len__(self):
+      return len(self.trecho_id)
+
+   @property
+   def nbytes(self):
+      return sum(a.nbytes for a in vars(self).values() if isinstance(a, np.ndarray))
+
+   def pecas(self, i):
+      # (peca_id, qtde) do trecho na posicao i
+      inicio, fim = self.offsets[i], self.offsets[i + 1]
+      return self.catalogo_peca_id[self.peca[inicio:fim]], self.qtde[inicio:fim]
+
+   def trecho_da_peca(self):
+      # Posicao do trecho de cada peca (expande os offsets)
+      return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.offsets))
+
+   def leq_pecas(self):
+      pesos = self.catalogo_leqv[self.peca] * self.qtde
+      return np.bincount(self.trecho_da_peca(), weights=pesos, minlength=len(self))
+
+   def leq(self):
+      return self.lreal + self.leq_pecas()
+
+   def mascara(self, rede=None, projeto_id=None, com_diametro=False):
+      selecao = np.ones(len(self), dtype=bool)
+      if rede is not None:
+         selecao &= self.rede == REDES.index(rede)
+      if projeto_id is not None:
+         selecao &= self.projeto_id == projeto_id
+      if com_diametro:
+         selecao &= ~np.isnan(self.diametro_interno)
+      return selecao
+
+   def arrays_calculo(self, selecao=None, leq=None):
+      # (diametro_interno, leq, delta_h) dos trechos selecionados
+      leq = self.leq() if leq is None else leq
+      if selecao is None:
+         return self.diametro_interno, leq, self.delta_h
+      return self.diametro_interno[selecao], leq[selecao], self.delta_h[selecao]
+
+   # Serializacao (snapshot do espelho local)
+
+   def para_dict(self):
+      dados = {
+         chave: valor.tolist()
+         for chave, valor in vars(self).items()
+         if isinstance(valor, np.ndarray)
+      }
+      # NaN nao e JSON valido
+      dados["diametro_interno"] = [None if np.isnan(d) else d for d in self.diametro_interno.tolist()]
+      return dados
+
+   @classmethod
+   def de_dict(cls, dados):
+      dados = dict(dados)
+      dados["diametro_interno"] = np.array(
+         [np.nan if d is None else d for d in dados["diametro_interno"]], dtype=np.float64
+      )
+      return cls(**dados)
+
+def carregar_rede(conn, projeto_ids, com_nomes=True):
+   projeto_ids = list(projeto_ids)
+   with conn.cursor() as cur:
+      if com_nomes:
+         cur.execute(SQL_REDE_NOMES, (projeto_ids, projeto_ids, projeto_ids), binary=True)
+      else:
+         cur.execute(SQL_REDE, (projeto_ids, projeto_ids), binary=True)
+      linha = cur.fetchone()
+   trechos = desempacotar(linha[0], CAMPOS_TRECHO)
+   pecas = desempacotar(linha[1], CAMPOS_PECA)
+   catalogo = desempacotar(linha[2], CAMPOS_CATALOGO)
+   nome = diametro_nominal = None
+   if com_nomes:
+      nomes, diametros, total = linha[3:]
+      nome = nomes.split(SEPARADOR) if total else []
+      diametro_nominal = diametros.split(SEPARADOR) if total else []
+
+   # Pecas ordenadas por trecho_id: os offsets saem de uma busca binaria
+   offsets = np.searchsorted(pecas["trecho_id"], trechos["trecho_id"], side="left")
+   offsets = np.append(offsets, len(pecas["trecho_id"]))
+   peca = np.searchsorted(catalogo["peca_id"], pecas["peca_id"])
+   return Rede(
+      trechos["trecho_id"],
+      trechos["projeto_id"],
+      trechos["rede"],
+      trechos["tubo_id"],
+      trechos["diametro_interno"],
+      trechos["lreal"],
+      trechos["delta_h"],
+      offsets,
+      peca,
+      pecas["qtde"],
+      catalogo["peca_id"],
+      catalogo["leqv"],
+      nome,
+      diametro_nominal,
+   )
+
+if __name__ == "__main__":
+   import sys
+   import time
+   import psycopg as psy
+   from conectar import conectar_db
+
+   # python functions\rede.py <projeto_id> [<projeto_id> ...]
+   if len(sys.argv) < 2:
+      print("Uso: rede.py <projeto_id> [<projeto_id> ...]")
+      sys.exit(1)
+
+   conexao = conectar_db()
+   try:
+      with psy.connect(conexao[0]) as conn:
+         inicio = time.perf_counter()
+         rede = carregar_rede(conn, [int(p) for p in sys.argv[1:]])
+         duracao = time.perf_counter() - inicio
+      print(f"{len(rede)} trechos, {len(rede.peca)} pecas em {duracao * 1000:.1f} ms ({rede.nbytes / 1024:.1f} KiB)")
+      leq = rede.leq()
+      for nome_rede in REDES:
+         selecao = rede.mascara(nome_rede)
+         if selecao.any():
+            print(f"{nome_rede:<10} {selecao.sum():>6} trechos, Leq total {leq[selecao].sum():.1f} m")
+   except Exception as e:
+      print(f"Erro ao carregar a rede: {e}")
+      import traceback
+      traceback.print_exc()
@@ -0,0 +1,278 @@
+import numpy as np
+
+from calculos import PCI_GLP_KG, fator_simultaneidade, potencia_adotada
+from dimensionamento import agrupar_unidades, carregar_criterios
+from historico_calculo import COLUNAS_RESULTADO, ultimos_calculos
+from rastreamento import RASTREADOR, rastreado
+from rede import carregar_rede
+from unidades import potencia_computada
+
+# Selecao de reguladores a partir das vazoes calculadas. O catalogo (regulador)
+# fica em memoria por estagio, ordenado pela vazao maxima: para um lote de
+# demandas (vazao kg/h, pressao de entrada e de saida em kPa) uma unica matriz
+# demanda x modelo diz quais modelos atendem, e o primeiro verdadeiro de cada
+# linha e o menor regulador adequado.
+#
+# Primeiro estagio: um na central, com a maior vazao da rede primaria, do
+# recipiente para a pressao de operacao do projeto. Segundo estagio: um por
+# unidade da rede secundaria (mesmo agrupamento de dimensionamento.py), com a
+# maior vazao da unidade e a menor pressao final da rede primaria na entrada.
+# Vazao acima do maior modelo compativel em pressao: esse modelo em paralelo.
+# Vazao abaixo da faixa (ou entre faixas) fica pendente.
+
+ESTAGIOS = ("primeiro", "segundo")
+
+PRESSAO_RECIPIENTE = 700.0 # kPa, entrada do primeiro estagio
+PRESSAO_BAIXA = 2.8 # kPa, saida do segundo estagio (aparelhos)
+
+COLUNAS_REGULADOR = (
+   "id",
+   "estagio",
+   "modelo",
+   "fabricante",
+   "vazao_min",
+   "vazao_max",
+   "entrada_min",
+   "entrada_max",
+   "saida_min",
+   "saida_max",
+)
+
+class CatalogoReguladores:
+   # linhas no formato de COLUNAS_REGULADOR; cada estagio vira colunas ordenadas por vazao_max
+   def __init__(self, linhas):
+      self.estagios = {}
+      for estagio in ESTAGIOS:
+         do_estagio = sorted((l for l in linhas if l[1] == estagio), key=lambda l: (l[5], l[0]))
+         colunas = list(zip(*do_estagio)) if do_estagio else [()] * len(COLUNAS_REGULADOR)
+         self.estagios[estagio] = {
+            "id": np.array(colunas[0], dtype=np.int64),
+            "modelo": list(colunas[2]),
+            "fabricante": list(colunas[3]),
+            **{
+               nome: np.array(valores, dtype=np.float64)
+               for nome, valores in zip(COLUNAS_REGULADOR[4:], colunas[4:])
+            },
+         }
+
+   def __len__(self):
+      return sum(len(c["id"]) for c in self.estagios.values())
+
+   def selecionar(self, estagio, vazao, entrada, saida):
+      # Retorna (posicao no estagio, quantidade) por demanda; posicao -1 sem modelo compativel
+      c = self.estagios[estagio]
+      vazao = np.atleast_1d(np.asarray(vazao, dtype=np.float64))
+      entrada = np.broadcast_to(np.asarray(entrada, dtype=np.float64), vazao.shape)
+      saida = np.broadcast_to(np.asarray(saida, dtype=np.float64), vazao.shape)
+
+      pressao = (
+         (c["entrada_min"] <= entrada[:, None]) & (entrada[:, None] <= c["entrada_max"])
+         & (c["saida_min"] <= saida[:, None]) & (saida[:, None] <= c["saida_max"])
+      )
+      atende = pressao & (c["vazao_min"] <= vazao[:, None]) & (vazao[:, None] <= c["vazao_max"])
+
+      # Ordenado por vazao_max: o primeiro que atende e o menor
+      posicao = np.where(atende.any(axis=1), atende.argmax(axis=1), -1)
+      quantidade = np.ones(len(vazao), dtype=np.int64)
+
+      # Em paralelo so acima da vazao maxima de todos os compativeis em pressao
+      # (o ultimo e o maior), e com a parcela de cada um dentro da faixa dele
+      semelhante = (posicao < 0) & pressao.any(axis=1)
+      if semelhante.any():
+         maior = pressao.shape[1] - 1 - pressao[:, ::-1].argmax(axis=1)
+         paralelo = semelhante & (vazao > c["vazao_max"][maior])
+         if paralelo.any():
+            n = np.ceil(vazao[paralelo] / c["vazao_max"][maior[paralelo]])
+            cabe = vazao[paralelo] / n >= c["vazao_min"][maior[paralelo]]
+            paralelo[paralelo] = cabe
+            posicao = np.where(paralelo, maior, posicao)
+            quantidade[paralelo] = n[cabe]
+      return posicao, quantidade
+
+def carregar_catalogo_reguladores(conn):
+   with conn.cursor() as cur:
+      cur.execute(
+         f"SELECT {', '.join(COLUNAS_REGULADOR)} FROM regulador ORDER BY estagio, vazao_max, id"
+      )
+      return CatalogoReguladores(cur.fetchall())
+
+# Um regulador avulso: busca pelo indice (estagio, vazao_max)
+SQL_REGULADOR_PARA = """
+   SELECT id, modelo, fabricante, vazao_max
+   FROM regulador
+   WHERE estagio = %s AND vazao_max >= %s AND vazao_min <= %s
+      AND entrada_min <= %s AND entrada_max >= %s
+      AND saida_min <= %s AND saida_max >= %s
+   ORDER BY vazao_max
+   LIMIT 1"""
+
+def regulador_para(conn, estagio, vazao, entrada, saida):
+   # Menor regulador do estagio para a vazao (kg/h) e pressoes (kPa); None se nenhum atende
+   with conn.cursor() as cur:
+      cur.execute(SQL_REGULADOR_PARA, (estagio, vazao, vazao, entrada, entrada, saida, saida))
+      return cur.fetchone()
+
+# Demandas do projeto
+
+def demandas_projeto(conn, projeto_id, unidades=None):
+   # [{estagio, localizacao, trecho_id, vazao, entrada, saida}, ...] a partir do ultimo calculo de cada trecho
+   criterios = carregar_criterios(conn, projeto_id)
+   rede = carregar_rede(conn, [projeto_id])
+   calculos = ultimos_calculos(conn, projeto_id)
+
+   potencia = np.full(len(rede), np.nan)
+   pressao_final = np.full(len(rede), np.nan)
+   if calculos:
+      colunas = ("trecho_id", "execucao_id", "executado_em") + COLUNAS_RESULTADO[1:]
+      posicoes = np.searchsorted(rede.trecho_id, [row[0] for row in calculos])
+      potencia[posicoes] = [row[colunas.index("potencia")] for row in calculos]
+      pressao_final[posicoes] = [row[colunas.index("pressao_final")] for row in calculos]
+
+   demandas = []
+   primaria = rede.mascara("primaria") & ~np.isnan(potencia)
+   if primaria.any():
+      i = int(np.flatnonzero(primaria)[np.argmax(potencia[primaria])])
+      vazao_central, trecho_central = float(potencia[i]) / PCI_GLP_KG, int(rede.trecho_id[i])
+      entrada_secundaria = float(np.nanmin(pressao_final[primaria]))
+   else:
+      # Sem calculo da rede primaria: potencia adotada do projeto
+      pot = potencia_computada(conn, projeto_id)
+      vazao_central = potencia_adotada(pot, fator_simultaneidade(pot)) * 60 / PCI_GLP_KG
+      trecho_central = None
+      entrada_secundaria = criterios["pressao_operacao"]
+   if vazao_central > 0:
+      demandas.append({
+         "estagio": "primeiro",
+         "localizacao": "central",
+         "trecho_id": trecho_central,
+         "vazao": vazao_central,
+         "entrada": PRESSAO_RECIPIENTE,
+         "saida": criterios["pressao_operacao"],
+      })
+
+   secundaria = rede.mascara("secundaria") & ~np.isnan(potencia)
+   for chave, trechos in agrupar_unidades(rede, secundaria, unidades).items():
+      posicoes = [i for _, i in trechos]
+      i = posicoes[int(np.argmax(potencia[posicoes]))]
+      demandas.append({
+         "estagio": "segundo",
+         "localizacao": str(chave[2]) if chave[0] == "unidade" else str(rede.nome[i]),
+         "trecho_id": int(rede.trecho_id[i]),
+         "vazao": float(potencia[i]) / PCI_GLP_KG,
+         "entrada": entrada_secundaria,
+         "saida": PRESSAO_BAIXA,
+      })
+   return demandas
+
+def selecionar_demandas(catalogo, demandas):
+   # Uma passada por estagio; devolve (selecionados, pendentes)
+   selecionados, pendentes = [], []
+   for estagio in ESTAGIOS:
+      lote = [d for d in demandas if d["estagio"] == estagio]
+      if not lote:
+         continue
+      posicao, quantidade = catalogo.selecionar(
+         estagio,
+         [d["vazao"] for d in lote],
+         [d["entrada"] for d in lote],
+         [d["saida"] for d in lote],
+      )
+      c = catalogo.estagios[estagio]
+      for demanda, p, q in zip(lote, posicao.tolist(), quantidade.tolist()):
+         if p < 0:
+            pendentes.append(demanda)
+            continue
+         selecionados.append({
+            **demanda,
+            "regulador_id": int(c["id"][p]),
+            "modelo": c["modelo"][p],
+            "fabricante": c["fabricante"][p],
+            "quantidade": q,
+         })
+   return selecionados, pendentes
+
+def reguladores_projeto(conn, projeto_id):
+   # (estagio, modelo, localizacao, quantidade, vazao, automatico) para exibicao
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         SELECT r.estagio, r.modelo, rp.localizacao, rp.quantidade, rp.vazao, rp.automatico
+         FROM regulador_projeto rp
+         JOIN regulador r ON r.id = rp.regulador_id
+         WHERE rp.projeto_id = %s
+         ORDER BY r.estagio, rp.localizacao, r.vazao_max
+         """,
+         (projeto_id,),
+      )
+      return cur.fetchall()
+
+@rastreado("banco")
+def gravar_selecao(conn, projeto_id, selecionados):
+   # Substitui as escolhas automaticas anteriores; as informadas a mao prevalecem
+   with conn.cursor() as cur:
+      cur.execute(
+         "DELETE FROM regulador_projeto WHERE projeto_id = %s AND automatico",
+         (projeto_id,),
+      )
+      cur.execute(
+         """
+         INSERT INTO regulador_projeto
+            (projeto_id, regulador_id, trecho_id, localizacao, quantidade, vazao, automatico)
+         SELECT %s, s.regulador_id, s.trecho_id, s.localizacao, s.quantidade, s.vazao, TRUE
+         FROM unnest(%s::int[], %s::int[], %s::text[], %s::int[], %s::real[])
+            AS s(regulador_id, trecho_id, localizacao, quantidade, vazao)
+         ON CONFLICT (projeto_id, regulador_id, localizacao) DO NOTHING
+         """,
+         (
+            projeto_id,
+            [s["regulador_id"] for s in selecionados],
+            [s["trecho_id"] for s in selecionados],
+            [s["localizacao"][:100] for s in selecionados],
+            [s["quantidade"] for s in selecionados],
+            [s["vazao"] for s in selecionados],
+         ),
+      )
+      return cur.rowcount
+
+@rastreado("calculo")
+def selecionar_reguladores(conn, projeto_id, unidades=None, catalogo=None, gravar=True):
+   # Retorna (selecionados, pendentes); grava em regulador_projeto sem fazer commit
+   catalogo = catalogo or carregar_catalogo_reguladores(conn)
+   demandas = demandas_projeto(conn, projeto_id, unidades)
+   with RASTREADOR.intervalo("selecionar_reguladores", "calculo", demandas=len(demandas)):
+      selecionados, pendentes = selecionar_demandas(catalogo, demandas)
+   if gravar:
+      gravar_selecao(conn, projeto_id, selecionados)
+   return selecionados, pendentes
+
+if __name__ == "__main__":
+   import sys
+   import time
+   from collections import Counter
+   import psycopg as psy
+   from conectar import conectar_db
+
+   # python functions\reguladores.py <projeto_id> [--simular]
+   if len(sys.argv) < 2:
+      print("Uso: reguladores.py <projeto_id> [--simular]")
+      sys.exit(1)
+
+   conexao = conectar_db()
+   try:
+      with psy.connect(conexao[0]) as conn:
+         inicio = time.perf_counter()
+         selecionados, pendentes = selecionar_reguladores(
+            conn, int(sys.argv[1]), gravar="--simular" not in sys.argv
+         )
+         conn.commit()
+      print(f"{len(selecionados)} reguladores em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+      modelos = Counter((s["estagio"], s["modelo"], s["quantidade"]) for s in selecionados)
+      for (estagio, modelo, quantidade), total in sorted(modelos.items()):
+         print(f"{estagio:<9} {modelo:<10} x{quantidade} em {total} locais")
+      for demanda in pendentes:
+         print(f"Sem regulador: {demanda['estagio']} {demanda['localizacao']} "
+               f"{demanda['vazao']:.2f} kg/h, {demanda['entrada']:.1f} -> {demanda['saida']:.1f} kPa")
+   except Exception as e:
+      print(f"Erro ao selecionar reguladores: {e}")
+      import traceback
+      traceback.print_exc()
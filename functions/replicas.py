@@ -0,0 +1,243 @@
+import itertools
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from psycopg.pq import TransactionStatus
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+from conectar import com_schema, prepare_configurado
+
+# Roteamento entre o servidor primario e replicas de streaming. Cada endpoint
+# tem o proprio pool. Escritas vao sempre ao primario; leituras vao a uma
+# replica em rodizio, desde que o atraso de replicacao esteja dentro do limite
+# e, para a sessao que acabou de gravar, que a replica ja tenha reproduzido o
+# WAL dessa gravacao (read-your-writes). Senao, a leitura cai no primario.
+#
+# O estado de cada replica (LSN reproduzido e atraso) e consultado na retirada
+# da conexao e reaproveitado por INTERVALO_VERIFICACAO segundos. Uma replica
+# fora do ar fica de lado por PAUSA_FALHA segundos. Replica sem WAL receiver
+# em streaming (desligada do primario) nao tem atraso conhecido: nao atende.
+
+ATRASO_MAXIMO = 5.0 # s
+INTERVALO_VERIFICACAO = 1.0 # s
+PAUSA_FALHA = 30.0 # s
+ESPERA_PRIMARIO = 5.0 # s para obter conexao do pool do primario
+ESPERA_REPLICA = 1.0 # s; replica lenta cede a vez ao primario
+
+# receive_lsn = replay_lsn so significa atraso zero com o receiver em streaming;
+# status so e visivel com pg_read_all_stats, senao basta o receiver existir
+SQL_ESTADO_REPLICA = """
+   SELECT
+      (CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END)::text,
+      CASE
+         WHEN NOT pg_is_in_recovery() THEN 0
+         WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver WHERE coalesce(status = 'streaming', pid IS NOT NULL)
+         ) THEN NULL
+         WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+         ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+      END"""
+
+def lsn_para_int(lsn):
+   # "16/B374D848" -> posicao no WAL como inteiro
+   if lsn is None:
+      return None
+   alto, baixo = lsn.split("/")
+   return (int(alto, 16) << 32) | int(baixo, 16)
+
+def _encerrar_leitura(conn):
+   # Transacao implicita da leitura termina aqui, e nao no rollback do pool
+   if conn.info.transaction_status == TransactionStatus.INTRANS:
+      conn.rollback()
+
+class Sessao:
+   # Marca de read-your-writes: LSN do primario apos a ultima escrita da sessao
+   def __init__(self):
+      self.lsn = None
+
+   def registrar(self, lsn):
+      lsn = lsn_para_int(lsn)
+      if lsn is not None and (self.lsn is None or lsn > self.lsn):
+         self.lsn = lsn
+
+class _Replica:
+   def __init__(self, nome, pool):
+      self.nome = nome
+      self.pool = pool
+      self.lsn = None
+      self.atraso = None
+      self.verificado_em = float("-inf")
+      self.fora_ate = float("-inf")
+
+class RoteadorConexoes:
+   def __init__(
+      self,
+      primario,
+      replicas=(),
+      atraso_maximo=ATRASO_MAXIMO,
+      min_size=1,
+      max_size=5,
+      **kwargs,
+   ):
+      # kwargs vao para psycopg.connect de todos os endpoints (ex.: prepare_threshold)
+      self.atraso_maximo = atraso_maximo
+      self.primario = ConnectionPool(
+         primario, min_size=min_size, max_size=max_size, timeout=ESPERA_PRIMARIO,
+         kwargs=kwargs, name="primario", open=False,
+      )
+      self.replicas = [
+         _Replica(f"replica{i}", ConnectionPool(
+            dsn, min_size=min_size, max_size=max_size, timeout=ESPERA_REPLICA,
+            kwargs=kwargs, name=f"replica{i}", open=False,
+         ))
+         for i, dsn in enumerate(replicas, 1)
+      ]
+      self.estatisticas = Counter()
+      self._rodizio = itertools.count()
+      self._trava = threading.Lock()
+
+   def abrir(self, wait=False, timeout=ESPERA_PRIMARIO):
+      # wait vale so para o primario: replica fora do ar nao impede a abertura
+      self.primario.open(wait=wait, timeout=timeout)
+      for replica in self.replicas:
+         replica.pool.open(wait=False)
+      return self
+
+   def fechar(self):
+      for pool in [self.primario] + [r.pool for r in self.replicas]:
+         pool.close()
+
+   def __enter__(self):
+      return self.abrir()
+
+   def __exit__(self, *exc):
+      self.fechar()
+
+   @contextmanager
+   def escrita(self, sessao=None, autocommit=False):
+      # Conexao do primario; com sessao, guarda o LSN para as leituras seguintes
+      with self.primario.connection() as conn:
+         conn.autocommit = autocommit
+         self.estatisticas["escrita"] += 1
+         yield conn
+         if sessao is not None and conn.info.transaction_status == TransactionStatus.IDLE:
+            conn.autocommit = True
+            sessao.registrar(conn.execute("SELECT pg_current_wal_lsn()::text").fetchone()[0])
+
+   @contextmanager
+   def leitura(self, sessao=None, autocommit=False):
+      # Replica em dia com a sessao e dentro do atraso maximo; senao o primario
+      conn, replica = self._conexao_replica(sessao.lsn if sessao is not None else None)
+      if conn is None:
+         self.estatisticas["leitura_primario"] += 1
+         with self.primario.connection() as conn:
+            conn.autocommit = autocommit
+            yield conn
+            _encerrar_leitura(conn)
+         return
+      self.estatisticas[f"leitura_{replica.nome}"] += 1
+      try:
+         conn.autocommit = autocommit
+         yield conn
+         _encerrar_leitura(conn)
+      finally:
+         replica.pool.putconn(conn)
+
+   def _conexao_replica(self, lsn_minimo):
+      agora = time.monotonic()
+      candidatas = [r for r in self.replicas if r.fora_ate <= agora]
+      if not candidatas:
+         return None, None
+      inicio = next(self._rodizio) % len(candidatas)
+      for replica in candidatas[inicio:] + candidatas[:inicio]:
+         recente = time.monotonic() - replica.verificado_em < INTERVALO_VERIFICACAO
+         if recente and not self._dentro_do_atraso(replica):
+            # Atrasada na ultima consulta: nem retira conexao
+            continue
+         try:
+            conn = replica.pool.getconn()
+         except PoolTimeout:
+            # Pool cheio: replica so ocupada; senao nao conecta (fora do ar)
+            if replica.pool.get_stats().get("pool_size", 0) < replica.pool.max_size:
+               self._marcar_fora(replica)
+            continue
+         try:
+            # Atras do LSN da sessao no estado guardado: consulta de novo
+            if not recente or not self._em_dia(replica, lsn_minimo):
+               self._verificar(replica, conn)
+         except Exception:
+            replica.pool.putconn(conn)
+            self._marcar_fora(replica)
+            continue
+         if self._em_dia(replica, lsn_minimo):
+            return conn, replica
+         replica.pool.putconn(conn)
+         self.estatisticas["replica_atrasada"] += 1
+      return None, None
+
+   def _verificar(self, replica, conn):
+      conn.autocommit = True
+      lsn, atraso = conn.execute(SQL_ESTADO_REPLICA).fetchone()
+      with self._trava:
+         replica.lsn = lsn_para_int(lsn)
+         replica.atraso = float(atraso) if atraso is not None else None
+         replica.verificado_em = time.monotonic()
+
+   def _dentro_do_atraso(self, replica):
+      return replica.atraso is not None and replica.atraso <= self.atraso_maximo
+
+   def _em_dia(self, replica, lsn_minimo):
+      if not self._dentro_do_atraso(replica):
+         return False
+      return lsn_minimo is None or (replica.lsn is not None and replica.lsn >= lsn_minimo)
+
+   def _marcar_fora(self, replica):
+      with self._trava:
+         replica.fora_ate = time.monotonic() + PAUSA_FALHA
+      self.estatisticas["replica_fora"] += 1
+
+   def situacao(self):
+      # [(endpoint, lsn, atraso, fora_do_ar)] para diagnostico
+      agora = time.monotonic()
+      return [("primario", None, 0.0, False)] + [
+         (r.nome, r.lsn, r.atraso, r.fora_ate > agora) for r in self.replicas
+      ]
+
+def replicas_configuradas():
+   # DB_REPLICAS: DSNs ou URLs das replicas separados por ";"
+   valor = os.getenv("DB_REPLICAS") or ""
+   return [com_schema(dsn.strip()) for dsn in valor.split(";") if dsn.strip()]
+
+def atraso_configurado():
+   valor = os.getenv("DB_ATRASO_MAXIMO")
+   return float(valor) if valor else ATRASO_MAXIMO
+
+def roteador_configurado(conn_info, **kwargs):
+   # Primario em conn_info (ja com schema); replicas, atraso maximo e
+   # prepare_threshold (DB_PREPARE_THRESHOLD) do ambiente
+   kwargs.setdefault("prepare_threshold", prepare_configurado())
+   return RoteadorConexoes(conn_info, replicas_configuradas(), atraso_configurado(), **kwargs)
+
+if __name__ == "__main__":
+   from conectar import conectar_db
+
+   # python functions\replicas.py
+   conexao = conectar_db()
+   try:
+      with roteador_configurado(conexao[0]) as roteador:
+         sessao = Sessao()
+         with roteador.escrita(sessao) as conn:
+            pass
+         with roteador.leitura(sessao) as conn:
+            servidor = conn.execute("SELECT inet_server_addr()::text, inet_server_port()").fetchone()
+         print(f"Leitura apos escrita servida por {servidor[0] or 'socket local'}:{servidor[1]}")
+         for endpoint, lsn, atraso, fora in roteador.situacao():
+            estado = "fora do ar" if fora else (f"atraso {atraso:.2f} s" if atraso is not None else "sem streaming")
+            print(f"{endpoint:<10} {estado}")
+   except Exception as e:
+      print(f"Erro ao verificar replicas: {e}")
+      import traceback
+      traceback.print_exc()
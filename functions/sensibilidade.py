@@ -0,0 +1,212 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from acesso_dados import CRITERIOS_PADRAO
+from calculos import DENSIDADE_AR, GRAVIDADE, PCI_GLP_KG, PCI_GLP_M3
+from cenarios import TEMPERATURA_REFERENCIA, fator_simultaneidade_lote, perda_carga_lote, velocidade_lote
+from rede import carregar_rede
+
+# Analise de sensibilidade (Monte Carlo): amostra as entradas incertas, calcula
+# central e rede primaria por lotes vetorizados e distribui os lotes em processos.
+
+# Distribuicoes padrao das entradas. Densidade, temperatura e pressao ficam
+# centradas no criterio_projeto do projeto (distribuicoes())
+INCERTEZAS_PADRAO = {
+   "prob_uso": 1.0, # chance de cada unidade de equipamento existir/estar em uso (binomial)
+   "cv_potencia": 0.05, # coeficiente de variacao da potencia unitaria (normal)
+   "cv_simultaneidade": 0.10, # coeficiente de variacao do fator de simultaneidade (normal)
+   "variacao_densidade": 0.25, # uniforme em densidade_relativa +- variacao
+   "desvio_temperatura": 5.0, # normal em temperatura_projeto, desvio em graus C
+   "variacao_pressao": 0.0, # uniforme em pressao_operacao +- variacao, kPa
+}
+
+PERCENTIS = (5, 50, 95, 99)
+
+RESULTADOS = ("pot_computada", "fator_simultaneidade", "vazao_kg", "vazao_m3",
+              "num_cilindros", "velocidade_max", "perda_max_trecho")
+
+# Banco
+
+def carregar_dados(conn, projeto_id, tipo_cilindro):
+   with conn.cursor() as cur:
+      cur.execute(
+         "SELECT densidade_relativa, temperatura_projeto, pressao_operacao FROM criterio_projeto WHERE projeto_id = %s",
+         (projeto_id,),
+      )
+      criterios = cur.fetchone()
+      cur.execute(
+         """
+         SELECT ep.qtde_equipamentos, e.pot_kcalmin
+         FROM equipamento_projeto ep
+         JOIN equipamento e ON e.id = ep.equipamento_id
+         WHERE ep.projeto_id = %s AND ep.qtde_equipamentos > 0
+         ORDER BY e.id
+         """,
+         (projeto_id,),
+      )
+      equipamentos = cur.fetchall()
+      cur.execute("SELECT taxa_vaporizacao FROM cilindro WHERE tipo = %s", (tipo_cilindro,))
+      row = cur.fetchone()
+   if row is None:
+      raise ValueError(f"Cilindro {tipo_cilindro} nao encontrado")
+   rede = carregar_rede(conn, [projeto_id], com_nomes=False)
+   trechos = rede.arrays_calculo(rede.mascara("primaria", com_diametro=True))
+   chaves = ("densidade_relativa", "temperatura_projeto", "pressao_operacao")
+   return {
+      "qtdes": np.array([e[0] for e in equipamentos], dtype=np.int64),
+      "potencias": np.array([e[1] for e in equipamentos], dtype=np.float64),
+      "trechos": np.column_stack(trechos),
+      "taxa_vaporizacao": float(row[0]),
+      # Sem criterio_projeto, os padroes da interface
+      "criterios": {
+         c: float(v if v is not None else CRITERIOS_PADRAO[c])
+         for c, v in zip(chaves, criterios or (None,) * len(chaves))
+      },
+   }
+
+def distribuicoes(criterios, incertezas):
+   # Parametros de amostragem de densidade, temperatura e pressao em torno dos
+   # criterios do projeto; chaves ja informadas em incertezas prevalecem
+   s = criterios["densidade_relativa"]
+   t = criterios["temperatura_projeto"]
+   p = criterios["pressao_operacao"]
+   return {
+      "densidade_relativa": (s - incertezas["variacao_densidade"], s + incertezas["variacao_densidade"]),
+      "temperatura": (t, incertezas["desvio_temperatura"]),
+      "pressao_operacao": (p - incertezas["variacao_pressao"], p + incertezas["variacao_pressao"]),
+      **incertezas,
+   }
+
+# Simulacao
+
+def simular_lote(dados, incertezas, tamanho, semente, fator_seguranca=1, pci_kg=PCI_GLP_KG, pci_m3=PCI_GLP_M3):
+   # Um lote de amostras: cada linha dos arrays e uma amostra; incertezas ja com
+   # as distribuicoes de densidade, temperatura e pressao (distribuicoes())
+   rng = np.random.default_rng(semente)
+   n = tamanho
+
+   qtdes = rng.binomial(dados["qtdes"], incertezas["prob_uso"], size=(n, len(dados["qtdes"])))
+   potencias = dados["potencias"] * rng.normal(1.0, incertezas["cv_potencia"], size=qtdes.shape)
+   pot = np.einsum("ij,ij->i", qtdes, np.maximum(potencias, 0))
+
+   ruido = rng.normal(1.0, incertezas["cv_simultaneidade"], size=n)
+   fator = np.clip(fator_simultaneidade_lote(pot) * ruido, 0, 100)
+   adotada = pot * fator / 100
+   vazao_kg = adotada * 60 / pci_kg
+   num = np.ceil(vazao_kg * fator_seguranca / dados["taxa_vaporizacao"])
+
+   s = rng.uniform(*incertezas["densidade_relativa"], size=n)
+   temperatura = rng.normal(*incertezas["temperatura"], size=n)
+   pressao = rng.uniform(*incertezas["pressao_operacao"], size=n)
+   # Mesma base e mesmo efeito da temperatura de cenarios.varrer_cenarios
+   vazao_m3 = adotada * 60 / pci_m3
+
+   vel_max = np.zeros(n)
+   perda_max = np.zeros(n)
+   if len(dados["trechos"]):
+      d, ltotal, delta_h = dados["trechos"].T
+      fator_t = (273.15 + temperatura[:, None]) / (273.15 + TEMPERATURA_REFERENCIA)
+      q = vazao_m3[:, None] * fator_t
+      dp = (perda_carga_lote(q, ltotal, d, s[:, None] / fator_t, pressao[:, None])
+            + GRAVIDADE * DENSIDADE_AR * (s[:, None] - 1) * delta_h / 1000)
+      v = velocidade_lote(q, d, np.maximum(pressao[:, None] - dp, 0))
+      vel_max = v.max(axis=1)
+      perda_max = dp.max(axis=1)
+
+   return {
+      "pot_computada": pot,
+      "fator_simultaneidade": fator,
+      "vazao_kg": vazao_kg,
+      "vazao_m3": vazao_m3,
+      "num_cilindros": num,
+      "velocidade_max": vel_max,
+      "perda_max_trecho": perda_max,
+   }
+
+def _simular_lote(args):
+   return simular_lote(*args)
+
+def monte_carlo(dados, amostras=100000, incertezas=None, tamanho_lote=10000,
+                processos=None, semente=None, fator_seguranca=1):
+   incertezas = distribuicoes(dados["criterios"], {**INCERTEZAS_PADRAO, **(incertezas or {})})
+   tamanhos = [tamanho_lote] * (amostras // tamanho_lote)
+   if amostras % tamanho_lote:
+      tamanhos.append(amostras % tamanho_lote)
+   # Sementes independentes por lote: o resultado nao depende do numero de processos
+   sementes = np.random.SeedSequence(semente).spawn(len(tamanhos))
+   tarefas = [(dados, incertezas, t, s, fator_seguranca) for t, s in zip(tamanhos, sementes)]
+
+   processos = min(processos or os.cpu_count() or 1, len(tarefas))
+   if processos <= 1:
+      lotes = [_simular_lote(t) for t in tarefas]
+   else:
+      with ProcessPoolExecutor(max_workers=processos) as pool:
+         lotes = list(pool.map(_simular_lote, tarefas))
+   return {chave: np.concatenate([lote[chave] for lote in lotes]) for chave in RESULTADOS}
+
+def percentis(resultados, percentis=PERCENTIS):
+   return {
+      chave: dict(zip(percentis, np.percentile(valores, percentis)))
+      for chave, valores in resultados.items()
+   }
+
+def resumo_percentis(tabela):
+   titulos = [f"P{p}" for p in next(iter(tabela.values()))]
+   largura = max(len(chave) for chave in tabela)
+   linhas = ["".ljust(largura) + "".join(t.rjust(12) for t in titulos)]
+   for chave, valores in tabela.items():
+      linhas.append(chave.ljust(largura) + "".join(f"{v:12.3f}" for v in valores.values()))
+   return "\n".join(linhas)
+
+if __name__ == "__main__":
+   import argparse
+   import time
+   from conectar import conectar_db
+   from replicas import roteador_configurado
+
+   # python functions\sensibilidade.py 12 P-45 --amostras 100000
+   parser = argparse.ArgumentParser(description="Sensibilidade (Monte Carlo) do dimensionamento")
+   parser.add_argument("projeto", type=int)
+   parser.add_argument("cilindro")
+   parser.add_argument("--amostras", type=int, default=100000)
+   parser.add_argument("--lote", type=int, default=10000)
+   parser.add_argument("--processos", type=int, default=None)
+   parser.add_argument("--semente", type=int, default=None)
+   parser.add_argument("--prob-uso", type=float, default=INCERTEZAS_PADRAO["prob_uso"])
+   parser.add_argument("--cv-potencia", type=float, default=INCERTEZAS_PADRAO["cv_potencia"])
+   parser.add_argument("--cv-simultaneidade", type=float, default=INCERTEZAS_PADRAO["cv_simultaneidade"])
+   # Em torno dos criterios do projeto
+   parser.add_argument("--variacao-densidade", type=float, default=INCERTEZAS_PADRAO["variacao_densidade"])
+   parser.add_argument("--desvio-temperatura", type=float, default=INCERTEZAS_PADRAO["desvio_temperatura"], help="C")
+   parser.add_argument("--variacao-pressao", type=float, default=INCERTEZAS_PADRAO["variacao_pressao"], help="kPa")
+   args = parser.parse_args()
+
+   conexao = conectar_db()
+   try:
+      # Somente leitura: servida por uma replica quando DB_REPLICAS estiver definida
+      with roteador_configurado(conexao[0], min_size=0) as roteador, roteador.leitura() as conn:
+         dados = carregar_dados(conn, args.projeto, args.cilindro)
+      inicio = time.perf_counter()
+      resultados = monte_carlo(
+         dados,
+         amostras=args.amostras,
+         incertezas={
+            "prob_uso": args.prob_uso,
+            "cv_potencia": args.cv_potencia,
+            "cv_simultaneidade": args.cv_simultaneidade,
+            "variacao_densidade": args.variacao_densidade,
+            "desvio_temperatura": args.desvio_temperatura,
+            "variacao_pressao": args.variacao_pressao,
+         },
+         tamanho_lote=args.lote,
+         processos=args.processos,
+         semente=args.semente,
+      )
+      print(resumo_percentis(percentis(resultados)))
+      print(f"{args.amostras} amostras em {time.perf_counter() - inicio:.2f} s")
+   except Exception as e:
+      print(f"Erro na analise de sensibilidade: {e}")
+      import traceback
+      traceback.print_exc()
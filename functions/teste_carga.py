@@ -0,0 +1,543 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
+
+import numpy as np
+import psycopg as psy
+from psycopg import errors, sql
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+from psycopg.pq import TransactionStatus
+
+from acesso_dados import CRITERIOS_PADRAO, campos_alterados, conectar, salvar_alteracoes
+from cache_calculo import CacheCalculo
+from dimensionamento import dimensionar_projeto
+from espelho_local import EspelhoLocal
+from inquilinos import criar_inquilino
+
+# Teste de carga com varios engenheiros ao mesmo tempo, sem interface: cada
+# usuario virtual repete a sessao da interface (listar projetos pelo espelho
+# local, abrir o snapshot, editar e salvar criterios, calcular e reabrir) com
+# as mesmas funcoes de functions/, contra um banco descartavel criado no
+# servidor informado e apagado no final.
+#
+# Modo "threads": uma thread e uma conexao por usuario, como uma interface por
+# engenheiro. Modo "asyncio": cada usuario e uma tarefa, o tempo de pensar e
+# um sleep do loop e as operacoes rodam em `trabalhadores` threads, cada uma
+# com a sua conexao (como atras de um pool); assim centenas de usuarios cabem
+# em poucas conexoes, e a espera por um trabalhador e medida a parte.
+#
+# Por operacao: vazao, percentis de latencia, erros, deadlocks e esperas por
+# lock. As esperas vem de amostras de pg_stat_activity (wait_event_type Lock);
+# cada conexao marca a operacao corrente no application_name.
+
+PREFIXO_BANCO = "glp_carga_"
+PREFIXO_APLICACAO = "carga:"
+
+OPERACOES = ("conectar", "listar", "abrir", "salvar", "calcular")
+
+INTERVALO_AMOSTRA = 0.05 # s entre amostras de pg_stat_activity
+VAZAO_UNIDADE = 0.5 # m3/h por unidade da rede secundaria
+PERCENTIS = (50, 95, 99)
+
+# Banco descartavel
+
+@contextmanager
+def banco_descartavel(conn_info, manter=False):
+   # Banco novo no mesmo servidor, com tabelas, indices e catalogo; apagado no final
+   nome = f"{PREFIXO_BANCO}{uuid.uuid4().hex[:8]}"
+   with psy.connect(conn_info, autocommit=True) as admin:
+      # template0 em UTF8: os scripts e o catalogo tem acentos, qualquer que seja o template1
+      admin.execute(
+         sql.SQL("CREATE DATABASE {} TEMPLATE template0 ENCODING 'UTF8'").format(sql.Identifier(nome))
+      )
+   info = make_conninfo(conn_info, dbname=nome)
+   try:
+      with psy.connect(info) as conn:
+         criar_inquilino(conn, "public")
+      yield info
+   finally:
+      if not manter:
+         with psy.connect(conn_info, autocommit=True) as admin:
+            admin.execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(sql.Identifier(nome)))
+
+def semear_projetos(conn, projetos, unidades=20, trechos_unidade=4, trechos_primaria=6):
+   # Projetos com rede primaria em linha, unidades repetidas na secundaria
+   # (AP<n>/T<m>, como em torres residenciais) e equipamentos por unidade
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         INSERT INTO equipamento (nome, categoria, unidade_medida, pot_unitaria)
+         VALUES ('Fogao 4 bocas (carga)', 'fogao', 'kcal/h', 7000),
+                ('Aquecedor de passagem (carga)', 'aquecedor', 'kcal/min', 250)
+         ON CONFLICT (nome, unidade_medida, pot_unitaria) DO NOTHING
+         """
+      )
+      cur.execute("SELECT id FROM tubo ORDER BY diametro_interno, id")
+      tubos = [row[0] for row in cur.fetchall()]
+      tubo_primaria, tubo_secundaria = tubos[len(tubos) * 2 // 3], tubos[len(tubos) // 3]
+      cur.execute(
+         """
+         INSERT INTO projeto (nome, descricao)
+         SELECT 'carga ' || lpad(g::text, 4, '0'), '{}' FROM generate_series(1, %s) g
+         RETURNING id
+         """,
+         (projetos,),
+      )
+      ids = [row[0] for row in cur.fetchall()]
+      cur.execute(
+         """
+         INSERT INTO criterio_projeto (projeto_id, pressao_operacao, densidade_relativa, temperatura_projeto)
+         SELECT p, %s, %s, %s FROM unnest(%s::int[]) p
+         """,
+         (
+            CRITERIOS_PADRAO["pressao_operacao"],
+            CRITERIOS_PADRAO["densidade_relativa"],
+            CRITERIOS_PADRAO["temperatura_projeto"],
+            ids,
+         ),
+      )
+      cur.execute(
+         """
+         INSERT INTO trecho (projeto_id, rede, nome, tubo_id, lreal, delta_h)
+         SELECT p, 'primaria', 'P' || g, %s, 4 + g, CASE WHEN g = 1 THEN 1 ELSE 0 END
+         FROM unnest(%s::int[]) p, generate_series(1, %s) g
+         """,
+         (tubo_primaria, ids, trechos_primaria),
+      )
+      cur.execute(
+         """
+         INSERT INTO trecho (projeto_id, rede, nome, tubo_id, lreal, delta_h)
+         SELECT p, 'secundaria', 'AP' || u || '/T' || t, %s, 1.5 + t, CASE WHEN t = 1 THEN 2.8 ELSE 0 END
+         FROM unnest(%s::int[]) p, generate_series(1, %s) u, generate_series(1, %s) t
+         """,
+         (tubo_secundaria, ids, unidades, trechos_unidade),
+      )
+      cur.execute(
+         """
+         INSERT INTO trecho_peca (trecho_id, peca_id, qtde_peca)
+         SELECT t.id, (SELECT min(id) FROM peca), 2
+         FROM trecho t
+         WHERE t.projeto_id = ANY(%s)
+         """,
+         (ids,),
+      )
+      cur.execute(
+         """
+         INSERT INTO equipamento_projeto (projeto_id, equipamento_id, qtde_equipamentos)
+         SELECT p, e.id, %s
+         FROM unnest(%s::int[]) p, equipamento e
+         WHERE e.nome LIKE '%%(carga)'
+         """,
+         (unidades, ids),
+      )
+   conn.commit()
+   return ids
+
+# Medicoes
+
+class Medicoes:
+   def __init__(self):
+      self._trava = threading.Lock()
+      self.tempos = defaultdict(list) # operacao -> [ms]
+      self.espera = [] # ms na fila por um trabalhador (modo asyncio)
+      self.erros = Counter()
+      self.deadlocks = Counter()
+      self.amostras_lock = Counter()
+      self.mensagens = Counter()
+
+   def registrar(self, operacao, ms, erro=None):
+      with self._trava:
+         if erro is None:
+            self.tempos[operacao].append(ms)
+            return
+         self.erros[operacao] += 1
+         if isinstance(erro, errors.DeadlockDetected):
+            self.deadlocks[operacao] += 1
+         self.mensagens[f"{operacao}: {type(erro).__name__}: {str(erro).splitlines()[0] if str(erro) else ''}"] += 1
+
+   def registrar_espera(self, ms):
+      with self._trava:
+         self.espera.append(ms)
+
+class AmostradorLocks:
+   # Conta, a cada INTERVALO_AMOSTRA, as conexoes esperando lock por operacao
+   def __init__(self, conn_info, medicoes, intervalo=INTERVALO_AMOSTRA):
+      self.conn_info = conn_info
+      self.medicoes = medicoes
+      self.intervalo = intervalo
+      self.amostras = 0
+      self._parar = threading.Event()
+      self._thread = threading.Thread(target=self._rodar, daemon=True)
+
+   def __enter__(self):
+      self._thread.start()
+      return self
+
+   def __exit__(self, *exc):
+      self._parar.set()
+      self._thread.join()
+
+   def _rodar(self):
+      with psy.connect(self.conn_info, autocommit=True) as conn:
+         while not self._parar.wait(self.intervalo):
+            rows = conn.execute(
+               """
+               SELECT substr(application_name, %s), count(*)
+               FROM pg_stat_activity
+               WHERE datname = current_database()
+                  AND wait_event_type = 'Lock'
+                  AND application_name LIKE %s
+               GROUP BY 1
+               """,
+               (len(PREFIXO_APLICACAO) + 1, PREFIXO_APLICACAO + "%"),
+            ).fetchall()
+            self.amostras += 1
+            with self.medicoes._trava:
+               for operacao, esperando in rows:
+                  self.medicoes.amostras_lock[operacao] += esperando
+
+def estatisticas_servidor(conn_info):
+   with psy.connect(conn_info, autocommit=True) as conn:
+      row = conn.execute(
+         """
+         SELECT deadlocks, xact_commit, xact_rollback
+         FROM pg_stat_database
+         WHERE datname = current_database()
+         """
+      ).fetchone()
+   return dict(zip(("deadlocks", "commits", "rollbacks"), row))
+
+# Sessao de um engenheiro
+
+class Usuario:
+   def __init__(self, numero, semente=0, edicoes=2, pensar=0.0):
+      self.nome = f"usuario{numero:03d}"
+      self.rng = random.Random(semente * 100003 + numero)
+      self.edicoes = edicoes
+      self.pensar = pensar
+      # Espelho em memoria; no modo asyncio o usuario passa por varias threads, uma operacao por vez
+      self.espelho = EspelhoLocal(":memory:", check_same_thread=False)
+      # Cache de calculo da sessao, como na interface
+      self.cache = CacheCalculo()
+      self.projetos = []
+      self.projeto_id = None
+      self.snapshot = None
+      self.falhou = False
+
+   def roteiro(self):
+      # Como na interface: calcular descarta o snapshot e o projeto e reaberto
+      return ("listar", "abrir") + ("salvar",) * self.edicoes + ("calcular", "abrir")
+
+   def operacoes(self, fim, sessoes=None):
+      feitas = 0
+      while sessoes is None or feitas < sessoes:
+         self.projeto_id = None
+         for operacao in self.roteiro():
+            if time.monotonic() >= fim:
+               return
+            yield operacao
+            if self.falhou:
+               # Depois de um erro a sessao recomeca do inicio
+               self.falhou = False
+               break
+         feitas += 1
+
+   def tempo_pensar(self):
+      return self.rng.expovariate(1 / self.pensar) if self.pensar > 0 else 0.0
+
+   def fechar(self):
+      self.espelho.fechar()
+
+def _listar(usuario, conn):
+   usuario.espelho.sincronizar(conn)
+   usuario.projetos = [row[0] for row in usuario.espelho.projetos()]
+
+def _abrir(usuario, conn):
+   if usuario.projeto_id is None:
+      usuario.projeto_id = usuario.rng.choice(usuario.projetos)
+   # A conexao e do usuario: abrir_projeto nao deve fecha-la
+   usuario.snapshot = usuario.espelho.abrir_projeto(usuario.projeto_id, lambda: nullcontext(conn))
+
+def _salvar(usuario, conn):
+   carregados = usuario.snapshot.get("criterios")
+   criterios = dict(carregados or CRITERIOS_PADRAO)
+   criterios["vel_maxima"] = round(usuario.rng.uniform(15.0, 20.0), 1)
+   criterios["perda_carga_maxima"] = round(usuario.rng.uniform(30.0, 45.0), 1)
+   criterios["observacao"] = f"{usuario.nome} {time.time():.3f}"
+   alterados = campos_alterados(carregados, criterios) if carregados else {**CRITERIOS_PADRAO, **criterios}
+   updated_at = salvar_alteracoes(conn, usuario.projeto_id, {}, alterados, criterios_existem=carregados is not None)
+   usuario.espelho.aplicar_alteracoes(usuario.projeto_id, {}, alterados, carregados is not None, updated_at)
+   usuario.snapshot["criterios"] = {**(carregados or CRITERIOS_PADRAO), **alterados}
+
+def _calcular(usuario, conn):
+   with conn.transaction():
+      dimensionar_projeto(conn, usuario.projeto_id, VAZAO_UNIDADE, cache=usuario.cache.usar(conn))
+   usuario.espelho.descartar(usuario.projeto_id)
+
+ACOES = {
+   "listar": _listar,
+   "abrir": _abrir,
+   "salvar": _salvar,
+   "calcular": _calcular,
+}
+
+def _conectar(conn_info, medicoes):
+   # Mesma conexao da interface (autocommit, comandos preparados)
+   inicio = time.perf_counter()
+   try:
+      conn = conectar(conn_info, application_name=PREFIXO_APLICACAO + "ocioso")
+   except Exception as e:
+      medicoes.registrar("conectar", (time.perf_counter() - inicio) * 1000, e)
+      return None
+   medicoes.registrar("conectar", (time.perf_counter() - inicio) * 1000)
+   return conn
+
+def executar_operacao(usuario, conn, operacao, medicoes):
+   # Marca a operacao para o amostrador de locks fora do tempo medido
+   conn.execute("SELECT set_config('application_name', %s, false)", (PREFIXO_APLICACAO + operacao,))
+   inicio = time.perf_counter()
+   try:
+      ACOES[operacao](usuario, conn)
+      medicoes.registrar(operacao, (time.perf_counter() - inicio) * 1000)
+   except Exception as e:
+      medicoes.registrar(operacao, (time.perf_counter() - inicio) * 1000, e)
+      if conn.info.transaction_status != TransactionStatus.IDLE:
+         conn.rollback()
+      usuario.falhou = True
+      if not usuario.projetos:
+         raise
+   finally:
+      if not conn.closed:
+         conn.execute("SELECT set_config('application_name', %s, false)", (PREFIXO_APLICACAO + "ocioso",))
+
+# Execucao
+
+def _executar_threads(conn_info, usuarios, fim, sessoes, rampa, medicoes):
+   def rodar(usuario, atraso):
+      time.sleep(atraso)
+      conn = _conectar(conn_info, medicoes)
+      if conn is None:
+         return
+      try:
+         for operacao in usuario.operacoes(fim, sessoes):
+            executar_operacao(usuario, conn, operacao, medicoes)
+            time.sleep(usuario.tempo_pensar())
+      except Exception:
+         # Sem lista de projetos nao ha sessao possivel: o usuario desiste
+         pass
+      finally:
+         conn.close()
+
+   with ThreadPoolExecutor(max_workers=len(usuarios)) as executor:
+      futuros = [
+         executor.submit(rodar, usuario, rampa * i / len(usuarios)) for i, usuario in enumerate(usuarios)
+      ]
+      for futuro in futuros:
+         futuro.result()
+
+async def _executar_asyncio(conn_info, usuarios, fim, sessoes, rampa, trabalhadores, medicoes):
+   # Uma conexao por thread trabalhadora, aberta no primeiro uso
+   local = threading.local()
+   conexoes = []
+   trava = threading.Lock()
+
+   def na_thread(usuario, operacao):
+      if getattr(local, "conn", None) is None:
+         local.conn = _conectar(conn_info, medicoes)
+         if local.conn is None:
+            raise ConnectionError("sem conexao para o trabalhador")
+         with trava:
+            conexoes.append(local.conn)
+      executar_operacao(usuario, local.conn, operacao, medicoes)
+
+   loop = asyncio.get_running_loop()
+   executor = ThreadPoolExecutor(max_workers=trabalhadores)
+
+   async def rodar(usuario, atraso):
+      await asyncio.sleep(atraso)
+      try:
+         for operacao in usuario.operacoes(fim, sessoes):
+            enviado = time.perf_counter()
+            await loop.run_in_executor(executor, partial(_medir_espera, enviado, medicoes, na_thread, usuario, operacao))
+            await asyncio.sleep(usuario.tempo_pensar())
+      except Exception:
+         pass
+
+   try:
+      await asyncio.gather(*(rodar(usuario, rampa * i / len(usuarios)) for i, usuario in enumerate(usuarios)))
+   finally:
+      executor.shutdown(wait=True)
+      for conn in conexoes:
+         conn.close()
+
+def _medir_espera(enviado, medicoes, funcao, *args):
+   medicoes.registrar_espera((time.perf_counter() - enviado) * 1000)
+   return funcao(*args)
+
+def executar_carga(
+   conn_info,
+   usuarios=20,
+   modo="threads",
+   duracao=60.0,
+   sessoes=None,
+   edicoes=2,
+   pensar=1.0,
+   rampa=0.0,
+   trabalhadores=16,
+   semente=0,
+):
+   # conn_info do banco de teste (banco_descartavel); devolve o relatorio por operacao
+   if modo not in ("threads", "asyncio"):
+      raise ValueError(f"Modo desconhecido: {modo}")
+   medicoes = Medicoes()
+   virtuais = [Usuario(i, semente, edicoes, pensar) for i in range(1, usuarios + 1)]
+   antes = estatisticas_servidor(conn_info)
+   inicio = time.perf_counter()
+   fim = time.monotonic() + duracao
+   try:
+      with AmostradorLocks(conn_info, medicoes) as amostrador:
+         if modo == "threads":
+            _executar_threads(conn_info, virtuais, fim, sessoes, rampa, medicoes)
+         else:
+            asyncio.run(_executar_asyncio(
+               conn_info, virtuais, fim, sessoes, rampa, max(1, trabalhadores), medicoes
+            ))
+   finally:
+      for usuario in virtuais:
+         usuario.fechar()
+   segundos = time.perf_counter() - inicio
+   # Conexoes fechadas: os contadores do banco ja foram enviados
+   depois = estatisticas_servidor(conn_info)
+   caches = [usuario.cache.estatisticas() for usuario in virtuais]
+   return relatorio_carga(medicoes, segundos, amostrador, antes, depois, modo, usuarios, trabalhadores, caches)
+
+def _percentis(tempos):
+   if not tempos:
+      return {f"p{p}": None for p in PERCENTIS} | {"max": None}
+   valores = np.percentile(np.asarray(tempos), PERCENTIS)
+   return {f"p{p}": float(v) for p, v in zip(PERCENTIS, valores)} | {"max": float(max(tempos))}
+
+def relatorio_carga(medicoes, segundos, amostrador, antes, depois, modo, usuarios, trabalhadores, caches=()):
+   operacoes = []
+   for operacao in OPERACOES:
+      tempos = medicoes.tempos.get(operacao, [])
+      erros = medicoes.erros[operacao]
+      if not tempos and not erros:
+         continue
+      amostras = medicoes.amostras_lock[operacao]
+      operacoes.append({
+         "operacao": operacao,
+         "ok": len(tempos),
+         "erros": erros,
+         "por_segundo": len(tempos) / segundos if segundos else 0.0,
+         **_percentis(tempos),
+         "amostras_lock": amostras,
+         # Cada amostra de uma conexao esperando vale um intervalo de espera
+         "espera_lock_ms": amostras * amostrador.intervalo * 1000,
+         "deadlocks": medicoes.deadlocks[operacao],
+      })
+   return {
+      "modo": modo,
+      "usuarios": usuarios,
+      "trabalhadores": trabalhadores if modo == "asyncio" else usuarios,
+      "segundos": segundos,
+      "amostras": amostrador.amostras,
+      "operacoes": operacoes,
+      "espera_trabalhador": _percentis(medicoes.espera) if medicoes.espera else None,
+      "servidor": {chave: depois[chave] - antes[chave] for chave in depois},
+      "cache": {chave: sum(c[chave] for c in caches) for chave in ("acertos_memoria", "acertos_banco", "falhas")},
+      "erros": dict(medicoes.mensagens.most_common(10)),
+   }
+
+def _ms(valor):
+   return f"{valor:9.1f}" if valor is not None else f"{'--':>9}"
+
+def tabela_carga(relatorio):
+   linhas = [
+      f"{relatorio['usuarios']} usuarios ({relatorio['modo']}, {relatorio['trabalhadores']} conexoes) "
+      f"em {relatorio['segundos']:.1f} s",
+      f"{'operacao':<10}{'ok':>7}{'erros':>7}{'ops/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+      f"{'max ms':>9}{'lock ms':>9}{'deadlk':>7}",
+   ]
+   for op in relatorio["operacoes"]:
+      linhas.append(
+         f"{op['operacao']:<10}{op['ok']:>7}{op['erros']:>7}{op['por_segundo']:>8.1f}"
+         f"{_ms(op['p50'])}{_ms(op['p95'])}{_ms(op['p99'])}{_ms(op['max'])}"
+         f"{op['espera_lock_ms']:>9.0f}{op['deadlocks']:>7}"
+      )
+   espera = relatorio["espera_trabalhador"]
+   if espera:
+      linhas.append(f"espera por trabalhador: p50 {espera['p50']:.1f} ms, p95 {espera['p95']:.1f} ms, "
+                    f"p99 {espera['p99']:.1f} ms")
+   servidor = relatorio["servidor"]
+   linhas.append(f"servidor: {servidor['commits']} commits, {servidor['rollbacks']} rollbacks, "
+                 f"{servidor['deadlocks']} deadlocks")
+   cache = relatorio["cache"]
+   consultas = sum(cache.values())
+   if consultas:
+      linhas.append(f"cache de calculo: {cache['acertos_memoria']} acertos em memoria, "
+                    f"{cache['acertos_banco']} no banco, {cache['falhas']} calculados "
+                    f"({(consultas - cache['falhas']) / consultas:.1%} de acertos)")
+   for mensagem, total in relatorio["erros"].items():
+      linhas.append(f"   {total}x {mensagem}")
+   return "\n".join(linhas)
+
+if __name__ == "__main__":
+   import argparse
+   import os
+   from conectar import conectar_db
+
+   # python functions\teste_carga.py --usuarios 200 --modo asyncio --trabalhadores 32 --duracao 120
+   # python functions\teste_carga.py --usuarios 50 --modo threads --projetos 10 --pensar 0.5
+   parser = argparse.ArgumentParser(description="Teste de carga com usuarios virtuais em um banco descartavel")
+   parser.add_argument("--usuarios", type=int, default=20)
+   parser.add_argument("--modo", choices=("threads", "asyncio"), default="threads")
+   parser.add_argument("--trabalhadores", type=int, default=16, help="conexoes no modo asyncio")
+   parser.add_argument("--duracao", type=float, default=60.0, help="s")
+   parser.add_argument("--sessoes", type=int, help="sessoes por usuario (padrao: ate acabar a duracao)")
+   parser.add_argument("--edicoes", type=int, default=2, help="salvamentos por sessao")
+   parser.add_argument("--pensar", type=float, default=1.0, help="tempo medio entre operacoes (s)")
+   parser.add_argument("--rampa", type=float, default=0.0, help="s ate todos os usuarios entrarem")
+   parser.add_argument("--projetos", type=int, default=50, help="menos projetos, mais disputa")
+   parser.add_argument("--unidades", type=int, default=20, help="unidades por projeto")
+   parser.add_argument("--semente", type=int, default=0)
+   parser.add_argument("--manter", action="store_true", help="nao apagar o banco de teste")
+   parser.add_argument("--json", help="grava o relatorio neste arquivo")
+   args = parser.parse_args()
+
+   # O banco de teste usa o schema padrao
+   os.environ.pop("SCHEMA_NAME", None)
+   conexao = conectar_db()
+   try:
+      with banco_descartavel(conexao[0], args.manter) as info:
+         with psy.connect(info) as conn:
+            semear_projetos(conn, args.projetos, args.unidades)
+         relatorio = executar_carga(
+            info,
+            usuarios=args.usuarios,
+            modo=args.modo,
+            duracao=args.duracao,
+            sessoes=args.sessoes,
+            edicoes=args.edicoes,
+            pensar=args.pensar,
+            rampa=args.rampa,
+            trabalhadores=args.trabalhadores,
+            semente=args.semente,
+         )
+         if args.manter:
+            print(f"Banco de teste mantido: {conninfo_to_dict(info)['dbname']}")
+      print(tabela_carga(relatorio))
+      if args.json:
+         with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=3, ensure_ascii=False)
+   except Exception as e:
+      print(f"Erro no teste de carga: {e}")
+      import traceback
+      traceback.print_exc()
@@ -0,0 +1,38 @@
+import numpy as np
+
+from calculos import FATORES_KCALMIN, normalizar_unidade
+
+# Normalizacao de potencia para kcal/min em lote.
+# A mesma tabela (calculos.FATORES_KCALMIN) e usada no banco por pot_kcalmin()
+# e pela coluna equipamento.pot_kcalmin.
+
+def fatores_lote(unidades):
+   # Converte cada unidade distinta uma unica vez e expande pelo indice inverso
+   distintas, inverso = np.unique(np.asarray(unidades, dtype=str), return_inverse=True)
+   normalizadas = [normalizar_unidade(u) for u in distintas]
+   desconhecidas = [u for u, n in zip(distintas, normalizadas) if n not in FATORES_KCALMIN]
+   if desconhecidas:
+      raise ValueError(f"Unidades de potencia desconhecidas: {', '.join(desconhecidas)}")
+   return np.array([FATORES_KCALMIN[n] for n in normalizadas], dtype=np.float64)[inverso]
+
+def converter_lote_kcalmin(valores, unidades):
+   return np.asarray(valores, dtype=np.float64) * fatores_lote(unidades)
+
+def potencia_computada_lote(qtdes, valores, unidades):
+   return float(np.dot(np.asarray(qtdes, dtype=np.float64), converter_lote_kcalmin(valores, unidades)))
+
+# Banco
+
+def potencia_computada(conn, projeto_id):
+   # kcal/min, somada no servidor a partir da coluna cacheada pot_kcalmin
+   with conn.cursor() as cur:
+      cur.execute(
+         """
+         SELECT COALESCE(SUM(ep.qtde_equipamentos * e.pot_kcalmin), 0)
+         FROM equipamento_projeto ep
+         JOIN equipamento e ON e.id = ep.equipamento_id
+         WHERE ep.projeto_id = %s
+         """,
+         (projeto_id,),
+      )
+      return float(cur.fetchone()[0])
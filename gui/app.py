@@ -1,11 +1,38 @@
 import json
 import os
 import sys
+import time
 
+import numpy as np
 import psycopg as psy
 from dotenv import load_dotenv
 from PySide6 import QtCore, QtGui, QtWidgets
 
+FUNCTIONS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "functions"))
+if FUNCTIONS_DIR not in sys.path:
+    sys.path.insert(0, FUNCTIONS_DIR)
+
+from acesso_dados import (  # noqa: E402
+    CRITERIOS_PADRAO,
+    campos_alterados,
+    criar_projeto,
+    executar_alteracoes,
+    salvar_alteracoes,
+)
+from autonomia import autonomia_central, texto_autonomia  # noqa: E402
+from catalogo_binario import abrir_catalogo  # noqa: E402
+from cache_calculo import CacheCalculo  # noqa: E402
+from calculos import PCI_GLP_M3, fator_simultaneidade, potencia_adotada, vazao_glp  # noqa: E402
+from clonar_projeto import clonar_projeto  # noqa: E402
+from conectar import com_schema, schema_configurado  # noqa: E402
+from dimensionamento import dimensionar_projeto  # noqa: E402
+from espelho_local import CAMINHO_PADRAO, EspelhoLocal  # noqa: E402
+from importar_dados import importar_equipamentos, importar_trechos, resumo_relatorio  # noqa: E402
+from rastreamento import RASTREADOR, rastreado  # noqa: E402
+from rede import REDES, Rede  # noqa: E402
+from reguladores import ESTAGIOS, selecionar_reguladores  # noqa: E402
+from replicas import ESPERA_PRIMARIO, PAUSA_FALHA, Sessao, roteador_configurado  # noqa: E402
+
 APP_TITLE = "GLP Installation Sizer"
 
 
@@ -106,11 +133,22 @@ class MainWindow(QtWidgets.QMainWindow):
         self.criteria_observacao = ""
         self._syncing_criteria = False
         self._db_error_shown = False
+        self._rejections_shown = set()
+        self.offline = False
+        self.router = None
+        self._router_error = None
+        self.db_session = Sessao()
+        # Trechos ja calculados nesta sessao (e na tabela cache_calculo) nao sao recalculados
+        self.calc_cache = CacheCalculo()
+        self.diagnostic_modes = self._start_diagnostics()
+        self.mirror = EspelhoLocal(self._get_mirror_path())
         self._build_ui()
         self._apply_styles()
         self._wire_actions()
+        self._load_catalog()
         self._load_projects()
 
+    @rastreado("ui")
     def _build_ui(self):
         pages = [
             ("Novo Projeto", self._build_new_project_page()),
@@ -144,6 +182,38 @@ class MainWindow(QtWidgets.QMainWindow):
         root_layout.addWidget(sidebar)
         root_layout.addWidget(main_area, 1)
         self.setCentralWidget(root)
+        self._build_diagnostics_menu()
+
+    def _build_diagnostics_menu(self):
+        menu = self.menuBar().addMenu("Diagnostico")
+
+        self.trace_action = QtGui.QAction("Rastrear intervalos", self)
+        self.trace_action.setCheckable(True)
+        self.trace_action.setShortcut("Ctrl+Shift+D")
+        self.trace_action.setChecked("rastreamento" in self.diagnostic_modes)
+        self.trace_action.toggled.connect(lambda on: RASTREADOR.iniciar() if on else RASTREADOR.parar())
+
+        self.sampling_action = QtGui.QAction("Perfilador por amostragem", self)
+        self.sampling_action.setCheckable(True)
+        self.sampling_action.setChecked("amostragem" in self.diagnostic_modes)
+        self.sampling_action.toggled.connect(
+            lambda on: RASTREADOR.iniciar_amostragem() if on else self._export_diagnostics()
+        )
+
+        self.cprofile_action = QtGui.QAction("Perfilador deterministico (cProfile)", self)
+        self.cprofile_action.setCheckable(True)
+        self.cprofile_action.setChecked("cprofile" in self.diagnostic_modes)
+        self.cprofile_action.toggled.connect(
+            lambda on: RASTREADOR.iniciar_cprofile() if on else self._export_diagnostics()
+        )
+
+        export_action = QtGui.QAction("Exportar diagnostico...", self)
+        export_action.triggered.connect(lambda: self._export_diagnostics(ask=True))
+
+        for action in (self.trace_action, self.sampling_action, self.cprofile_action):
+            menu.addAction(action)
+        menu.addSeparator()
+        menu.addAction(export_action)
 
     def _build_sidebar(self, labels):
         sidebar = QtWidgets.QFrame()
@@ -280,6 +350,11 @@ class MainWindow(QtWidgets.QMainWindow):
             ["Projeto vazio", "Duplicar projeto existente", "Importar memorial"]
         )
         hero_actions.addWidget(self.new_project_origin_combo)
+        hero_actions.addSpacing(8)
+        hero_actions.addWidget(QtWidgets.QLabel("Projeto de origem"))
+        self.new_project_source_combo = QtWidgets.QComboBox()
+        self.new_project_source_combo.setEnabled(False)
+        hero_actions.addWidget(self.new_project_source_combo)
         hero_actions.addStretch()
         hero_layout.addLayout(hero_actions, 1)
 
@@ -565,10 +640,14 @@ class MainWindow(QtWidgets.QMainWindow):
 
         metrics = QtWidgets.QHBoxLayout()
         metrics.setSpacing(14)
-        metrics.addWidget(make_metric_card("Potencia Computada", "--", "Total de cargas", "amber"))
-        metrics.addWidget(make_metric_card("Fator de Simultaneidade", "--", "Criterio do projeto", "steel"))
-        metrics.addWidget(make_metric_card("Potencia Adotada", "--", "Base para vazao", "orange"))
-        metrics.addWidget(make_metric_card("Vazao GLP", "--", "Projeto", "green"))
+        self.equipment_metric_potencia = make_metric_card("Potencia Computada", "--", "Total de cargas", "amber")
+        self.equipment_metric_fator = make_metric_card("Fator de Simultaneidade", "--", "Criterio do projeto", "steel")
+        self.equipment_metric_adotada = make_metric_card("Potencia Adotada", "--", "Base para vazao", "orange")
+        self.equipment_metric_vazao = make_metric_card("Vazao GLP", "--", "Projeto", "green")
+        metrics.addWidget(self.equipment_metric_potencia)
+        metrics.addWidget(self.equipment_metric_fator)
+        metrics.addWidget(self.equipment_metric_adotada)
+        metrics.addWidget(self.equipment_metric_vazao)
         layout.addLayout(metrics)
 
         equip_card = QtWidgets.QFrame()
@@ -581,6 +660,8 @@ class MainWindow(QtWidgets.QMainWindow):
         equip_toolbar = QtWidgets.QHBoxLayout()
         equip_toolbar.addWidget(make_line_edit("Buscar equipamento"))
         equip_toolbar.addStretch()
+        self.import_equipment_button = QtWidgets.QPushButton("Importar planilha")
+        equip_toolbar.addWidget(self.import_equipment_button)
         equip_toolbar.addWidget(QtWidgets.QPushButton("Adicionar"))
         equip_toolbar.addWidget(QtWidgets.QPushButton("Editar"))
         equip_toolbar.addWidget(QtWidgets.QPushButton("Remover"))
@@ -605,10 +686,14 @@ class MainWindow(QtWidgets.QMainWindow):
 
         metrics = QtWidgets.QHBoxLayout()
         metrics.setSpacing(14)
-        metrics.addWidget(make_metric_card("Recipientes Selecionados", "--", "Tipo e taxa", "amber"))
-        metrics.addWidget(make_metric_card("Numero de Recipientes", "--", "Em uso + reserva", "orange"))
-        metrics.addWidget(make_metric_card("Capacidade Total", "--", "Armazenamento", "steel"))
-        metrics.addWidget(make_metric_card("Autonomia Estimada", "--", "Perfil de consumo", "green"))
+        self.central_metric_recipientes = make_metric_card("Recipientes Selecionados", "--", "Tipo e taxa", "amber")
+        self.central_metric_numero = make_metric_card("Numero de Recipientes", "--", "Em uso + reserva", "orange")
+        self.central_metric_capacidade = make_metric_card("Capacidade Total", "--", "Armazenamento", "steel")
+        self.central_metric_autonomia = make_metric_card("Autonomia Estimada", "--", "Perfil de consumo", "green")
+        metrics.addWidget(self.central_metric_recipientes)
+        metrics.addWidget(self.central_metric_numero)
+        metrics.addWidget(self.central_metric_capacidade)
+        metrics.addWidget(self.central_metric_autonomia)
         layout.addLayout(metrics)
 
         central_card = QtWidgets.QFrame()
@@ -629,10 +714,10 @@ class MainWindow(QtWidgets.QMainWindow):
         form.addRow("Conformidade", ok_box)
         central_layout.addLayout(form)
 
-        cilindro_table = make_table(["Tipo", "Capacidade", "Taxa Vaporizacao", "Qtd"], rows=1)
+        self.cilindro_table = make_table(["Tipo", "Capacidade", "Taxa Vaporizacao", "Qtd"], rows=1)
         for col in range(4):
-            cilindro_table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
-        central_layout.addWidget(cilindro_table)
+            self.cilindro_table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
+        central_layout.addWidget(self.cilindro_table)
 
         regulador_card = QtWidgets.QFrame()
         regulador_card.setObjectName("Card")
@@ -640,10 +725,18 @@ class MainWindow(QtWidgets.QMainWindow):
         regulador_layout.setContentsMargins(18, 18, 18, 18)
         regulador_layout.setSpacing(12)
         regulador_layout.addWidget(section_title("Reguladores (regulador, regulador_projeto)"))
-        regulador_table = make_table(["Estagio", "Modelo", "Localizacao", "Qtd"], rows=1)
+        regulador_toolbar = QtWidgets.QHBoxLayout()
+        regulador_toolbar.addStretch()
+        self.select_regulators_button = QtWidgets.QPushButton("Selecionar reguladores")
+        self.select_regulators_button.setToolTip(
+            "Escolhe o menor regulador de cada estagio pelas vazoes do ultimo calculo da rede"
+        )
+        regulador_toolbar.addWidget(self.select_regulators_button)
+        regulador_layout.addLayout(regulador_toolbar)
+        self.regulator_table = make_table(["Estagio", "Modelo", "Localizacao", "Qtd"], rows=1)
         for col in range(4):
-            regulador_table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
-        regulador_layout.addWidget(regulador_table)
+            self.regulator_table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
+        regulador_layout.addWidget(self.regulator_table)
 
         layout.addWidget(central_card)
         layout.addWidget(regulador_card)
@@ -704,13 +797,18 @@ class MainWindow(QtWidgets.QMainWindow):
         trechos_layout.setContentsMargins(18, 18, 18, 18)
         trechos_layout.setSpacing(12)
         trechos_layout.addWidget(section_title("Trechos da Rede Primaria (trecho, calculo_trecho)"))
-        trechos_table = make_table(
+        trechos_toolbar = QtWidgets.QHBoxLayout()
+        trechos_toolbar.addStretch()
+        self.import_primary_button = QtWidgets.QPushButton("Importar levantamento")
+        trechos_toolbar.addWidget(self.import_primary_button)
+        trechos_layout.addLayout(trechos_toolbar)
+        self.primary_trechos_table = make_table(
             ["Trecho", "Leq (m)", "Q (m3/h)", "Diam", "Pin (kPa)", "Pout (kPa)", "dP", "Vel (m/s)", "OK"],
             rows=1,
         )
         for col in range(9):
-            trechos_table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
-        trechos_layout.addWidget(trechos_table)
+            self.primary_trechos_table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
+        trechos_layout.addWidget(self.primary_trechos_table)
 
         layout.addWidget(criteria_card)
         layout.addWidget(trechos_card)
@@ -770,13 +868,23 @@ class MainWindow(QtWidgets.QMainWindow):
         trechos_layout.setContentsMargins(18, 18, 18, 18)
         trechos_layout.setSpacing(12)
         trechos_layout.addWidget(section_title("Trechos da Rede Secundaria"))
-        trechos_table = make_table(
+        trechos_toolbar = QtWidgets.QHBoxLayout()
+        trechos_toolbar.addStretch()
+        self.import_secondary_button = QtWidgets.QPushButton("Importar levantamento")
+        trechos_toolbar.addWidget(self.import_secondary_button)
+        self.calculate_network_button = QtWidgets.QPushButton("Calcular rede")
+        self.calculate_network_button.setToolTip(
+            "Unidades identicas (prefixo do trecho, ex.: AP101/A-B) sao calculadas uma vez"
+        )
+        trechos_toolbar.addWidget(self.calculate_network_button)
+        trechos_layout.addLayout(trechos_toolbar)
+        self.secondary_trechos_table = make_table(
             ["Trecho", "Leq (m)", "Q (m3/h)", "Diam", "Pin (kPa)", "Pout (kPa)", "dP", "Vel (m/s)", "OK"],
             rows=1,
         )
         for col in range(9):
-            trechos_table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
-        trechos_layout.addWidget(trechos_table)
+            self.secondary_trechos_table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
+        trechos_layout.addWidget(self.secondary_trechos_table)
 
         layout.addWidget(criteria_card)
         layout.addWidget(trechos_card)
@@ -798,8 +906,8 @@ class MainWindow(QtWidgets.QMainWindow):
         materiais_layout.setContentsMargins(18, 18, 18, 18)
         materiais_layout.setSpacing(12)
         materiais_layout.addWidget(section_title("Materiais (material)"))
-        materiais_table = make_table(["Nome", "Rugosidade C", "Descricao"], rows=3)
-        materiais_layout.addWidget(materiais_table)
+        self.materiais_table = make_table(["Nome", "Rugosidade C", "Descricao"], rows=3)
+        materiais_layout.addWidget(self.materiais_table)
 
         tubos_card = QtWidgets.QFrame()
         tubos_card.setObjectName("Card")
@@ -807,8 +915,8 @@ class MainWindow(QtWidgets.QMainWindow):
         tubos_layout.setContentsMargins(18, 18, 18, 18)
         tubos_layout.setSpacing(12)
         tubos_layout.addWidget(section_title("Tubos (tubo)"))
-        tubos_table = make_table(["Material", "Diametro Nominal", "Diametro Interno"], rows=3)
-        tubos_layout.addWidget(tubos_table)
+        self.tubos_table = make_table(["Material", "Diametro Nominal", "Diametro Interno"], rows=3)
+        tubos_layout.addWidget(self.tubos_table)
 
         upper.addWidget(materiais_card)
         upper.addWidget(tubos_card)
@@ -819,8 +927,8 @@ class MainWindow(QtWidgets.QMainWindow):
         pecas_layout.setContentsMargins(18, 18, 18, 18)
         pecas_layout.setSpacing(12)
         pecas_layout.addWidget(section_title("Pecas e Conexoes (peca)"))
-        pecas_table = make_table(["Categoria", "Diametro", "Nome", "Comprimento Eq."], rows=4)
-        pecas_layout.addWidget(pecas_table)
+        self.pecas_table = make_table(["Categoria", "Diametro", "Nome", "Comprimento Eq."], rows=4)
+        pecas_layout.addWidget(self.pecas_table)
 
         layout.addLayout(upper)
         layout.addWidget(pecas_card)
@@ -883,23 +991,45 @@ class MainWindow(QtWidgets.QMainWindow):
         layout.addStretch()
         return page
 
+    def _traced_slot(self, name, slot):
+        # Os argumentos do sinal sao descartados, como o Qt faz para slots sem parametros
+        def handler(*_):
+            with RASTREADOR.intervalo(name, "ui"):
+                slot()
+
+        return handler
+
     def _wire_actions(self):
-        self.new_project_button.clicked.connect(self._go_new_project)
-        self.project_combo.currentIndexChanged.connect(self._on_project_selected)
-        self.create_project_button.clicked.connect(self._create_project)
-        self.save_button.clicked.connect(self._save_project)
+        for signal, name, slot in (
+            (self.new_project_button.clicked, "Novo projeto", self._go_new_project),
+            (self.project_combo.currentIndexChanged, "Selecionar projeto", self._on_project_selected),
+            (self.create_project_button.clicked, "Criar projeto", self._create_project),
+            (self.save_button.clicked, "Salvar", self._save_project),
+            (self.new_project_origin_combo.currentIndexChanged, "Origem do projeto", self._on_origin_changed),
+            (self.import_equipment_button.clicked, "Importar equipamentos", self._import_equipment),
+            (self.import_primary_button.clicked, "Importar rede primaria", lambda: self._import_trechos("primaria")),
+            (self.import_secondary_button.clicked, "Importar rede secundaria", lambda: self._import_trechos("secundaria")),
+            (self.calculate_network_button.clicked, "Calcular rede", self._calculate_network),
+            (self.select_regulators_button.clicked, "Selecionar reguladores", self._select_regulators),
+        ):
+            signal.connect(self._traced_slot(name, slot))
 
         self._set_default_criteria()
         for key in ("NBR 15526", "NBR 13523", "NBR 8613"):
             if key in self.new_project_normas:
                 self.new_project_normas[key].setChecked(True)
 
+    def _on_origin_changed(self):
+        duplicating = self.new_project_origin_combo.currentText() == "Duplicar projeto existente"
+        self.new_project_source_combo.setEnabled(duplicating)
+
     def _bind_criteria_widget(self, prefix, key, widget):
         def handler(value):
             self._on_criteria_changed(prefix, key, value)
 
         widget.valueChanged.connect(handler)
 
+    @rastreado("ui")
     def _on_criteria_changed(self, prefix, key, value):
         if self._syncing_criteria:
             return
@@ -982,7 +1112,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         pool_url = os.getenv("DB_POOL_URL")
         if pool_url:
-            return pool_url
+            return com_schema(pool_url)
 
         db_name = os.getenv("DB_NAME")
         db_user = os.getenv("DB_USER")
@@ -997,11 +1127,151 @@ class MainWindow(QtWidgets.QMainWindow):
         parts = [f"dbname={db_name}", f"user={db_user}", f"password={db_password}", f"host={db_host}"]
         if db_port:
             parts.append(f"port={db_port}")
-        return " ".join(parts)
+        return com_schema(" ".join(parts))
+
+    def _start_diagnostics(self):
+        env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".env"))
+        load_dotenv(env_path, override=False)
+        try:
+            return RASTREADOR.configurar_ambiente()
+        except ValueError as exc:
+            print(f"Diagnostico desligado: {exc}")
+            return []
+
+    def _diagnostics_dir(self):
+        return os.getenv("DIAGNOSTICO_SAIDA") or os.path.join(os.path.expanduser("~"), ".glp_sizer", "diagnostico")
+
+    def _export_diagnostics(self, ask=False):
+        folder = self._diagnostics_dir()
+        if ask:
+            folder = QtWidgets.QFileDialog.getExistingDirectory(self, "Exportar diagnostico", folder)
+            if not folder:
+                return
+        try:
+            files = RASTREADOR.exportar_tudo(folder)
+        except Exception as exc:
+            self._show_error("Erro ao exportar diagnostico", str(exc))
+            return
+        # Os perfiladores param na exportacao
+        for action in (self.sampling_action, self.cprofile_action):
+            action.blockSignals(True)
+            action.setChecked(False)
+            action.blockSignals(False)
+        if not files:
+            self._set_status("Status: Nada para exportar", "steel")
+            return
+        top = "\n".join(
+            f"{name} [{category}]: {calls}x, {total:.1f} ms (max {longest:.1f} ms)"
+            for name, category, calls, total, longest in RASTREADOR.resumo(8)
+        )
+        QtWidgets.QMessageBox.information(
+            self, "Diagnostico exportado", "\n".join(files) + (f"\n\n{top}" if top else "")
+        )
 
-    def _db_connect(self):
-        return psy.connect(self._get_conn_info())
+    def closeEvent(self, event):
+        # Sessao ainda em gravacao (DIAGNOSTICO ou menu): exporta ao fechar
+        if RASTREADOR.ativo or RASTREADOR.amostrador is not None or RASTREADOR.perfil is not None:
+            try:
+                RASTREADOR.exportar_tudo(self._diagnostics_dir())
+            except Exception as exc:
+                print(f"Erro ao exportar diagnostico: {exc}")
+        if self.router is not None:
+            self.router.fechar()
+        super().closeEvent(event)
+
+    def _get_mirror_path(self):
+        env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".env"))
+        load_dotenv(env_path, override=False)
+        caminho = os.getenv("ESPELHO_LOCAL")
+        schema = schema_configurado()
+        if not caminho and schema:
+            # Ids de projeto se repetem entre escritorios: um espelho por schema
+            caminho = os.path.join(os.path.dirname(CAMINHO_PADRAO), f"espelho_{schema}.sqlite3")
+        return caminho or None
+
+    def _router(self):
+        # Um pool por endpoint, aberto na primeira conexao. Sem primario, espera no maximo
+        # ESPERA_PRIMARIO s e guarda a falha por PAUSA_FALHA s: as acoes seguintes vao
+        # direto para o modo offline, sem travar a janela de novo
+        if self.router is None:
+            if self._router_error is not None and time.monotonic() - self._router_error[0] < PAUSA_FALHA:
+                raise self._router_error[1]
+            router = roteador_configurado(self._get_conn_info(), connect_timeout=5)
+            try:
+                router.abrir(wait=True, timeout=ESPERA_PRIMARIO)
+            except Exception as exc:
+                router.fechar()
+                self._router_error = (time.monotonic(), exc)
+                raise
+            self._router_error = None
+            self.router = router
+        return self.router
+
+    def _db_connect(self, autocommit=False):
+        # Escritas no primario; o LSN gravado garante que as leituras seguintes vejam a escrita
+        return self._router().escrita(self.db_session, autocommit=autocommit)
+
+    def _db_read(self, autocommit=False):
+        # Replica em dia com a ultima escrita desta sessao, ou o primario
+        return self._router().leitura(self.db_session, autocommit=autocommit)
+
+    @rastreado("ui")
+    def _load_catalog(self):
+        # Snapshot binario mapeado em memoria (json/catalogo.bin); sem banco e sem parse de JSON
+        try:
+            self.catalog = abrir_catalogo()
+        except Exception as exc:
+            self.catalog = None
+            self._show_error("Erro ao carregar catalogo", str(exc))
+            return
 
+        materiais = self.catalog.linhas_materiais()
+        nomes = dict(zip(self.catalog.material_id.tolist(), self.catalog.material_nome.tolist()))
+        tabelas = (
+            (self.materiais_table, [(nome, f"{c:g}", descricao) for nome, c, descricao in materiais]),
+            (
+                self.tubos_table,
+                [(nomes.get(m, str(m)), dn, f"{di:.1f} mm") for m, dn, di, _, _ in self.catalog.linhas_tubos()],
+            ),
+            (
+                self.pecas_table,
+                [
+                    (categoria, f"{diametro} ({nomes.get(m, str(m))})", nome, f"{leqv:.2f} m")
+                    for m, categoria, diametro, nome, leqv, _, _ in self.catalog.linhas_pecas()
+                ],
+            ),
+        )
+        for table, rows in tabelas:
+            table.setRowCount(len(rows))
+            for row, values in enumerate(rows):
+                for col, value in enumerate(values):
+                    table.setItem(row, col, QtWidgets.QTableWidgetItem(value))
+
+    def _resolve_rejected(self):
+        # Alteracoes offline recusadas pelo servidor (conflito ou erro): o usuario decide
+        for item_id, project_id, estado, erro, criado_em in self.mirror.rejeitadas():
+            if item_id in self._rejections_shown:
+                continue
+            self._rejections_shown.add(item_id)
+            box = QtWidgets.QMessageBox(self)
+            box.setIcon(QtWidgets.QMessageBox.Warning)
+            box.setWindowTitle("Alteracao offline nao enviada")
+            motivo = "Conflito" if estado == "conflito" else "Falha"
+            box.setText(f"Projeto {project_id}, alteracao de {criado_em}.\n{motivo}: {erro}")
+            overwrite = box.addButton("Sobrescrever servidor", QtWidgets.QMessageBox.AcceptRole)
+            discard = box.addButton("Descartar", QtWidgets.QMessageBox.DestructiveRole)
+            box.addButton("Decidir depois", QtWidgets.QMessageBox.RejectRole)
+            box.exec()
+            if box.clickedButton() is overwrite:
+                self.mirror.resolver_rejeitada(item_id, reenviar=True)
+            elif box.clickedButton() is discard:
+                self.mirror.resolver_rejeitada(item_id)
+        if self.mirror.pendentes():
+            # Reenvio escolhido agora vai na mesma carga
+            with self._db_connect(autocommit=True) as conn:
+                self.mirror.enviar_fila(conn)
+
+    @rastreado("ui")
     def _load_projects(self, select_id=None):
         self.projects = {}
         self.project_combo.blockSignals(True)
@@ -1009,21 +1279,27 @@ class MainWindow(QtWidgets.QMainWindow):
         self.project_combo.addItem("Selecionar projeto", None)
         self.project_combo.addItem("Novo projeto...", "NEW")
 
+        # Envia a fila de escrita e traz apenas os projetos alterados; a lista vem do espelho local
         try:
-            with self._db_connect() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "SELECT id, nome, descricao, created_at FROM projeto ORDER BY created_at DESC"
-                    )
-                    rows = cur.fetchall()
+            if self.mirror.pendentes():
+                with self._db_connect(autocommit=True) as conn:
+                    self.mirror.enviar_fila(conn)
+            with self._db_read(autocommit=True) as conn:
+                self.mirror.sincronizar(conn)
+            self.offline = False
+            self._resolve_rejected()
         except Exception as exc:
-            self.project_combo.blockSignals(False)
-            self._set_status("Status: Sem conexao", "steel")
-            if not self._db_error_shown:
-                self._show_error("Erro ao carregar projetos", str(exc))
-                self._db_error_shown = True
-            return
-
+            self.offline = True
+            if not self.mirror.projetos():
+                self.project_combo.blockSignals(False)
+                self._set_status("Status: Sem conexao", "steel")
+                if not self._db_error_shown:
+                    self._show_error("Erro ao carregar projetos", str(exc))
+                    self._db_error_shown = True
+                return
+        rows = self.mirror.projetos()
+
+        self.new_project_source_combo.clear()
         for project_id, nome, descricao, created_at in rows:
             self.projects[project_id] = {
                 "id": project_id,
@@ -1032,6 +1308,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 "created_at": created_at,
             }
             self.project_combo.addItem(nome, project_id)
+            self.new_project_source_combo.addItem(nome, project_id)
 
         self.project_combo.blockSignals(False)
         if select_id:
@@ -1039,6 +1316,8 @@ class MainWindow(QtWidgets.QMainWindow):
             self.project_combo.setCurrentIndex(index if index >= 0 else 0)
         else:
             self.project_combo.setCurrentIndex(0)
+        if self.offline:
+            self._set_status("Status: Offline (espelho local)", "steel")
 
     def _on_project_selected(self):
         data = self.project_combo.currentData()
@@ -1062,6 +1341,7 @@ class MainWindow(QtWidgets.QMainWindow):
         except json.JSONDecodeError:
             return {"descricao": descricao}
 
+    @rastreado("ui")
     def _load_project_details(self, project_id):
         project = self.projects.get(project_id)
         if not project:
@@ -1080,67 +1360,161 @@ class MainWindow(QtWidgets.QMainWindow):
         resumo = meta.get("escopo") or meta.get("descricao") or ""
         self.project_summary.setPlainText(resumo)
 
-        self._load_project_criteria(project_id)
-        self._set_status(f"Status: {project.get('nome')}", "green")
+        snapshot = self._open_snapshot(project_id)
+        if snapshot is None:
+            return
+        self._load_project_criteria(snapshot)
+        self._load_equipment_metrics(snapshot)
+        self._load_central_metrics(snapshot)
+        self._load_trechos(snapshot)
+        self._load_regulators(snapshot)
+        if self.offline:
+            self._set_status(f"Status: {project.get('nome')} (offline)", "steel")
+        else:
+            self._set_status(f"Status: {project.get('nome')}", "green")
         self.stack.setCurrentIndex(1)
 
-    def _load_project_criteria(self, project_id):
+    @rastreado("banco")
+    def _open_snapshot(self, project_id):
+        # Projeto aberto recentemente e sem alteracoes no servidor: lido do espelho local
         try:
-            with self._db_connect() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        SELECT
-                            pressao_operacao,
-                            perda_carga_maxima,
-                            perda_carga_minima,
-                            vel_maxima,
-                            vel_minima,
-                            vel_max_recomendada,
-                            vel_min_recomendada,
-                            densidade_relativa,
-                            temperatura_projeto,
-                            observacao
-                        FROM criterio_projeto
-                        WHERE projeto_id = %s
-                        """,
-                        (project_id,),
-                    )
-                    row = cur.fetchone()
+            return self.mirror.abrir_projeto(project_id, None if self.offline else self._db_read)
+        except Exception as exc:
+            self._show_error("Erro ao carregar projeto", str(exc))
+            return None
+
+    def _set_metric(self, card, value):
+        card.findChild(QtWidgets.QLabel, "MetricValue").setText(value)
+
+    def _load_equipment_metrics(self, snapshot):
+        # Soma feita no banco sobre equipamento.pot_kcalmin (ja normalizada)
+        computada = snapshot["pot_computada"]
+        fator = fator_simultaneidade(computada)
+        adotada = potencia_adotada(computada, fator)
+        self._set_metric(self.equipment_metric_potencia, f"{computada:,.1f} kcal/min")
+        self._set_metric(self.equipment_metric_fator, f"{fator:.1f} %")
+        self._set_metric(self.equipment_metric_adotada, f"{adotada:,.1f} kcal/min")
+        self._set_metric(self.equipment_metric_vazao, f"{vazao_glp(adotada * 60, PCI_GLP_M3):.2f} m3/h")
+
+    def _load_central_metrics(self, snapshot):
+        # Simulacao de uma semana, passo de 1 h, com o perfil diario padrao
+        try:
+            with RASTREADOR.intervalo("autonomia_central", "calculo"):
+                resultado = autonomia_central(snapshot["cilindros"], snapshot["pot_computada"])
         except Exception as exc:
-            self._show_error("Erro ao carregar criterios", str(exc))
+            self._show_error("Erro ao simular a central", str(exc))
             return
 
-        if not row:
+        cilindros = resultado["cilindros"]
+        self.cilindro_table.setRowCount(max(len(cilindros), 1))
+        if not cilindros:
+            for col in range(4):
+                self.cilindro_table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
+            for card in (
+                self.central_metric_recipientes,
+                self.central_metric_numero,
+                self.central_metric_capacidade,
+            ):
+                self._set_metric(card, "--")
+            # Sem cilindros a autonomia e zero
+            self._set_metric(self.central_metric_autonomia, texto_autonomia(resultado))
+            return
+
+        for row, (tipo, capacidade, taxa, qtde) in enumerate(cilindros):
+            values = [tipo, f"{capacidade:.0f} kg", f"{taxa:.2f} kg/h", str(qtde)]
+            for col, value in enumerate(values):
+                self.cilindro_table.setItem(row, col, QtWidgets.QTableWidgetItem(value))
+
+        em_uso = sum(qtde for _, _, _, qtde in cilindros)
+        self._set_metric(
+            self.central_metric_recipientes,
+            ", ".join(f"{tipo} ({taxa:.2f} kg/h)" for tipo, _, taxa, _ in cilindros),
+        )
+        self._set_metric(self.central_metric_numero, f"{em_uso} + {em_uso}")
+        self._set_metric(self.central_metric_capacidade, f"{resultado['capacidade_total']:,.0f} kg")
+        autonomia = texto_autonomia(resultado)
+        if resultado["deficit_pico"] > 0:
+            autonomia += f" (deficit {resultado['deficit_pico']:.2f} kg/h no pico)"
+        self._set_metric(self.central_metric_autonomia, autonomia)
+
+    def _load_trechos(self, snapshot):
+        # Rede em colunas (rede.Rede): Leq somado por trecho com um bincount sobre as pecas;
+        # resultados do ultimo calculo de cada trecho
+        network = Rede.de_dict(snapshot["rede"])
+        leq = network.leq()
+        calculos = {row[0]: row for row in snapshot["calculos"]}
+        order = np.lexsort((network.nome, network.rede))
+
+        for rede, table in (
+            ("primaria", self.primary_trechos_table),
+            ("secundaria", self.secondary_trechos_table),
+        ):
+            rows = order[network.rede[order] == REDES.index(rede)]
+            table.setRowCount(max(len(rows), 1))
+            if not len(rows):
+                for col in range(9):
+                    table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
+                continue
+            for row, i in enumerate(rows.tolist()):
+                values = [
+                    str(network.nome[i]),
+                    f"{leq[i]:.2f}",
+                    "--",
+                    str(network.diametro_nominal[i]) or "--",
+                    "--",
+                    "--",
+                    "--",
+                    "--",
+                    "--",
+                ]
+                calculo = calculos.get(int(network.trecho_id[i]))
+                if calculo:
+                    (_, _, _, _, potencia, velocidade, perda_carga,
+                     pressao_inicial, pressao_final, ok, _) = calculo
+                    values[2] = f"{potencia / PCI_GLP_M3:.3f}"
+                    values[4] = f"{pressao_inicial:.2f}"
+                    values[5] = f"{pressao_final:.2f}"
+                    values[6] = f"{perda_carga:.3f}"
+                    values[7] = f"{velocidade:.2f}"
+                    values[8] = "OK" if ok else "Rever"
+                for col, value in enumerate(values):
+                    table.setItem(row, col, QtWidgets.QTableWidgetItem(value))
+
+    def _load_regulators(self, snapshot):
+        reguladores = snapshot.get("reguladores") or []
+        self.regulator_table.setRowCount(max(len(reguladores), 1))
+        if not reguladores:
+            for col in range(4):
+                self.regulator_table.setItem(0, col, QtWidgets.QTableWidgetItem("--"))
+            return
+        for row, (estagio, modelo, localizacao, quantidade, vazao, automatico) in enumerate(reguladores):
+            values = [
+                estagio.capitalize(),
+                modelo if automatico else f"{modelo} (manual)",
+                localizacao or "--",
+                str(quantidade),
+            ]
+            for col, value in enumerate(values):
+                item = QtWidgets.QTableWidgetItem(value)
+                if vazao is not None:
+                    item.setToolTip(f"{vazao:.2f} kg/h")
+                self.regulator_table.setItem(row, col, item)
+
+    def _load_project_criteria(self, snapshot):
+        project = self.projects.get(snapshot["id"])
+        criterios = snapshot["criterios"]
+        if not criterios:
             self.criteria_observacao = ""
+            if project is not None:
+                project["criterios"] = None
             self._set_default_criteria()
             return
 
-        (
-            pressao_operacao,
-            perda_carga_maxima,
-            perda_carga_minima,
-            vel_maxima,
-            vel_minima,
-            vel_max_recomendada,
-            vel_min_recomendada,
-            densidade_relativa,
-            temperatura_projeto,
-            observacao,
-        ) = row
-
-        self.criteria_observacao = observacao or ""
-        values = {
-            "pressao_operacao": float(pressao_operacao),
-            "perda_carga_maxima": float(perda_carga_maxima),
-            "perda_carga_minima": float(perda_carga_minima),
-            "vel_maxima": float(vel_maxima),
-            "vel_minima": float(vel_minima),
-            "vel_max_recomendada": float(vel_max_recomendada),
-            "vel_min_recomendada": float(vel_min_recomendada),
-            "densidade_relativa": float(densidade_relativa),
-            "temperatura_projeto": float(temperatura_projeto),
-        }
+        self.criteria_observacao = criterios["observacao"] or ""
+        values = {key: float(value) for key, value in criterios.items() if key != "observacao"}
+        if project is not None:
+            # Estado lido do banco, base para salvar apenas o que mudou
+            project["criterios"] = {**values, "observacao": self.criteria_observacao}
         self._apply_criteria_values(values, "criteria_")
         self._apply_criteria_values(values, "project_criteria_")
         self._apply_criteria_values(values, "primary_criteria_")
@@ -1183,56 +1557,36 @@ class MainWindow(QtWidgets.QMainWindow):
 
         descricao_json = json.dumps(meta, ensure_ascii=True)
 
+        source_id = None
+        if meta["origem"] == "Duplicar projeto existente":
+            source_id = self.new_project_source_combo.currentData()
+            if not source_id:
+                self._show_error("Dados incompletos", "Selecione o projeto de origem.")
+                return
+
+        if source_id:
+            # Copia trechos, pecas, equipamentos e central no servidor; os
+            # criterios e a descricao ficam os do formulario, na mesma transacao
+            try:
+                with self._db_connect() as conn:
+                    project_id, _ = clonar_projeto(conn, source_id, nome, descricao_json)
+                    with conn.cursor() as cur:
+                        executar_alteracoes(cur, project_id, {}, criterios, criterios_existem=False)
+                    conn.commit()
+            except Exception as exc:
+                self._show_error("Erro ao duplicar projeto", str(exc))
+                return
+
+            self.current_project_id = project_id
+            self._load_projects(select_id=project_id)
+            self._set_status(f"Status: {nome}", "green")
+            self.stack.setCurrentIndex(1)
+            return
+
         try:
-            with self._db_connect() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "INSERT INTO projeto (nome, descricao) VALUES (%s, %s) RETURNING id",
-                        (nome, descricao_json),
-                    )
-                    project_id = cur.fetchone()[0]
-                    cur.execute(
-                        """
-                        INSERT INTO criterio_projeto (
-                            projeto_id,
-                            pressao_operacao,
-                            perda_carga_maxima,
-                            perda_carga_minima,
-                            vel_maxima,
-                            vel_minima,
-                            vel_max_recomendada,
-                            vel_min_recomendada,
-                            densidade_relativa,
-                            temperatura_projeto,
-                            observacao
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (projeto_id) DO UPDATE SET
-                            pressao_operacao = EXCLUDED.pressao_operacao,
-                            perda_carga_maxima = EXCLUDED.perda_carga_maxima,
-                            perda_carga_minima = EXCLUDED.perda_carga_minima,
-                            vel_maxima = EXCLUDED.vel_maxima,
-                            vel_minima = EXCLUDED.vel_minima,
-                            vel_max_recomendada = EXCLUDED.vel_max_recomendada,
-                            vel_min_recomendada = EXCLUDED.vel_min_recomendada,
-                            densidade_relativa = EXCLUDED.densidade_relativa,
-                            temperatura_projeto = EXCLUDED.temperatura_projeto,
-                            observacao = EXCLUDED.observacao
-                        """,
-                        (
-                            project_id,
-                            criterios["pressao_operacao"],
-                            criterios["perda_carga_maxima"],
-                            criterios["perda_carga_minima"],
-                            criterios["vel_maxima"],
-                            criterios["vel_minima"],
-                            criterios["vel_max_recomendada"],
-                            criterios["vel_min_recomendada"],
-                            criterios["densidade_relativa"],
-                            criterios["temperatura_projeto"],
-                            criterios["observacao"],
-                        ),
-                    )
-                conn.commit()
+            # INSERT projeto + criterio_projeto + COMMIT em uma unica ida e volta
+            with self._db_connect(autocommit=True) as conn:
+                project_id = criar_projeto(conn, nome, descricao_json, criterios)
         except Exception as exc:
             self._show_error("Erro ao criar projeto", str(exc))
             return
@@ -1253,7 +1607,8 @@ class MainWindow(QtWidgets.QMainWindow):
             return
 
         project = self.projects.get(self.current_project_id, {})
-        meta = self._parse_project_meta(project.get("descricao"))
+        loaded_meta = self._parse_project_meta(project.get("descricao"))
+        meta = dict(loaded_meta)
         meta.update(
             {
                 "cliente": self.project_client.text().strip(),
@@ -1267,85 +1622,185 @@ class MainWindow(QtWidgets.QMainWindow):
             }
         )
 
-        descricao_json = json.dumps(meta, ensure_ascii=True)
+        projeto = {}
+        if nome != project.get("nome"):
+            projeto["nome"] = nome
+        if meta != loaded_meta:
+            projeto["descricao"] = json.dumps(meta, ensure_ascii=True)
 
         criterios = self._read_criteria_values("project_criteria_")
         if not criterios:
             criterios = self._read_criteria_values("criteria_")
-        defaults = {
-            "pressao_operacao": 150.0,
-            "perda_carga_maxima": 45.0,
-            "perda_carga_minima": 0.0,
-            "vel_maxima": 20.0,
-            "vel_minima": 0.0,
-            "vel_max_recomendada": 15.0,
-            "vel_min_recomendada": 5.0,
-            "densidade_relativa": 1.8,
-            "temperatura_projeto": 15.0,
-        }
-        defaults.update(criterios)
-        criterios = defaults
+        criterios["observacao"] = self.criteria_observacao
+        loaded_criteria = project.get("criterios")
+        if loaded_criteria is None:
+            alterados = {**CRITERIOS_PADRAO, **criterios}
+        else:
+            alterados = campos_alterados(loaded_criteria, criterios)
+
+        if not projeto and not alterados:
+            self._set_status("Status: Sem alteracoes", "steel")
+            return
+
+        criterios_existem = loaded_criteria is not None
+        saved_offline = self.offline
+        updated_at = None
+        if not saved_offline:
+            try:
+                with self._db_connect(autocommit=True) as conn:
+                    updated_at = salvar_alteracoes(
+                        conn,
+                        self.current_project_id,
+                        projeto,
+                        alterados,
+                        criterios_existem=criterios_existem,
+                    )
+            except psy.OperationalError:
+                saved_offline = True
+            except Exception as exc:
+                self._show_error("Erro ao salvar", str(exc))
+                return
+        if saved_offline:
+            # Sem conexao: guarda na fila do espelho local, enviada na proxima sincronizacao
+            self.offline = True
+            self.mirror.enfileirar_alteracoes(self.current_project_id, projeto, alterados, criterios_existem)
+        else:
+            self.mirror.aplicar_alteracoes(
+                self.current_project_id, projeto, alterados, criterios_existem, updated_at or None
+            )
+
+        # Atualiza o cache local no lugar de recarregar todos os projetos
+        project.update(projeto)
+        project["criterios"] = {**(loaded_criteria or CRITERIOS_PADRAO), **alterados}
+        if "nome" in projeto:
+            for combo in (self.project_combo, self.new_project_source_combo):
+                index = combo.findData(self.current_project_id)
+                if index >= 0:
+                    combo.setItemText(index, nome)
+        if saved_offline:
+            self._set_status(f"Status: {nome} ({self.mirror.pendentes()} pendente(s) offline)", "steel")
+        else:
+            self._set_status(f"Status: {nome}", "green")
+
+    def _ask_spreadsheet(self, title):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, title, "", "Planilhas (*.csv *.xlsx);;Todos os arquivos (*)"
+        )
+        return path
 
+    def _import_equipment(self):
+        if not self.current_project_id:
+            self._show_error("Sem projeto", "Selecione um projeto para importar.")
+            return
+        path = self._ask_spreadsheet("Importar equipamentos")
+        if not path:
+            return
         try:
             with self._db_connect() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "UPDATE projeto SET nome = %s, descricao = %s WHERE id = %s",
-                        (nome, descricao_json, self.current_project_id),
-                    )
-                    if criterios:
-                        cur.execute(
-                            """
-                            INSERT INTO criterio_projeto (
-                                projeto_id,
-                                pressao_operacao,
-                                perda_carga_maxima,
-                                perda_carga_minima,
-                                vel_maxima,
-                                vel_minima,
-                                vel_max_recomendada,
-                                vel_min_recomendada,
-                                densidade_relativa,
-                                temperatura_projeto,
-                                observacao
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT (projeto_id) DO UPDATE SET
-                                pressao_operacao = EXCLUDED.pressao_operacao,
-                                perda_carga_maxima = EXCLUDED.perda_carga_maxima,
-                                perda_carga_minima = EXCLUDED.perda_carga_minima,
-                                vel_maxima = EXCLUDED.vel_maxima,
-                                vel_minima = EXCLUDED.vel_minima,
-                                vel_max_recomendada = EXCLUDED.vel_max_recomendada,
-                                vel_min_recomendada = EXCLUDED.vel_min_recomendada,
-                                densidade_relativa = EXCLUDED.densidade_relativa,
-                                temperatura_projeto = EXCLUDED.temperatura_projeto,
-                                observacao = EXCLUDED.observacao
-                            """,
-                            (
-                                self.current_project_id,
-                                criterios["pressao_operacao"],
-                                criterios["perda_carga_maxima"],
-                                criterios["perda_carga_minima"],
-                                criterios["vel_maxima"],
-                                criterios["vel_minima"],
-                                criterios["vel_max_recomendada"],
-                                criterios["vel_min_recomendada"],
-                                criterios["densidade_relativa"],
-                                criterios["temperatura_projeto"],
-                                self.criteria_observacao,
-                            ),
-                        )
+                relatorio = importar_equipamentos(conn, self.current_project_id, path)
                 conn.commit()
         except Exception as exc:
-            self._show_error("Erro ao salvar", str(exc))
+            self._show_error("Erro ao importar equipamentos", str(exc))
+            return
+        self.mirror.descartar(self.current_project_id)
+        snapshot = self._open_snapshot(self.current_project_id)
+        if snapshot is not None:
+            self._load_equipment_metrics(snapshot)
+            self._load_central_metrics(snapshot)
+        QtWidgets.QMessageBox.information(self, "Importacao concluida", resumo_relatorio(relatorio))
+
+    def _import_trechos(self, rede):
+        if not self.current_project_id:
+            self._show_error("Sem projeto", "Selecione um projeto para importar.")
+            return
+        path = self._ask_spreadsheet("Importar trechos")
+        if not path:
             return
+        pecas_path = self._ask_spreadsheet("Importar pecas dos trechos (opcional)") or None
+        try:
+            with self._db_connect() as conn:
+                relatorio = importar_trechos(
+                    conn, self.current_project_id, path, pecas_path, rede_padrao=rede
+                )
+                conn.commit()
+        except Exception as exc:
+            self._show_error("Erro ao importar trechos", str(exc))
+            return
+        self.mirror.descartar(self.current_project_id)
+        snapshot = self._open_snapshot(self.current_project_id)
+        if snapshot is not None:
+            self._load_trechos(snapshot)
+        QtWidgets.QMessageBox.information(self, "Importacao concluida", resumo_relatorio(relatorio))
 
-        self._load_projects(select_id=self.current_project_id)
-        self._set_status(f"Status: {nome}", "green")
+    def _calculate_network(self):
+        if not self.current_project_id:
+            self._show_error("Sem projeto", "Selecione um projeto para calcular.")
+            return
+        if self.offline:
+            self._show_error("Offline", "O calculo grava os resultados no banco e exige conexao.")
+            return
+        vazao_unidade = self.secondary_vazao_unidade.value() or None
+        try:
+            with self._db_connect() as conn:
+                _, resumo = dimensionar_projeto(
+                    conn, self.current_project_id, vazao_unidade, cache=self.calc_cache.usar(conn)
+                )
+                conn.commit()
+        except Exception as exc:
+            self._show_error("Erro ao calcular a rede", str(exc))
+            return
+        self.mirror.descartar(self.current_project_id)
+        snapshot = self._open_snapshot(self.current_project_id)
+        if snapshot is not None:
+            self._load_trechos(snapshot)
+        linhas = [
+            f"{rede.capitalize()}: {r['trechos']} trechos em {r['unidades']} unidades, "
+            f"{r['classes']} distintas ({r['calculados']} trechos calculados)"
+            for rede, r in resumo.items()
+        ]
+        if vazao_unidade is None:
+            linhas.append("Rede secundaria nao calculada: informe a vazao por unidade.")
+        cache = self.calc_cache.estatisticas()
+        linhas.append(
+            f"Cache de calculo: {cache['taxa_acerto']:.0%} de acertos na sessao "
+            f"({cache['acertos_memoria'] + cache['acertos_banco']} de "
+            f"{cache['acertos_memoria'] + cache['acertos_banco'] + cache['falhas']})"
+        )
+        QtWidgets.QMessageBox.information(self, "Calculo concluido", "\n".join(linhas))
+
+    def _select_regulators(self):
+        if not self.current_project_id:
+            self._show_error("Sem projeto", "Selecione um projeto para selecionar reguladores.")
+            return
+        if self.offline:
+            self._show_error("Offline", "A selecao grava os reguladores no banco e exige conexao.")
+            return
+        try:
+            with self._db_connect() as conn:
+                selecionados, pendentes = selecionar_reguladores(conn, self.current_project_id)
+                conn.commit()
+        except Exception as exc:
+            self._show_error("Erro ao selecionar reguladores", str(exc))
+            return
+        self.mirror.descartar(self.current_project_id)
+        snapshot = self._open_snapshot(self.current_project_id)
+        if snapshot is not None:
+            self._load_regulators(snapshot)
+        linhas = [
+            f"{estagio.capitalize()} estagio: "
+            f"{sum(1 for s in selecionados if s['estagio'] == estagio)} reguladores"
+            for estagio in ESTAGIOS
+        ]
+        linhas += [
+            f"Sem regulador para {d['localizacao']} ({d['estagio']} estagio, {d['vazao']:.2f} kg/h)"
+            for d in pendentes
+        ]
+        QtWidgets.QMessageBox.information(self, "Reguladores selecionados", "\n".join(linhas))
 
     def _show_error(self, title, message):
         QtWidgets.QMessageBox.critical(self, title, message)
 
+    @rastreado("ui")
     def _apply_styles(self):
         font = QtGui.QFont("Bahnschrift", 10)
         self.setFont(font)
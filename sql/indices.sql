@@ -1,60 +1,68 @@
 -- Índices úteis para joins e consultas típicas
-CREATE INDEX IF NOT EXISTS idx_eqproj_projeto
-ON equipamento_projeto (projeto_id);
-
 CREATE INDEX IF NOT EXISTS idx_eqproj_equip 
 ON equipamento_projeto (equipamento_id);
 
-CREATE INDEX IF NOT EXISTS idx_cilproj_projeto
-ON cilindro_projeto (projeto_id);
-
 CREATE INDEX IF NOT EXISTS idx_cilproj_cilindro
 ON cilindro_projeto (cilindro_id);
 
-CREATE INDEX IF NOT EXISTS idx_tubo_material 
-ON tubo (material_id);
-
-CREATE INDEX IF NOT EXISTS idx_peca_material
-ON peca (material_id);
-
-CREATE INDEX IF NOT EXISTS idx_trecho_projeto
-ON trecho (projeto_id);
+CREATE INDEX IF NOT EXISTS idx_trecho_tubo
+ON trecho (tubo_id);
 
 CREATE INDEX IF NOT EXISTS idx_trechopeca_peca
 ON trecho_peca (peca_id);
 
-CREATE INDEX IF NOT EXISTS idx_regproj_projeto
-ON regulador_projeto (projeto_id);
-
 CREATE INDEX IF NOT EXISTS idx_regproj_regulador
 ON regulador_projeto (regulador_id);
 
-CREATE INDEX IF NOT EXISTS idx_calculo_projeto
-ON calculo (projeto_id);
+CREATE INDEX IF NOT EXISTS idx_regproj_trecho
+ON regulador_projeto (trecho_id);
+
+-- Menor regulador do estagio que atende a vazao: busca pelo indice (reguladores.py)
+CREATE INDEX IF NOT EXISTS idx_regulador_estagio_vazao
+ON regulador (estagio, vazao_max) INCLUDE (vazao_min);
+
+-- Pecas por trecho da leitura da rede (rede.py): index-only scan por trecho
+CREATE INDEX IF NOT EXISTS idx_trechopeca_trecho_peca
+ON trecho_peca (trecho_id, peca_id) INCLUDE (qtde_peca);
+
+-- Ultimo calculo por trecho: busca pelo indice em cada particao
+CREATE INDEX IF NOT EXISTS idx_calculo_trecho_data
+ON calculo (trecho_id, executado_em DESC, execucao_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_execucao_calculo_projeto
+ON execucao_calculo (projeto_id, executado_em DESC, id DESC);
+
+-- Proximo tubo maior e faixas de diametro: busca pelo indice, sem ler o texto
+CREATE INDEX IF NOT EXISTS idx_tubo_material_pol
+ON tubo (material_id, diametro_pol) INCLUDE (diametro_interno);
 
-CREATE INDEX IF NOT EXISTS idx_calculo_trecho_calculo
-ON calculo_trecho (calculo_id);
+-- Pecas do mesmo diametro do tubo (join numerico tubo x peca)
+CREATE INDEX IF NOT EXISTS idx_peca_material_pol
+ON peca (material_id, diametro_pol);
 
-CREATE INDEX IF NOT EXISTS idx_calculo_trecho_trecho
-ON calculo_trecho (trecho_id);
+-- Ponto mais proximo em planta (ORDER BY posicao <-> point) e janelas (posicao <@ box)
+CREATE INDEX IF NOT EXISTS idx_ponto_posicao
+ON ponto USING gist (posicao);
 
-CREATE INDEX IF NOT EXISTS idx_criterio_projeto
-ON criterio_projeto (projeto_id);
+-- Pontos de um andar: faixa de cota dentro do projeto
+CREATE INDEX IF NOT EXISTS idx_ponto_projeto_z
+ON ponto (projeto_id, z);
 
-CREATE INDEX IF NOT EXISTS idx_central_glp_projeto
-ON central_glp (projeto_id);
+CREATE INDEX IF NOT EXISTS idx_trecho_ponto_inicio
+ON trecho (ponto_inicio_id);
 
-CREATE INDEX IF NOT EXISTS idx_documento_projeto
-ON documento_projeto (projeto_id);
+CREATE INDEX IF NOT EXISTS idx_trecho_ponto_fim
+ON trecho (ponto_fim_id);
 
-CREATE INDEX IF NOT EXISTS idx_ponto_projeto
-ON ponto (projeto_id);
+-- Fila de recalculo: proximas tarefas pendentes e tarefas com heartbeat vencido
+CREATE INDEX IF NOT EXISTS idx_tarefa_pendente
+ON tarefa_calculo (disponivel_em, id) WHERE estado = 'pendente';
 
-CREATE INDEX IF NOT EXISTS idx_parametros_gerais_projeto
-ON parametros_gerais (projeto_id);
+CREATE INDEX IF NOT EXISTS idx_tarefa_executando
+ON tarefa_calculo (heartbeat_em) WHERE estado = 'executando';
 
-CREATE INDEX IF NOT EXISTS idx_regulador_projeto
-ON regulador_projeto (projeto_id);
+CREATE INDEX IF NOT EXISTS idx_tarefa_projeto
+ON tarefa_calculo (projeto_id);
 
-CREATE INDEX IF NOT EXISTS idx_trechopeca_trecho
-ON trecho_peca (trecho_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_tarefa_lote
+ON tarefa_calculo (lote, estado);
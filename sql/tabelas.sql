@@ -22,18 +22,81 @@ CREATE TABLE IF NOT EXISTS projeto(
    CONSTRAINT uq_projeto_nome UNIQUE (nome)
 );
 
+-- Fatores para kcal/min (alimentada por popular_banco.py a partir de calculos.FATORES_KCALMIN)
+CREATE TABLE IF NOT EXISTS unidade_potencia(
+   unidade VARCHAR(10) PRIMARY KEY, -- normalizada: minuscula e sem espacos
+   fator_kcalmin DOUBLE PRECISION NOT NULL CHECK (fator_kcalmin > 0)
+);
+
 CREATE TABLE IF NOT EXISTS equipamento(
    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
    nome VARCHAR(100) NOT NULL,
    categoria VARCHAR(100) NOT NULL, -- fogao, aquecedor, forno etc
    unidade_medida VARCHAR(10)  NOT NULL, -- kW, kcal/min, kcal/h, kg/h etc
    pot_unitaria REAL NOT NULL CHECK (pot_unitaria > 0),
+   pot_kcalmin REAL NOT NULL, -- pot_unitaria em kcal/min, preenchida por trigger
    fabricante VARCHAR(100),
    modelo VARCHAR(100),
    descricao TEXT,
    CONSTRAINT uq_equipamento UNIQUE (nome, unidade_medida, pot_unitaria)
 );
 
+-- As funcoes leem as tabelas do schema em que foram criadas, qualquer que seja
+-- o search_path de quem dispara (inquilinos.py). pot_kcalmin qualifica a tabela
+-- com o schema corrente em vez de SET search_path, que impediria o inlining
+-- da funcao SQL nas consultas que a chamam.
+DO $$
+BEGIN
+   EXECUTE format($f$
+      CREATE OR REPLACE FUNCTION pot_kcalmin(valor REAL, unidade TEXT)
+      RETURNS REAL
+      LANGUAGE sql STABLE
+      AS $corpo$
+         SELECT (pot_kcalmin.valor * u.fator_kcalmin)::REAL
+         FROM %I.unidade_potencia u
+         WHERE u.unidade = lower(replace(regexp_replace(pot_kcalmin.unidade, '\s', '', 'g'), '³', '3'))
+      $corpo$
+   $f$, current_schema());
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION equipamento_pot_kcalmin()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SET search_path FROM CURRENT
+AS $$
+BEGIN
+   NEW.pot_kcalmin := pot_kcalmin(NEW.pot_unitaria, NEW.unidade_medida);
+   IF NEW.pot_kcalmin IS NULL THEN
+      RAISE EXCEPTION 'Unidade de potencia desconhecida: %', NEW.unidade_medida;
+   END IF;
+   RETURN NEW;
+END;
+$$;
+
+-- Bancos criados antes de pot_kcalmin: a coluna e preenchida pelos fatores de
+-- unidade_potencia e so vira NOT NULL quando todas as linhas tiverem fator.
+-- Sem fatores (popular_banco.py ainda nao rodou), popular_banco.py termina o trabalho.
+-- Antes do trigger, que depende da coluna
+ALTER TABLE equipamento ADD COLUMN IF NOT EXISTS pot_kcalmin REAL;
+UPDATE equipamento SET pot_kcalmin = pot_kcalmin(pot_unitaria, unidade_medida)
+WHERE pot_kcalmin IS NULL AND pot_kcalmin(pot_unitaria, unidade_medida) IS NOT NULL;
+DO $$
+BEGIN
+   IF NOT EXISTS (
+      SELECT 1 FROM pg_attribute
+      WHERE attrelid = 'equipamento'::regclass AND attname = 'pot_kcalmin' AND attnotnull
+   ) AND NOT EXISTS (SELECT 1 FROM equipamento WHERE pot_kcalmin IS NULL) THEN
+      ALTER TABLE equipamento ALTER COLUMN pot_kcalmin SET NOT NULL;
+   END IF;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_equipamento_pot_kcalmin ON equipamento;
+CREATE TRIGGER trg_equipamento_pot_kcalmin
+BEFORE INSERT OR UPDATE OF pot_unitaria, unidade_medida, pot_kcalmin ON equipamento
+FOR EACH ROW EXECUTE FUNCTION equipamento_pot_kcalmin();
+
 CREATE TABLE IF NOT EXISTS equipamento_projeto(
    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
    projeto_id INTEGER NOT NULL,
@@ -74,6 +137,8 @@ CREATE TABLE IF NOT EXISTS tubo(
    material_id INTEGER NOT NULL,
    diametro_nominal VARCHAR(10) NOT NULL,
    diametro_interno REAL NOT NULL CHECK (diametro_interno > 0),
+   diametro_mm REAL CHECK (diametro_mm > 0),
+   diametro_pol REAL CHECK (diametro_pol > 0),
    CONSTRAINT fk_tubo_material
       FOREIGN KEY (material_id) REFERENCES material(id)
       ON DELETE CASCADE ON UPDATE CASCADE,
@@ -87,24 +152,77 @@ CREATE TABLE IF NOT EXISTS peca(
    diametro VARCHAR(10) NOT NULL,
    nome VARCHAR(50) NOT NULL,
    leqv REAL NOT NULL CHECK (leqv >= 0),
+   diametro_mm REAL CHECK (diametro_mm > 0),
+   diametro_pol REAL CHECK (diametro_pol > 0),
    CONSTRAINT fk_peca_material
       FOREIGN KEY (material_id) REFERENCES material(id)
       ON DELETE CASCADE ON UPDATE CASCADE,
    CONSTRAINT uq_peca UNIQUE (material_id, categoria, diametro, nome)
 );
 
+-- Pontos da instalacao com coordenadas em metros (z = cota); posicao = (x, y) em planta
+CREATE TABLE IF NOT EXISTS ponto(
+   id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+   projeto_id INTEGER NOT NULL,
+   nome VARCHAR(50) NOT NULL, -- mesmo identificador das pontas do trecho (A em A-B)
+   tipo VARCHAR(20) NOT NULL DEFAULT 'derivacao'
+      CHECK (tipo IN ('central', 'prumada', 'derivacao', 'consumo')),
+   x DOUBLE PRECISION NOT NULL,
+   y DOUBLE PRECISION NOT NULL,
+   z DOUBLE PRECISION NOT NULL DEFAULT 0,
+   posicao POINT GENERATED ALWAYS AS (point(x, y)) STORED,
+   CONSTRAINT uq_ponto UNIQUE (projeto_id, nome),
+   CONSTRAINT fk_ponto_projeto
+      FOREIGN KEY (projeto_id) REFERENCES projeto(id)
+      ON DELETE CASCADE ON UPDATE CASCADE
+);
+
 CREATE TABLE IF NOT EXISTS trecho(
    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
    projeto_id INTEGER NOT NULL,
    rede VARCHAR(10) NOT NULL CHECK (rede IN ('primaria','secundaria')),
+   nome VARCHAR(50) NOT NULL, -- identificacao do trecho no levantamento (ex.: A-B)
+   tubo_id INTEGER,
    lreal REAL NOT NULL CHECK (lreal > 0),
    delta_h REAL NOT NULL DEFAULT 0,
-   CONSTRAINT uq_trecho UNIQUE (projeto_id, rede),
+   ponto_inicio_id INTEGER,
+   ponto_fim_id INTEGER,
+   CONSTRAINT uq_trecho UNIQUE (projeto_id, rede, nome),
    CONSTRAINT fk_trecho_projeto
       FOREIGN KEY (projeto_id) REFERENCES projeto(id)
-      ON DELETE CASCADE ON UPDATE CASCADE
+      ON DELETE CASCADE ON UPDATE CASCADE,
+   CONSTRAINT fk_trecho_tubo
+      FOREIGN KEY (tubo_id) REFERENCES tubo(id)
+      ON DELETE RESTRICT ON UPDATE CASCADE,
+   CONSTRAINT fk_trecho_ponto_inicio
+      FOREIGN KEY (ponto_inicio_id) REFERENCES ponto(id)
+      ON DELETE SET NULL ON UPDATE CASCADE,
+   CONSTRAINT fk_trecho_ponto_fim
+      FOREIGN KEY (ponto_fim_id) REFERENCES ponto(id)
+      ON DELETE SET NULL ON UPDATE CASCADE
 );
 
+-- Bancos criados antes da importacao de levantamentos (importar_dados.py): o
+-- trecho nao tinha nome nem tubo e uq_trecho era (projeto_id, rede)
+ALTER TABLE trecho ADD COLUMN IF NOT EXISTS nome VARCHAR(50);
+UPDATE trecho SET nome = 'trecho ' || id WHERE nome IS NULL;
+ALTER TABLE trecho ALTER COLUMN nome SET NOT NULL;
+ALTER TABLE trecho ADD COLUMN IF NOT EXISTS tubo_id INTEGER
+   CONSTRAINT fk_trecho_tubo REFERENCES tubo(id) ON DELETE RESTRICT ON UPDATE CASCADE;
+DO $$
+BEGIN
+   -- Troca a chave antiga sem reconstruir a atual a cada execucao
+   IF NOT EXISTS (
+      SELECT 1 FROM pg_constraint
+      WHERE conrelid = 'trecho'::regclass AND conname = 'uq_trecho'
+         AND pg_get_constraintdef(oid) = 'UNIQUE (projeto_id, rede, nome)'
+   ) THEN
+      ALTER TABLE trecho DROP CONSTRAINT IF EXISTS uq_trecho;
+      ALTER TABLE trecho ADD CONSTRAINT uq_trecho UNIQUE (projeto_id, rede, nome);
+   END IF;
+END;
+$$;
+
 CREATE TABLE IF NOT EXISTS trecho_peca(
    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
    trecho_id INTEGER NOT NULL,
@@ -118,8 +236,36 @@ CREATE TABLE IF NOT EXISTS trecho_peca(
       ON DELETE RESTRICT ON UPDATE CASCADE
 );
 
-CREATE TABLE IF NOT EXISTS calculo(
+-- O comprimento equivalente e somado no cliente (functions/rede.py), que ja
+-- traz as pecas de cada trecho para o calculo; a view antiga sai
+DROP VIEW IF EXISTS trecho_leq;
+
+CREATE TABLE IF NOT EXISTS execucao_calculo(
    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+   projeto_id INTEGER NOT NULL,
+   parametros JSONB NOT NULL DEFAULT '{}',
+   versao_motor VARCHAR(20) NOT NULL,
+   executado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+   CONSTRAINT uq_execucao_calculo UNIQUE (id, executado_em),
+   CONSTRAINT fk_execucao_calculo_projeto
+      FOREIGN KEY (projeto_id) REFERENCES projeto(id)
+      ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- Bancos anteriores ao historico de execucoes: calculo era uma tabela comum,
+-- sem execucao. Ela sai do caminho aqui e seus resultados sao migrados abaixo
+DO $$
+BEGIN
+   IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('calculo') AND relkind = 'r') THEN
+      ALTER TABLE calculo RENAME TO calculo_legado;
+   END IF;
+END;
+$$;
+
+-- Resultados por trecho, particionados por mes da execucao (calculo_AAAAMM)
+CREATE TABLE IF NOT EXISTS calculo(
+   execucao_id INTEGER NOT NULL,
+   executado_em TIMESTAMP NOT NULL,
    trecho_id INTEGER NOT NULL,
    ltotal REAL NOT NULL CHECK (ltotal >= 0),
    potencia REAL NOT NULL CHECK (potencia >= 0),
@@ -129,17 +275,65 @@ CREATE TABLE IF NOT EXISTS calculo(
    pressao_final REAL NOT NULL,
    ok BOOLEAN NOT NULL,
    observacao TEXT,
+   CONSTRAINT pk_calculo PRIMARY KEY (execucao_id, executado_em, trecho_id),
+   CONSTRAINT fk_calculo_execucao
+      FOREIGN KEY (execucao_id, executado_em) REFERENCES execucao_calculo(id, executado_em)
+      ON DELETE CASCADE ON UPDATE CASCADE,
    CONSTRAINT fk_calculo_trecho_trecho
       FOREIGN KEY (trecho_id) REFERENCES trecho(id)
       ON DELETE CASCADE ON UPDATE CASCADE
+) PARTITION BY RANGE (executado_em);
+
+CREATE TABLE IF NOT EXISTS calculo_padrao PARTITION OF calculo DEFAULT;
+
+-- Migracao da tabela comum: uma execucao 'legado' por projeto com o ultimo
+-- resultado de cada trecho (a tabela antiga nao tinha data nem execucao)
+DO $$
+BEGIN
+   IF to_regclass('calculo_legado') IS NOT NULL THEN
+      WITH execucoes AS (
+         INSERT INTO execucao_calculo (projeto_id, parametros, versao_motor)
+         SELECT DISTINCT t.projeto_id, '{"migrado": true}'::jsonb, 'legado'
+         FROM calculo_legado c
+         JOIN trecho t ON t.id = c.trecho_id
+         RETURNING id, projeto_id, executado_em
+      )
+      INSERT INTO calculo (execucao_id, executado_em, trecho_id, ltotal, potencia, velocidade,
+                           perda_carga, pressao_inicial, pressao_final, ok, observacao)
+      SELECT e.id, e.executado_em, c.trecho_id, c.ltotal, c.potencia, c.velocidade,
+         c.perda_carga, c.pressao_inicial, c.pressao_final, c.ok, c.observacao
+      FROM (
+         SELECT DISTINCT ON (trecho_id) *
+         FROM calculo_legado
+         ORDER BY trecho_id, id DESC
+      ) c
+      JOIN trecho t ON t.id = c.trecho_id
+      JOIN execucoes e ON e.projeto_id = t.projeto_id;
+      DROP TABLE calculo_legado;
+   END IF;
+END;
+$$;
+
+-- Resultados memorizados pela impressao digital das entradas (functions/cache_calculo.py)
+CREATE TABLE IF NOT EXISTS cache_calculo(
+   chave CHAR(64) PRIMARY KEY,
+   tipo VARCHAR(20) NOT NULL CHECK (tipo IN ('trecho', 'central')),
+   versao_motor VARCHAR(20) NOT NULL,
+   versao_catalogo VARCHAR(64) NOT NULL,
+   resultado JSONB NOT NULL,
+   criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
 CREATE TABLE IF NOT EXISTS criterio_projeto(
    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
    projeto_id INTEGER NOT NULL,
    pressao_operacao REAL NOT NULL CHECK (pressao_operacao >= 0),
-   vel_maxima REAL NOT NULL DEFAULT 20,   
-   vel_recomendada REAL NOT NULL DEFAULT 15,   
+   perda_carga_maxima REAL NOT NULL DEFAULT 45 CHECK (perda_carga_maxima >= 0),
+   perda_carga_minima REAL NOT NULL DEFAULT 0 CHECK (perda_carga_minima >= 0),
+   vel_maxima REAL NOT NULL DEFAULT 20,
+   vel_minima REAL NOT NULL DEFAULT 0,
+   vel_max_recomendada REAL NOT NULL DEFAULT 15,
+   vel_min_recomendada REAL NOT NULL DEFAULT 5,
    densidade_relativa REAL NOT NULL CHECK (densidade_relativa >= 0),
    temperatura_projeto REAL NOT NULL CHECK (temperatura_projeto >= 0),
    observacao TEXT,
@@ -149,6 +343,30 @@ CREATE TABLE IF NOT EXISTS criterio_projeto(
       ON DELETE CASCADE ON UPDATE CASCADE
 );
 
+-- Bancos criados antes dos criterios completos: vel_recomendada vira
+-- vel_max_recomendada e as demais colunas entram com o valor padrao
+DO $$
+BEGIN
+   IF EXISTS (
+      SELECT 1 FROM information_schema.columns
+      WHERE table_schema = current_schema() AND table_name = 'criterio_projeto'
+         AND column_name = 'vel_recomendada'
+   ) AND NOT EXISTS (
+      SELECT 1 FROM information_schema.columns
+      WHERE table_schema = current_schema() AND table_name = 'criterio_projeto'
+         AND column_name = 'vel_max_recomendada'
+   ) THEN
+      ALTER TABLE criterio_projeto RENAME COLUMN vel_recomendada TO vel_max_recomendada;
+   END IF;
+END;
+$$;
+ALTER TABLE criterio_projeto
+   ADD COLUMN IF NOT EXISTS perda_carga_maxima REAL NOT NULL DEFAULT 45 CHECK (perda_carga_maxima >= 0),
+   ADD COLUMN IF NOT EXISTS perda_carga_minima REAL NOT NULL DEFAULT 0 CHECK (perda_carga_minima >= 0),
+   ADD COLUMN IF NOT EXISTS vel_minima REAL NOT NULL DEFAULT 0,
+   ADD COLUMN IF NOT EXISTS vel_max_recomendada REAL NOT NULL DEFAULT 15,
+   ADD COLUMN IF NOT EXISTS vel_min_recomendada REAL NOT NULL DEFAULT 5;
+
 CREATE TABLE IF NOT EXISTS central_glp(
    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
    projeto_id INTEGER NOT NULL,
@@ -188,25 +406,251 @@ CREATE TABLE IF NOT EXISTS valores_entrada(
       ON DELETE CASCADE ON UPDATE CASCADE
 );
 
+-- Catalogo de reguladores (json/reguladores.json): faixas de vazao em kg/h e de
+-- pressao de entrada e saida em kPa; varios modelos por estagio
 CREATE TABLE IF NOT EXISTS regulador(
    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
-   projeto_id INTEGER NOT NULL,
    estagio VARCHAR(50) NOT NULL CHECK (estagio IN ('primeiro', 'segundo')),
-   modelo VARCHAR(50),
-   fabricante VARCHAR(50),
+   modelo VARCHAR(50) NOT NULL,
+   fabricante VARCHAR(50) NOT NULL DEFAULT '',
    descricao TEXT,
-   CONSTRAINT uq_regulador UNIQUE (estagio)
+   vazao_min REAL NOT NULL DEFAULT 0 CHECK (vazao_min >= 0),
+   vazao_max REAL NOT NULL CHECK (vazao_max > 0),
+   entrada_min REAL NOT NULL CHECK (entrada_min >= 0),
+   entrada_max REAL NOT NULL,
+   saida_min REAL NOT NULL CHECK (saida_min >= 0),
+   saida_max REAL NOT NULL,
+   CONSTRAINT ck_regulador_faixas
+      CHECK (vazao_min <= vazao_max AND entrada_min <= entrada_max AND saida_min <= saida_max),
+   CONSTRAINT uq_regulador UNIQUE (estagio, fabricante, modelo)
 );
 
 CREATE TABLE IF NOT EXISTS regulador_projeto(
    id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
    projeto_id INTEGER NOT NULL,
    regulador_id INTEGER NOT NULL,
+   trecho_id INTEGER,
+   localizacao VARCHAR(100) NOT NULL DEFAULT '',
+   quantidade INTEGER NOT NULL DEFAULT 1 CHECK (quantidade > 0),
+   vazao REAL CHECK (vazao >= 0), -- kg/h atendida
+   automatico BOOLEAN NOT NULL DEFAULT FALSE, -- escolhido por reguladores.py
    CONSTRAINT fk_regproj_projeto
       FOREIGN KEY (projeto_id) REFERENCES projeto(id)
       ON DELETE CASCADE ON UPDATE CASCADE,
    CONSTRAINT fk_regproj_regulador
       FOREIGN KEY (regulador_id) REFERENCES regulador(id)
       ON DELETE RESTRICT ON UPDATE CASCADE,
-   CONSTRAINT uq_regproj UNIQUE (projeto_id, regulador_id)
-);
\ No newline at end of file
+   CONSTRAINT fk_regproj_trecho
+      FOREIGN KEY (trecho_id) REFERENCES trecho(id)
+      ON DELETE SET NULL ON UPDATE CASCADE,
+   CONSTRAINT uq_regproj UNIQUE (projeto_id, regulador_id, localizacao)
+);
+
+-- Fila de recalculo (functions/fila_calculo.py): trabalhadores em varias maquinas
+-- reservam tarefas com FOR UPDATE SKIP LOCKED. TIMESTAMPTZ porque os horarios sao
+-- comparados entre sessoes de maquinas com fusos diferentes
+CREATE TABLE IF NOT EXISTS tarefa_calculo(
+   id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+   projeto_id INTEGER NOT NULL,
+   tipo VARCHAR(30) NOT NULL DEFAULT 'dimensionar' CHECK (tipo IN ('dimensionar', 'reguladores')),
+   parametros JSONB NOT NULL DEFAULT '{}',
+   lote VARCHAR(100) NOT NULL DEFAULT '',
+   estado VARCHAR(20) NOT NULL DEFAULT 'pendente'
+      CHECK (estado IN ('pendente', 'executando', 'concluida', 'falhou')),
+   tentativas INTEGER NOT NULL DEFAULT 0 CHECK (tentativas >= 0),
+   max_tentativas INTEGER NOT NULL DEFAULT 3 CHECK (max_tentativas > 0),
+   disponivel_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+   trabalhador VARCHAR(100),
+   heartbeat_em TIMESTAMPTZ,
+   iniciado_em TIMESTAMPTZ,
+   concluido_em TIMESTAMPTZ,
+   execucao_id INTEGER,
+   erro TEXT,
+   criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+   CONSTRAINT fk_tarefa_calculo_projeto
+      FOREIGN KEY (projeto_id) REFERENCES projeto(id)
+      ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- No maximo uma tarefa ativa por projeto e tipo: enfileirar usa o ON CONFLICT
+-- deste indice para ignorar repetidas, entao ele nao fica em indices.sql
+CREATE UNIQUE INDEX IF NOT EXISTS uq_tarefa_ativa
+ON tarefa_calculo (projeto_id, tipo) WHERE estado IN ('pendente', 'executando');
+
+-- Vazao de cada trabalhador (acumulada pelo proprio trabalhador a cada lote)
+CREATE TABLE IF NOT EXISTS trabalhador_calculo(
+   nome VARCHAR(100) PRIMARY KEY,
+   host VARCHAR(100) NOT NULL,
+   pid INTEGER NOT NULL,
+   iniciado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+   heartbeat_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+   encerrado_em TIMESTAMPTZ,
+   tarefas_ok INTEGER NOT NULL DEFAULT 0,
+   tarefas_falha INTEGER NOT NULL DEFAULT 0,
+   trechos BIGINT NOT NULL DEFAULT 0,
+   segundos_ocupado DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+-- projeto.updated_at acompanha qualquer alteracao do projeto e das tabelas
+-- ligadas a ele; usado na sincronizacao incremental do espelho local
+CREATE OR REPLACE FUNCTION projeto_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+   NEW.updated_at := now();
+   RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_projeto_updated_at ON projeto;
+CREATE TRIGGER trg_projeto_updated_at
+BEFORE UPDATE ON projeto
+FOR EACH ROW EXECUTE FUNCTION projeto_updated_at();
+
+-- Gatilho por comando (FOR EACH STATEMENT) com as linhas do comando em tabelas
+-- de transicao: importacoes por COPY, a clonagem e a gravacao de resultados
+-- tocam cada projeto uma vez, e nao uma vez por linha
+CREATE OR REPLACE FUNCTION tocar_projeto()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SET search_path FROM CURRENT
+AS $$
+BEGIN
+   IF TG_TABLE_NAME = 'trecho_peca' THEN
+      IF TG_OP = 'INSERT' THEN
+         UPDATE projeto p SET updated_at = now()
+         FROM (SELECT DISTINCT t.projeto_id FROM novas n JOIN trecho t ON t.id = n.trecho_id) a
+         WHERE p.id = a.projeto_id AND p.updated_at <> now();
+      ELSIF TG_OP = 'UPDATE' THEN
+         UPDATE projeto p SET updated_at = now()
+         FROM (
+            SELECT t.projeto_id FROM novas n JOIN trecho t ON t.id = n.trecho_id
+            UNION
+            SELECT t.projeto_id FROM antigas o JOIN trecho t ON t.id = o.trecho_id
+         ) a
+         WHERE p.id = a.projeto_id AND p.updated_at <> now();
+      ELSE
+         UPDATE projeto p SET updated_at = now()
+         FROM (SELECT DISTINCT t.projeto_id FROM antigas o JOIN trecho t ON t.id = o.trecho_id) a
+         WHERE p.id = a.projeto_id AND p.updated_at <> now();
+      END IF;
+   ELSIF TG_OP = 'INSERT' THEN
+      UPDATE projeto p SET updated_at = now()
+      FROM (SELECT DISTINCT projeto_id FROM novas) a
+      WHERE p.id = a.projeto_id AND p.updated_at <> now();
+   ELSIF TG_OP = 'UPDATE' THEN
+      UPDATE projeto p SET updated_at = now()
+      FROM (SELECT projeto_id FROM novas UNION SELECT projeto_id FROM antigas) a
+      WHERE p.id = a.projeto_id AND p.updated_at <> now();
+   ELSE
+      -- Em cascata da exclusao do projeto a linha de projeto ja nao existe
+      UPDATE projeto p SET updated_at = now()
+      FROM (SELECT DISTINCT projeto_id FROM antigas) a
+      WHERE p.id = a.projeto_id AND p.updated_at <> now();
+   END IF;
+   RETURN NULL;
+END;
+$$;
+
+-- Tabelas de transicao exigem um gatilho por evento
+DO $$
+DECLARE
+   tabela TEXT;
+BEGIN
+   FOREACH tabela IN ARRAY ARRAY[
+      'criterio_projeto', 'equipamento_projeto', 'cilindro_projeto', 'central_glp', 'trecho',
+      'ponto', 'trecho_peca', 'regulador_projeto', 'execucao_calculo'
+   ] LOOP
+      EXECUTE format('DROP TRIGGER IF EXISTS trg_tocar_projeto ON %I', tabela);
+      EXECUTE format('DROP TRIGGER IF EXISTS trg_tocar_projeto_ins ON %I', tabela);
+      EXECUTE format('DROP TRIGGER IF EXISTS trg_tocar_projeto_upd ON %I', tabela);
+      EXECUTE format('DROP TRIGGER IF EXISTS trg_tocar_projeto_del ON %I', tabela);
+      EXECUTE format(
+         'CREATE TRIGGER trg_tocar_projeto_ins AFTER INSERT ON %I '
+         'REFERENCING NEW TABLE AS novas FOR EACH STATEMENT EXECUTE FUNCTION tocar_projeto()', tabela);
+      EXECUTE format(
+         'CREATE TRIGGER trg_tocar_projeto_upd AFTER UPDATE ON %I '
+         'REFERENCING NEW TABLE AS novas OLD TABLE AS antigas FOR EACH STATEMENT EXECUTE FUNCTION tocar_projeto()',
+         tabela);
+      EXECUTE format(
+         'CREATE TRIGGER trg_tocar_projeto_del AFTER DELETE ON %I '
+         'REFERENCING OLD TABLE AS antigas FOR EACH STATEMENT EXECUTE FUNCTION tocar_projeto()', tabela);
+   END LOOP;
+END;
+$$;
+
+-- Diametro nominal numerico (preenchido por popular_banco.py a partir do texto);
+-- bancos criados antes das colunas recebem-nas aqui
+ALTER TABLE tubo ADD COLUMN IF NOT EXISTS diametro_mm REAL CHECK (diametro_mm > 0);
+ALTER TABLE tubo ADD COLUMN IF NOT EXISTS diametro_pol REAL CHECK (diametro_pol > 0);
+ALTER TABLE peca ADD COLUMN IF NOT EXISTS diametro_mm REAL CHECK (diametro_mm > 0);
+ALTER TABLE peca ADD COLUMN IF NOT EXISTS diametro_pol REAL CHECK (diametro_pol > 0);
+
+-- Pontas do trecho (comprimento e desnivel calculados pelas coordenadas, pontos.py)
+ALTER TABLE trecho ADD COLUMN IF NOT EXISTS ponto_inicio_id INTEGER
+   CONSTRAINT fk_trecho_ponto_inicio REFERENCES ponto(id) ON DELETE SET NULL ON UPDATE CASCADE;
+ALTER TABLE trecho ADD COLUMN IF NOT EXISTS ponto_fim_id INTEGER
+   CONSTRAINT fk_trecho_ponto_fim REFERENCES ponto(id) ON DELETE SET NULL ON UPDATE CASCADE;
+
+-- Catalogo de reguladores com faixas de vazao e pressao (reguladores.py). O catalogo
+-- antigo tinha um unico modelo por estagio e um projeto_id sem uso. As chaves
+-- so sao trocadas quando ainda tem a definicao antiga: reaplicar o script
+-- (inquilinos.py migrar) nao reconstroi indices sob ACCESS EXCLUSIVE
+ALTER TABLE regulador DROP COLUMN IF EXISTS projeto_id;
+ALTER TABLE regulador ADD COLUMN IF NOT EXISTS vazao_min REAL NOT NULL DEFAULT 0 CHECK (vazao_min >= 0);
+ALTER TABLE regulador ADD COLUMN IF NOT EXISTS vazao_max REAL NOT NULL DEFAULT 0;
+ALTER TABLE regulador ADD COLUMN IF NOT EXISTS entrada_min REAL NOT NULL DEFAULT 0 CHECK (entrada_min >= 0);
+ALTER TABLE regulador ADD COLUMN IF NOT EXISTS entrada_max REAL NOT NULL DEFAULT 0;
+ALTER TABLE regulador ADD COLUMN IF NOT EXISTS saida_min REAL NOT NULL DEFAULT 0 CHECK (saida_min >= 0);
+ALTER TABLE regulador ADD COLUMN IF NOT EXISTS saida_max REAL NOT NULL DEFAULT 0;
+DO $$
+BEGIN
+   IF EXISTS (
+      SELECT 1 FROM pg_constraint
+      WHERE conrelid = 'regulador'::regclass AND conname = 'uq_regulador'
+         AND pg_get_constraintdef(oid) = 'UNIQUE (estagio)'
+   ) THEN
+      ALTER TABLE regulador DROP CONSTRAINT uq_regulador;
+      UPDATE regulador SET fabricante = '' WHERE fabricante IS NULL;
+      UPDATE regulador SET modelo = 'regulador ' || id WHERE modelo IS NULL;
+      ALTER TABLE regulador ALTER COLUMN fabricante SET DEFAULT '';
+      ALTER TABLE regulador ALTER COLUMN fabricante SET NOT NULL;
+      ALTER TABLE regulador ALTER COLUMN modelo SET NOT NULL;
+   END IF;
+   IF NOT EXISTS (
+      SELECT 1 FROM pg_constraint WHERE conrelid = 'regulador'::regclass AND conname = 'uq_regulador'
+   ) THEN
+      ALTER TABLE regulador ADD CONSTRAINT uq_regulador UNIQUE (estagio, fabricante, modelo);
+   END IF;
+   IF NOT EXISTS (
+      SELECT 1 FROM pg_constraint WHERE conrelid = 'regulador'::regclass AND conname = 'ck_regulador_faixas'
+   ) THEN
+      ALTER TABLE regulador ADD CONSTRAINT ck_regulador_faixas
+         CHECK (vazao_min <= vazao_max AND entrada_min <= entrada_max AND saida_min <= saida_max);
+   END IF;
+END;
+$$;
+
+ALTER TABLE regulador_projeto ADD COLUMN IF NOT EXISTS trecho_id INTEGER
+   CONSTRAINT fk_regproj_trecho REFERENCES trecho(id) ON DELETE SET NULL ON UPDATE CASCADE;
+ALTER TABLE regulador_projeto ADD COLUMN IF NOT EXISTS localizacao VARCHAR(100) NOT NULL DEFAULT '';
+ALTER TABLE regulador_projeto ADD COLUMN IF NOT EXISTS quantidade INTEGER NOT NULL DEFAULT 1 CHECK (quantidade > 0);
+ALTER TABLE regulador_projeto ADD COLUMN IF NOT EXISTS vazao REAL CHECK (vazao >= 0);
+ALTER TABLE regulador_projeto ADD COLUMN IF NOT EXISTS automatico BOOLEAN NOT NULL DEFAULT FALSE;
+DO $$
+BEGIN
+   IF EXISTS (
+      SELECT 1 FROM pg_constraint
+      WHERE conrelid = 'regulador_projeto'::regclass AND conname = 'uq_regproj'
+         AND pg_get_constraintdef(oid) = 'UNIQUE (projeto_id, regulador_id)'
+   ) THEN
+      ALTER TABLE regulador_projeto DROP CONSTRAINT uq_regproj;
+   END IF;
+   IF NOT EXISTS (
+      SELECT 1 FROM pg_constraint WHERE conrelid = 'regulador_projeto'::regclass AND conname = 'uq_regproj'
+   ) THEN
+      ALTER TABLE regulador_projeto ADD CONSTRAINT uq_regproj UNIQUE (projeto_id, regulador_id, localizacao);
+   END IF;
+END;
+$$;
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from calculos import calcular_trecho, dimensionar_central, perda_altura
+from cenarios import TEMPERATURA_REFERENCIA, faixa, varrer_cenarios
+
+# Um cenario da varredura deve dar o mesmo resultado do calculo trecho a trecho
+
+POTENCIA = 2000.0 # kcal/min
+DIAMETRO = 26.6 # mm
+COMPRIMENTO = 30.0 # m
+DESNIVEL = 3.0 # m
+PRESSAO = 150.0 # kPa
+DENSIDADE = 1.8
+
+def _cenario(temperatura, **kwargs):
+   projetos = {1: (POTENCIA, (np.array([DIAMETRO]), np.array([COMPRIMENTO]), np.array([DESNIVEL])))}
+   return varrer_cenarios(projetos, [("P-45", 1.0)], [24.0], [DENSIDADE], [temperatura], [PRESSAO], **kwargs)
+
+def test_cenario_unico_igual_ao_calculo_por_trecho():
+   central = dimensionar_central(POTENCIA, 1.0)
+   trecho = calcular_trecho(
+      central["pot_adotada"] * 60, DIAMETRO, COMPRIMENTO, DESNIVEL, [], PRESSAO, DENSIDADE, 20, 10
+   )
+   cenario = _cenario(TEMPERATURA_REFERENCIA)
+
+   assert cenario["vazao_kg"][0] == pytest.approx(central["vazao_kg"])
+   assert cenario["num_cilindros"][0] == central["num_cilindros"]
+   assert cenario["velocidade_max"][0] == pytest.approx(trecho["velocidade"])
+   assert cenario["perda_max_trecho"][0] == pytest.approx(trecho["perda_carga"] + perda_altura(DESNIVEL, DENSIDADE))
+   assert cenario["velocidade_max"][0] == pytest.approx(0.616, abs=1e-3)
+   assert cenario["perda_max_trecho"][0] == pytest.approx(0.0824, abs=1e-4)
+
+def test_temperatura_afeta_velocidade_e_perda():
+   referencia = _cenario(TEMPERATURA_REFERENCIA)
+   quente = _cenario(40.0)
+   assert quente["velocidade_max"][0] > referencia["velocidade_max"][0]
+   assert quente["perda_max_trecho"][0] > referencia["perda_max_trecho"][0]
+
+@pytest.mark.parametrize("perda_maxima", [10.0, 0.05])
+def test_aprovacao_igual_ao_calculo_por_trecho(perda_maxima):
+   central = dimensionar_central(POTENCIA, 1.0)
+   trecho = calcular_trecho(
+      central["pot_adotada"] * 60, DIAMETRO, COMPRIMENTO, DESNIVEL, [], PRESSAO, DENSIDADE, 20, perda_maxima
+   )
+   cenario = _cenario(TEMPERATURA_REFERENCIA, perda_maxima=perda_maxima)
+   assert bool(cenario["ok"][0]) == trecho["ok"]
+
+def test_faixa_degenerada_e_passo_zero():
+   assert faixa(24.0).tolist() == [24.0]
+   assert faixa(24.0, 24.0).tolist() == [24.0]
+   assert faixa(1.5, 2.0, 0.25).tolist() == [1.5, 1.75, 2.0]
+   with pytest.raises(ValueError):
+      faixa(1.0, 2.0, 0)